@@ -7,9 +7,12 @@ fi
 
 CONF_DIR=/etc/sentry
 LOG_DIR=/var/log/sentry
+OUTBOX_DIR=/var/lib/sentry/outbox
 
 mkdir -p $LOG_DIR
 chown nova:nova $LOG_DIR
+mkdir -p $OUTBOX_DIR
+chown nova:nova $OUTBOX_DIR -R
 mkdir -p $CONF_DIR
 cp etc/sentry/* $CONF_DIR -vr
 chown nova:nova $CONF_DIR -R
@@ -5,16 +5,51 @@
 #
 
 import copy
+import hashlib
 import json
 
+from eventlet import greenpool
 import webob
 
+from sentry.common import cache
 from sentry.file_cache import setting_list
 from sentry.openstack import client
+from sentry.openstack.common import cfg
 from sentry.openstack.common import log as logging
 
 
 LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+base_opts = [
+    cfg.IntOpt('image_metadata_cache_size',
+               default=1000,
+               help='Max number of images whose hypervisor type is cached, '
+                    '0 to disable the cache'),
+    cfg.IntOpt('image_metadata_cache_ttl',
+               default=600,
+               help='Seconds a cached hypervisor type of image stays valid'),
+    cfg.IntOpt('image_fetch_concurrency',
+               default=10,
+               help='Max number of image requests sent to nova at the '
+                    'same time when listing instances of a virt type'),
+    cfg.IntOpt('api_response_cache_size',
+               default=1000,
+               help='Max number of instance, host and AZ lists cached'),
+    cfg.IntOpt('api_response_cache_ttl',
+               default=10,
+               help='Seconds a cached instance, host or AZ list stays '
+                    'valid, 0 to disable the cache'),
+    cfg.IntOpt('api_instance_page_size',
+               default=1000,
+               help='Max Limit of an instance list page, and number of '
+                    'instances read from nova at a time when streaming'),
+]
+
+CONF.register_opts(base_opts)
+
+_IMAGE_CACHE = None
+_RESPONSE_CACHE = None
 
 
 def _encode_list_content(data_list, encoding='UTF-8'):
@@ -26,12 +61,37 @@ def _encode_list_content(data_list, encoding='UTF-8'):
             data[key] = value
 
 
+class SerializedList(str):
+    """JSON of a list in setting_list.json, with ETag of the content."""
+    etag = None
+
+
+_SERIALIZED_LISTS = {}
+
+
+def _serialize_setting_list(list_name):
+    """
+    Serialize a list once per snapshot of setting_list.json, the snapshot
+    is replaced only when the file changes.
+    """
+    settings = setting_list.get_setting_list()
+    cached = _SERIALIZED_LISTS.get(list_name)
+    if cached is not None and cached[0] is settings:
+        return cached[1]
+
+    data_list = copy.deepcopy(settings.get(list_name, []))
+    _encode_list_content(data_list)
+    body = SerializedList(json.dumps(data_list, ensure_ascii=False))
+    body.etag = hashlib.md5(body).hexdigest()
+    # NOTE(hzyangtk): keep the snapshot referenced, so that its identity
+    #                 is not reused by a later snapshot.
+    _SERIALIZED_LISTS[list_name] = (settings, body)
+    return body
+
+
 def get_product_metric_list(req):
     """Return product metric list of sentry and monitor"""
-    settings = setting_list.get_setting_list()
-    metric_list = copy.deepcopy(settings.get('product_metric_list', []))
-    _encode_list_content(metric_list)
-    return json.dumps(metric_list, ensure_ascii=False)
+    return _serialize_setting_list('product_metric_list')
 
 
 def get_platform_metric_list(req):
@@ -44,34 +104,22 @@ def get_platform_metric_list(req):
     else:
         raise webob.exc.HTTPBadRequest()
 
-    settings = setting_list.get_setting_list()
-    metric_list = copy.deepcopy(settings.get(list_name, []))
-    _encode_list_content(metric_list)
-    return json.dumps(metric_list, ensure_ascii=False)
+    return _serialize_setting_list(list_name)
 
 
 def get_product_alarm_event_list(req):
     """Return product alarm event list of sentry"""
-    settings = setting_list.get_setting_list()
-    alarm_event_list = copy.deepcopy(settings.get('product_alarm_event_list',
-                                                  []))
-    _encode_list_content(alarm_event_list)
-    return json.dumps(alarm_event_list, ensure_ascii=False)
+    return _serialize_setting_list('product_alarm_event_list')
 
 
 def get_platform_alarm_event_list(req):
     """Return platform alarm event list of sentry"""
-    settings = setting_list.get_setting_list()
-    alarm_event_list = copy.deepcopy(settings.get('platform_alarm_event_list',
-                                                  []))
-    _encode_list_content(alarm_event_list)
-    return json.dumps(alarm_event_list, ensure_ascii=False)
+    return _serialize_setting_list('platform_alarm_event_list')
 
 
-def _get_instance_list_for_certain_virt_type(req):
-    """Return the instance list for certain virt type, such as kvm or lxc"""
+def _check_instance_request(req):
+    """Return project id and token of an instance list request"""
     tenant_id = req.params.get('ProjectId', None)
-    virt_type = req.params.get('VirtType', None)
     if tenant_id is None:
         msg = _("project id invalid")
         raise webob.exc.HTTPBadRequest(explanation=msg)
@@ -79,43 +127,146 @@ def _get_instance_list_for_certain_virt_type(req):
     if token is None:
         msg = _("token is invalid")
         raise webob.exc.HTTPForbidden(explanation=msg)
+    return tenant_id, token
 
+
+def _list_servers(nova_client, tenant_id, limit=None, marker=None):
+    """Return a page of instances from nova, all of them without limit"""
     # NOTE(hzyangtk): call nova client to get isntance list
     method = 'GET'
     path = '/%s/servers/detail' % tenant_id
     params = {'tenant_id': tenant_id}
-    nova_client = client.NovaClient(token)
+    if limit is not None:
+        params['limit'] = limit
+    if marker is not None:
+        params['marker'] = marker
     result, headers = nova_client.send_request(
                             method, path, params, headers={})
+    return result.get('servers')
 
-    instances = result.get('servers')
+
+def _get_instance_list_for_certain_virt_type(req):
+    """Return the instance list for certain virt type, such as kvm or lxc"""
+    tenant_id, token = _check_instance_request(req)
+    virt_type = req.params.get('VirtType', None)
+    nova_client = client.NovaClient(token)
+    instances = _list_servers(nova_client, tenant_id)
+    return _filter_virt_type(nova_client, tenant_id, instances, virt_type)
+
+
+def _filter_virt_type(nova_client, tenant_id, instances, virt_type):
     if virt_type is None or not instances:
         return instances
 
+    image_ids = [instance.get('image').get('id') for instance in instances]
+    hypervisor_types = _get_hypervisor_types(
+                nova_client, tenant_id,
+                [image_id for image_id in image_ids if image_id])
+
     res_instances = []
-    for instance in instances:
-        image_id = instance.get('image').get('id')
+    for instance, image_id in zip(instances, image_ids):
         if not image_id:
             LOG.warning(_("instance %s image is None") % instance.get('id'))
-        else:
-            path = '/%s/images/%s' % (tenant_id, image_id)
-            result, headers = nova_client.send_request(method, path,
-                                                       params, headers={})
-            try:
-                image_type = result['image']['metadata']['hypervisor_type']
-                if image_type == virt_type:
-                    res_instances.append(instance)
-            except (KeyError, TypeError):
-                LOG.warning(_("image %s have no hypervisor_type metadata")
-                            % image_id)
+        elif hypervisor_types[image_id] == virt_type:
+            res_instances.append(instance)
 
     return res_instances
 
 
+def _get_image_cache():
+    global _IMAGE_CACHE
+    if _IMAGE_CACHE is None:
+        _IMAGE_CACHE = cache.LRUCache(CONF.image_metadata_cache_size,
+                                      CONF.image_metadata_cache_ttl)
+    return _IMAGE_CACHE
+
+
+def reset_image_cache():
+    global _IMAGE_CACHE
+    _IMAGE_CACHE = None
+
+
+def _get_hypervisor_types(nova_client, tenant_id, image_ids):
+    """
+    Return dict of image id to hypervisor type, '' for images without
+    it. Images are shared by tenants, so hypervisor types are cached
+    across requests, and each missed image is fetched once concurrently.
+    """
+    image_cache = _get_image_cache()
+    hypervisor_types = {}
+    misses = []
+    for image_id in set(image_ids):
+        hypervisor_type = image_cache.get(image_id)
+        if hypervisor_type is None:
+            misses.append(image_id)
+        else:
+            hypervisor_types[image_id] = hypervisor_type
+
+    def _fetch(image_id):
+        path = '/%s/images/%s' % (tenant_id, image_id)
+        params = {'tenant_id': tenant_id}
+        result, headers = nova_client.send_request('GET', path, params,
+                                                   headers={})
+        try:
+            return image_id, result['image']['metadata']['hypervisor_type']
+        except (KeyError, TypeError):
+            LOG.warning(_("image %s have no hypervisor_type metadata")
+                        % image_id)
+            return image_id, ''
+
+    pool = greenpool.GreenPool(max(CONF.image_fetch_concurrency, 1))
+    for image_id, hypervisor_type in pool.imap(_fetch, misses):
+        image_cache.set(image_id, hypervisor_type)
+        hypervisor_types[image_id] = hypervisor_type
+    return hypervisor_types
+
+
+def _get_response_cache():
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None:
+        size = CONF.api_response_cache_size
+        if CONF.api_response_cache_ttl <= 0:
+            size = 0
+        _RESPONSE_CACHE = cache.SingleFlightCache(
+                                size, CONF.api_response_cache_ttl)
+    return _RESPONSE_CACHE
+
+
+def reset_response_cache():
+    global _RESPONSE_CACHE
+    _RESPONSE_CACHE = None
+
+
+def get_response_cache_stats():
+    return _get_response_cache().get_stats()
+
+
 def get_product_instance_list(req):
-    """Return product instance list of sentry"""
-    res_instances = []
+    """
+    Return product instance list of sentry. With Limit, return a page
+    of at most Limit instances after Marker, and the marker of the next
+    page in X-Next-Marker header. With Stream=1, write all instances
+    while reading them from nova page by page.
+    """
+    if req.params.get('Stream') == '1':
+        return _stream_product_instance_list(req)
+    if 'Limit' in req.params:
+        return _get_product_instance_page(req)
+    # NOTE(hzyangtk): token is a part of the key, so that a list is
+    #                 never served to a request nova did not authorize.
+    key = ('instance', req.params.get('ProjectId', None),
+           req.params.get('VirtType', None),
+           req.headers.get('x-auth-token', None))
+    return _get_response_cache().get(key, _get_product_instance_list, req)
+
+
+def _get_product_instance_list(req):
     instances = _get_instance_list_for_certain_virt_type(req)
+    return json.dumps(_format_product_instances(instances))
+
+
+def _format_product_instances(instances):
+    res_instances = []
     if instances:
         for instance in instances:
             ip_addrs = instance.get('addresses')
@@ -134,7 +285,93 @@ def get_product_instance_list(req):
             screenName = "%(name)s:%(ip)s" % {'name': name, 'ip': ip_v4}
             res_instance = {"id": uuid, "screenName": screenName}
             res_instances.append(res_instance)
-    return json.dumps(res_instances)
+    return res_instances
+
+
+def _get_product_instance_page(req):
+    tenant_id, token = _check_instance_request(req)
+    try:
+        limit = int(req.params.get('Limit'))
+    except ValueError:
+        limit = 0
+    if limit <= 0 or limit > CONF.api_instance_page_size:
+        msg = _("Limit should be between 1 and %s") \
+                % CONF.api_instance_page_size
+        raise webob.exc.HTTPBadRequest(explanation=msg)
+    marker = req.params.get('Marker', None)
+    virt_type = req.params.get('VirtType', None)
+
+    key = ('instance_page', tenant_id, virt_type, token, limit, marker)
+    body, next_marker = _get_response_cache().get(
+                            key, _load_product_instance_page,
+                            tenant_id, token, virt_type, limit, marker)
+    response = webob.Response(body)
+    if next_marker is not None:
+        response.headers['X-Next-Marker'] = str(next_marker)
+    return response
+
+
+def _load_product_instance_page(tenant_id, token, virt_type, limit, marker):
+    nova_client = client.NovaClient(token)
+    servers = _list_servers(nova_client, tenant_id, limit, marker)
+    # NOTE(hzyangtk): the marker of next page is the last instance of
+    #                 nova page, some instances of it may be filtered.
+    #                 Nova may cap the page below limit (osapi_max_limit),
+    #                 so only an empty page ends the list.
+    next_marker = None
+    if servers:
+        next_marker = servers[-1].get('id')
+    instances = _filter_virt_type(nova_client, tenant_id, servers,
+                                  virt_type)
+    return json.dumps(_format_product_instances(instances)), next_marker
+
+
+def _stream_product_instance_list(req):
+    tenant_id, token = _check_instance_request(req)
+    virt_type = req.params.get('VirtType', None)
+    nova_client = client.NovaClient(token)
+    # NOTE(hzyangtk): read the first page before the status is sent, so
+    #                 that a nova error is still answered by an error.
+    servers = _list_servers(nova_client, tenant_id,
+                            CONF.api_instance_page_size)
+    instances = _filter_virt_type(nova_client, tenant_id, servers,
+                                  virt_type)
+    return webob.Response(app_iter=_iter_product_instances(
+                                nova_client, tenant_id, virt_type,
+                                servers, instances))
+
+
+def _iter_product_instances(nova_client, tenant_id, virt_type, servers,
+                            instances):
+    """
+    Yield the json array of instances piece by piece, starting with the
+    first page already read, one page of nova instances is kept in
+    memory at a time. Pages are read until nova returns an empty one,
+    since nova may return less than asked. A nova error after the first
+    page aborts the response without closing the array, so that the
+    client never takes a part of the list for all of it.
+    """
+    page_size = CONF.api_instance_page_size
+    separator = ''
+    yield '['
+    while True:
+        for res_instance in _format_product_instances(instances):
+            yield separator + json.dumps(res_instance)
+            separator = ', '
+        if not servers:
+            break
+        marker = servers[-1].get('id')
+        try:
+            servers = _list_servers(nova_client, tenant_id, page_size,
+                                    marker)
+            instances = _filter_virt_type(nova_client, tenant_id, servers,
+                                          virt_type)
+        except Exception:
+            LOG.exception(_("Failed to read instances of %(tenant_id)s "
+                            "after %(marker)s, abort streaming")
+                          % {'tenant_id': tenant_id, 'marker': marker})
+            raise
+    yield ']'
 
 
 def get_platform_instance_list(req):
@@ -152,11 +389,15 @@ def get_platform_instance_list(req):
 
     dimension_name = req.params.get('DimensionName')
     if dimension_name == 'host':
-        result = _get_platform_host_list(tenant_id, token)
+        result = _get_response_cache().get(('host', tenant_id, token),
+                                           _get_platform_host_list,
+                                           tenant_id, token)
     elif dimension_name == 'Platform':
         result.append('NVSPlatform')
     elif dimension_name == 'AZ':
-        result = _get_platform_AZ_list(tenant_id, token)
+        result = _get_response_cache().get(('AZ', tenant_id, token),
+                                           _get_platform_AZ_list,
+                                           tenant_id, token)
     else:
         raise webob.exc.HTTPBadRequest()
 
@@ -34,14 +34,27 @@ class SentryRequestHandler(wsgi.Application):
     def __init__(self):
         LOG.info(_("sentry api handler init"))
 
+    def _respond(self, req, body):
+        """Answer 304 if the client already has the serialized list."""
+        etag = getattr(body, 'etag', None)
+        if etag is None:
+            return body
+        if etag in req.if_none_match:
+            response = webob.exc.HTTPNotModified()
+            response.etag = etag
+            return response
+        req.response.etag = etag
+        return body
+
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
         if req.method == 'GET' and req.path_info == '/get-metric-list':
             LOG.debug(_("request from %s") % req.remote_addr)
             if 'IsPlatformManager' not in req.params:
-                return base.get_product_metric_list(req)
+                return self._respond(req, base.get_product_metric_list(req))
             elif req.params.get('IsPlatformManager', None) == '1':
-                return base.get_platform_metric_list(req)
+                return self._respond(req,
+                                     base.get_platform_metric_list(req))
             else:
                 msg = _("Parameters Error")
                 raise webob.exc.HTTPBadRequest(explanation=msg)
@@ -50,9 +63,11 @@ class SentryRequestHandler(wsgi.Application):
                             req.path_info == '/get-alarm-event-list':
             LOG.debug(_("request from %s") % req.remote_addr)
             if 'IsPlatformManager' not in req.params:
-                return base.get_product_alarm_event_list(req)
+                return self._respond(req,
+                                     base.get_product_alarm_event_list(req))
             elif req.params.get('IsPlatformManager', None) == '1':
-                return base.get_platform_alarm_event_list(req)
+                return self._respond(req,
+                                     base.get_platform_alarm_event_list(req))
             else:
                 msg = _("Parameters Error")
                 raise webob.exc.HTTPBadRequest(explanation=msg)
@@ -8,7 +8,9 @@
 import eventlet
 from eventlet import greenpool
 
+from sentry.api import base
 from sentry.api import wsgi
+from sentry.common import service
 from sentry.openstack.common import log
 from sentry.openstack.common import cfg
 
@@ -27,7 +29,8 @@ manager_configs = [
                help='port for metadata api to listen'),
     cfg.IntOpt('sentry_api_workers',
                default=None,
-               help='Number of workers for metadata service'),
+               help='Number of worker processes for sentry api, unset to '
+                    'serve in a single process'),
 ]
 
 FLAGS.register_opts(manager_configs)
@@ -45,23 +48,53 @@ class Manager(object):
         self.host = FLAGS.sentry_api_listen
         self.port = FLAGS.sentry_api_listen_port
         self.workers = FLAGS.sentry_api_workers
-        self.server = wsgi.Server(name,
-                                  self.app,
-                                  host=self.host,
-                                  port=self.port)
+        self.launcher = None
+        # NOTE(hzyangtk): bind once before forking, every worker accepts
+        #                 on the same socket.
+        self.socket = eventlet.listen((self.host, self.port), backlog=128)
         # Pull back actual port used
-        self.port = self.server.port
+        self.port = self.socket.getsockname()[1]
+        self.server = None
 
     def serve(self):
         """
         Sentry api serve.
+
+        With sentry_api_workers set, fork the workers and supervise them
+        until SIGTERM, SIGHUP restarts them one by one.
         """
+        if self.workers:
+            LOG.info('Start sentry api with %d workers' % self.workers)
+            self.launcher = service.ProcessLauncher()
+            self.launcher.launch(self._create_worker, self.workers)
+            self.launcher.wait()
+            return
         LOG.info('Start sentry api')
+        self.register_stats()
+        service.start_stats_log()
+        self.server = wsgi.Server(self.name, self.app, socket=self.socket)
         self.server.start()
         self.server.wait()
 
+    def _create_worker(self, index, count):
+        """
+        Called in each forked worker, serve the inherited socket with a
+        server of its own.
+        """
+        self.register_stats()
+        service.start_stats_log()
+        return wsgi.Server('%s-%d' % (self.name, index),
+                           self.app,
+                           socket=self.socket)
+
+    def register_stats(self):
+        """Register stats of this worker, logged with its health."""
+        service.register_stats('response_cache',
+                               base.get_response_cache_stats)
+
     def create(self):
-        return eventlet.spawn(self.serve())
+        return eventlet.spawn(self.serve)
 
     def cleanup(self):
         LOG.info('Cleanup sentry')
+        service.reset_stats()
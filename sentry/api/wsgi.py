@@ -41,6 +41,10 @@ wsgi_configs = [
     cfg.StrOpt('api_paste_config',
                default="api-paste.ini",
                help='File name for the paste.deploy config for nova-api'),
+    cfg.IntOpt('wsgi_shutdown_timeout',
+               default=30,
+               help='Seconds a stopping WSGI server waits for requests in '
+                    'flight to finish, 0 to drop them at once'),
 ]
 
 FLAGS.register_opts(wsgi_configs)
@@ -54,7 +58,8 @@ class Server(object):
     default_pool_size = 1000
 
     def __init__(self, name, app, host='0.0.0.0', port=0, pool_size=None,
-                       protocol=eventlet.wsgi.HttpProtocol, backlog=128):
+                       protocol=eventlet.wsgi.HttpProtocol, backlog=128,
+                       socket=None):
         """Initialize, but do not start, a WSGI server.
 
         :param name: Pretty name for logging.
@@ -63,6 +68,8 @@ class Server(object):
         :param port: Port number to server the application.
         :param pool_size: Maximum number of eventlets to spawn concurrently.
         :param backlog: Maximum number of queued connections.
+        :param socket: Listening socket bound already, host and port are
+                       ignored if given.
         :returns: None
         :raises: nova.exception.InvalidInput
         """
@@ -78,7 +85,11 @@ class Server(object):
             raise exception.InvalidInput(
                     reason='The backlog must be more than 1')
 
-        self._socket = eventlet.listen((host, port), backlog=backlog)
+        # NOTE(hzyangtk): a socket bound by the parent is shared by all
+        #                 forked workers, the kernel spreads connections
+        #                 among them.
+        self._socket = socket or eventlet.listen((host, port),
+                                                 backlog=backlog)
         (self.host, self.port) = self._socket.getsockname()
         LOG.info(_("%(name)s listening on %(host)s:%(port)s") % self.__dict__)
 
@@ -97,8 +108,8 @@ class Server(object):
     def stop(self):
         """Stop this server.
 
-        This is not a very nice action, as currently the method by which a
-        server is stopped is by killing its eventlet.
+        The eventlet accepting connections is killed, then requests in
+        flight are given wsgi_shutdown_timeout seconds to finish.
 
         :returns: None
 
@@ -109,6 +120,18 @@ class Server(object):
             # Resize pool to stop new requests from being processed
             self._pool.resize(0)
             self._server.kill()
+            self._drain(FLAGS.wsgi_shutdown_timeout)
+
+    def _drain(self, timeout):
+        if timeout <= 0 or not self._pool.running():
+            return
+        LOG.info(_("Waiting for %d requests in flight")
+                 % self._pool.running())
+        with eventlet.Timeout(timeout, False):
+            self._pool.waitall()
+        if self._pool.running():
+            LOG.warning(_("Drop %d requests still in flight")
+                        % self._pool.running())
 
     def wait(self):
         """Block, until the server has stopped.
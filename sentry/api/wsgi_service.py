@@ -5,6 +5,7 @@
 #
 
 from sentry.api import wsgi
+from sentry.common import service
 from sentry.openstack.common import cfg
 from sentry.openstack.common import importutils
 
@@ -99,11 +100,13 @@ def serve(server, workers=None):
         raise RuntimeError(_('serve() can only be called once'))
 
     if workers:
-        _launcher = ProcessLauncher()
-        _launcher.launch_server(server, workers=workers)
+        # NOTE(hzyangtk): the server socket is bound before forking, so
+        #                 the workers share it.
+        _launcher = service.ProcessLauncher()
+        _launcher.launch(lambda index, count: server, workers)
     else:
-        _launcher = ServiceLauncher()
-        _launcher.launch_server(server)
+        _launcher = server
+        server.start()
 
 
 def wait():
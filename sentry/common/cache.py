@@ -0,0 +1,130 @@
+#
+# Created on 2013-4-8
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import collections
+import time
+
+from eventlet import event
+
+
+class LRUCache(object):
+    '''
+        Bounded key/value cache with least recently used eviction and
+        an optional time to live for each entry.
+    '''
+    def __init__(self, max_size, ttl=None):
+        '''
+            :param max_size: max number of entries, 0 disables the cache
+            :param ttl: seconds an entry stays valid, None never expires
+        '''
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        try:
+            expires_at, value = self._data.pop(key)
+        except KeyError:
+            return None
+        if expires_at is not None and expires_at <= time.time():
+            self.expirations += 1
+            return None
+        # NOTE(hzyangtk): re-insert to mark the key most recently used
+        self._data[key] = (expires_at, value)
+        return (value,)
+
+    def get(self, key, default=None):
+        found = self._lookup(key)
+        if found is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return found[0]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        expires_at = None
+        if self.ttl:
+            expires_at = time.time() + self.ttl
+        self._data.pop(key, None)
+        self._data[key] = (expires_at, value)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def get_stats(self):
+        return {'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations}
+
+
+_MISSING = object()
+
+
+class SingleFlightCache(object):
+    '''
+        Cache of values loaded on miss, concurrent misses of a key wait
+        for one loader call instead of loading again. Failed loads are
+        raised to every waiter and not cached.
+    '''
+    def __init__(self, max_size, ttl=None):
+        self._cache = LRUCache(max_size, ttl)
+        self._calls = {}
+        self.coalesced = 0
+
+    def get(self, key, loader, *args, **kwargs):
+        '''
+            Return cached value of key, or loader(*args, **kwargs).
+        '''
+        value = self._cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        call = self._calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+            return call.wait()
+
+        call = event.Event()
+        self._calls[key] = call
+        try:
+            value = loader(*args, **kwargs)
+        except Exception as ex:
+            del self._calls[key]
+            call.send_exception(ex)
+            raise
+        del self._calls[key]
+        self._cache.set(key, value)
+        call.send(value)
+        return value
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self):
+        stats = self._cache.get_stats()
+        stats.update({'coalesced': self.coalesced,
+                      'in_flight': len(self._calls)})
+        return stats
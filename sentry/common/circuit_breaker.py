@@ -0,0 +1,138 @@
+#
+# Created on 2013-4-23
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import time
+
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+CONF = cfg.CONF
+
+breaker_configs = [
+    cfg.IntOpt('circuit_breaker_failure_threshold',
+               default=5,
+               help='Consecutive failures to an http endpoint which open '
+                    'its circuit, 0 to never open it'),
+    cfg.FloatOpt('circuit_breaker_reset_timeout',
+                 default=30,
+                 help='Seconds an open circuit rejects requests before a '
+                      'trial request is let through'),
+]
+
+CONF.register_opts(breaker_configs)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    '''
+        Stop sending to an endpoint after consecutive failures.
+
+        Closed: requests go through, failures are counted.
+        Open: requests are rejected at once, until reset timeout passed.
+        Half open: one trial request goes through, it closes the circuit
+        on success and opens it again on failure.
+    '''
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        if failure_threshold is None:
+            failure_threshold = CONF.circuit_breaker_failure_threshold
+        if reset_timeout is None:
+            reset_timeout = CONF.circuit_breaker_reset_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._stats = {'opened': 0, 'closed': 0, 'rejected': 0,
+                       'succeeded': 0, 'failed': 0}
+
+    def _transit(self, state):
+        LOG.warning(_("Circuit of %(name)s changes from %(old)s to "
+                      "%(new)s") % {'name': self.name, 'old': self.state,
+                                    'new': state})
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.time()
+            self._stats['opened'] += 1
+        elif state == CLOSED:
+            self._stats['closed'] += 1
+
+    def allow_request(self):
+        '''
+            Return True if a request may be sent, the caller must then
+            record its result.
+        '''
+        if self.state == OPEN:
+            if time.time() - self._opened_at < self.reset_timeout:
+                self._stats['rejected'] += 1
+                return False
+            self._transit(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trial:
+                self._stats['rejected'] += 1
+                return False
+            self._trial = True
+        return True
+
+    def get_retry_after(self):
+        '''
+            Return seconds until an open circuit lets a trial request
+            through, 0 if it is not open.
+        '''
+        if self.state != OPEN:
+            return 0
+        return max(self.reset_timeout - (time.time() - self._opened_at), 0)
+
+    def record_success(self):
+        self._stats['succeeded'] += 1
+        self._failures = 0
+        self._trial = False
+        if self.state != CLOSED:
+            self._transit(CLOSED)
+
+    def record_failure(self):
+        self._stats['failed'] += 1
+        self._failures += 1
+        self._trial = False
+        if self.state == HALF_OPEN:
+            self._transit(OPEN)
+        elif (self.state == CLOSED and self.failure_threshold and
+                self._failures >= self.failure_threshold):
+            self._transit(OPEN)
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats.update({'state': self.state,
+                      'failures': self._failures})
+        return stats
+
+
+_BREAKERS = {}
+
+
+def get_breaker(name):
+    breaker = _BREAKERS.get(name)
+    if breaker is None:
+        breaker = _BREAKERS.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def get_stats():
+    '''
+        Return state and counts of circuit of each endpoint.
+    '''
+    return dict((name, breaker.get_stats())
+                for name, breaker in _BREAKERS.iteritems())
+
+
+def reset():
+    _BREAKERS.clear()
@@ -22,7 +22,6 @@
 import collections
 import errno
 import functools
-import httplib
 import os
 import re
 import select
@@ -31,8 +30,9 @@ import urlparse
 
 import webob.exc
 try:
-    from eventlet.green import socket, ssl
+    from eventlet.green import httplib, socket, ssl
 except ImportError:
+    import httplib
     import socket
     import ssl
 
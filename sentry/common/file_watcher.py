@@ -0,0 +1,220 @@
+#
+# Created on 2013-4-18
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import os
+
+import eventlet
+from eventlet import hubs
+
+from sentry.common import exception
+from sentry.common import utils
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+LOG = log.getLogger(__name__)
+CONF = cfg.CONF
+
+file_watcher_configs = [
+    cfg.IntOpt('file_watch_interval',
+               default=5,
+               help='Seconds between checks of watched files'),
+    cfg.BoolOpt('file_watch_use_inotify',
+                default=True,
+                help='Use inotify to be told of file changes at once when '
+                     'pyinotify is installed, else poll file mtime'),
+]
+
+CONF.register_opts(file_watcher_configs)
+
+
+def _get_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+
+class FileWatcher(object):
+    '''
+        Call callback(path) in a background green thread when a watched
+        file is changed, replaced or removed. inotify events on the file
+        directory trigger a check at once, and files are checked every
+        file_watch_interval seconds anyway.
+    '''
+    def __init__(self, interval=None):
+        self.interval = interval or CONF.file_watch_interval
+        self._callbacks = {}
+        self._signatures = {}
+        self._thread = None
+        self._watch_manager = None
+
+    def watch(self, path, callback):
+        path = os.path.abspath(path)
+        callbacks = self._callbacks.setdefault(path, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+        if path not in self._signatures:
+            self._signatures[path] = _get_signature(path)
+        if self._watch_manager is not None:
+            self._add_inotify_watch(path)
+
+    def unwatch(self, path, callback=None):
+        path = os.path.abspath(path)
+        callbacks = self._callbacks.get(path, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callback is None or not callbacks:
+            self._callbacks.pop(path, None)
+            self._signatures.pop(path, None)
+
+    def check(self):
+        '''
+            Call back for each changed file, return changed paths.
+        '''
+        changed = []
+        for path in self._callbacks.keys():
+            signature = _get_signature(path)
+            if signature == self._signatures.get(path):
+                continue
+            self._signatures[path] = signature
+            changed.append(path)
+            for callback in list(self._callbacks.get(path, [])):
+                try:
+                    callback(path)
+                except Exception:
+                    LOG.exception(_("Failed to handle change of %s") % path)
+        return changed
+
+    def _add_inotify_watch(self, path):
+        # NOTE(hzyangtk): watch the directory, files are often replaced
+        #                 by rename, which drops a watch on the file.
+        mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+                pyinotify.IN_CREATE | pyinotify.IN_DELETE)
+        self._watch_manager.add_watch(os.path.dirname(path), mask)
+
+    def _poll_loop(self):
+        while True:
+            eventlet.sleep(self.interval)
+            self.check()
+
+    def _inotify_loop(self):
+        # NOTE(hzyangtk): events only wake up the loop, every watched
+        #                 file is checked by stat anyway.
+        notifier = pyinotify.Notifier(self._watch_manager,
+                                      default_proc_fun=lambda event: None,
+                                      timeout=0)
+        while True:
+            try:
+                hubs.trampoline(self._watch_manager.get_fd(), read=True,
+                                timeout=self.interval)
+            except eventlet.Timeout:
+                pass
+            else:
+                if notifier.check_events(timeout=0):
+                    notifier.read_events()
+                    notifier.process_events()
+            self.check()
+
+    def _run(self):
+        if pyinotify is not None and CONF.file_watch_use_inotify:
+            try:
+                self._watch_manager = pyinotify.WatchManager()
+                for path in self._callbacks:
+                    self._add_inotify_watch(path)
+                self._inotify_loop()
+            except Exception:
+                LOG.exception(_("Failed to watch files by inotify, "
+                                "poll them instead"))
+                self._watch_manager = None
+        self._poll_loop()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._run)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+        self._watch_manager = None
+
+
+class WatchedFile(object):
+    '''
+        Parsed snapshot of the file named by config option opt_name.
+        The file is read at the first get(), then reloaded by the file
+        watcher in background, so get() never checks the file. A new
+        snapshot replaces the reference, it is never changed in place,
+        and a failed reload keeps the last one.
+    '''
+    def __init__(self, opt_name, load_func):
+        self.opt_name = opt_name
+        self.load_func = load_func
+        self.path = None
+        self.data = {}
+        self._cache = {}
+        self._watcher = None
+
+    def _find_path(self):
+        path = CONF[self.opt_name]
+        if not os.path.exists(path):
+            path = CONF.find_file(path)
+        if not path:
+            raise exception.ConfigNotFound(path=CONF[self.opt_name])
+        return path
+
+    def _load(self, data):
+        self.data = self.load_func(data)
+
+    def _reload(self, path):
+        # NOTE(hzyangtk): clear cache to read the file even if mtime is
+        #                 the same, watcher also compares size and inode.
+        self._cache.clear()
+        utils.read_cached_file(path, self._cache, reload_func=self._load)
+
+    def get(self):
+        # NOTE(hzyangtk): watch again if the watcher was reset.
+        watcher = get_watcher()
+        if self._watcher is not watcher:
+            if not self.path:
+                self.path = self._find_path()
+            utils.read_cached_file(self.path, self._cache,
+                                   reload_func=self._load)
+            watcher.watch(self.path, self._reload)
+            watcher.start()
+            self._watcher = watcher
+        return self.data
+
+    def reset(self):
+        if self._watcher is not None:
+            self._watcher.unwatch(self.path, self._reload)
+        self._watcher = None
+        self.path = None
+        self._cache.clear()
+
+
+_WATCHER = None
+
+
+def get_watcher():
+    global _WATCHER
+    if _WATCHER is None:
+        _WATCHER = FileWatcher()
+    return _WATCHER
+
+
+def reset():
+    global _WATCHER
+    if _WATCHER is not None:
+        _WATCHER.stop()
+    _WATCHER = None
@@ -4,10 +4,12 @@
 # @author: hzyangtk@corp.netease.com
 #
 
-import time
-import httplib
+import functools
 import urllib
 
+from sentry.common import circuit_breaker
+from sentry.common import http_pool
+from sentry.common import retry_scheduler
 from sentry.openstack.common import cfg
 from sentry.openstack.common import log
 
@@ -16,21 +18,11 @@ LOG = log.getLogger(__name__)
 CONF = cfg.CONF
 
 
-request_configs = [
-    cfg.IntOpt('http_retry_count',
-               default=3,
-               help='Retry counts when http connection failed.'),
-    cfg.FloatOpt('http_retry_delay',
-                 default=3,
-                 help='Retry dealy when http connection failed.'),
-]
-
-CONF.register_opts(request_configs)
-
-
 class HttpCommunication(object):
     '''
         Send datas to monitor server by accesskey authorization.
+        Params given when sending override params of the constructor,
+        so that one instance serves every request to an endpoint.
     '''
     def __init__(self, url=None, request_uri='', headers={}, httpMethod='GET',
                  params_dict={}):
@@ -39,46 +31,74 @@ class HttpCommunication(object):
         self.headers = headers
         self.httpMethod = httpMethod
         self.params = urllib.urlencode(params_dict)
+        self.breaker = circuit_breaker.get_breaker('%s%s' % (url,
+                                                              request_uri))
 
     def send_request_to_server(self, **kwargs):
         '''
-            Send request to server.
+            Send request to server. Failed request is retried later by
+            retry scheduler, return response of the first attempt.
         '''
         if not self.url:
             LOG.error("Http Communication error.")
             raise Exception()
 
+        if 'params_dict' in kwargs:
+            params = urllib.urlencode(kwargs['params_dict'])
+        else:
+            params = self.params
         LOG.info(_("Sending alarm...the url is: %s%s, the params is: %s"
-                   % (self.url, self.request_uri, self.params)))
-        if str(self.url).startswith('http://'):
-            self.url = str(self.url).split("http://")[-1]
-
+                   % (self.url, self.request_uri, params)))
         attempts = kwargs.get('attempts', CONF.http_retry_count)
-        while attempts > 0:
+        if self.breaker.allow_request():
+            response = self._send(params)
             attempts -= 1
-            try:
-                conn = httplib.HTTPConnection(self.url)
-                conn.request(self.httpMethod, self.request_uri,
-                             self.params, self.headers)
-                response = conn.getresponse()
-                res_content = response.read()
-                if isinstance(res_content, unicode):
-                    res_content = res_content.encode('UTF-8')
-                conn.close()
-            except Exception:
-                response = None
-                LOG.exception("Http communication failed ")
-                LOG.warning("Go retrying, left %s time" % attempts)
-                time.sleep(CONF.http_retry_delay)
-                continue
-            if response.status == 200:
-                LOG.info("Http send successfully")
-                break
-            else:
-                LOG.warning("Http communication failed ")
-                LOG.warning("Http Communication response exception with "
-                            "status: %s, message: %s."
-                            % (response.status, res_content))
-                LOG.warning("Go retrying, left %s time" % attempts)
-                time.sleep(CONF.http_retry_delay)
+        else:
+            # NOTE(hzyangtk): endpoint is known to be down, leave the
+            #                 request to retries instead of waiting for
+            #                 connect timeout. It was not sent, so it is
+            #                 not an attempt.
+            LOG.warning(_("Circuit of %s%s is open, retry later")
+                        % (self.url, self.request_uri))
+            response = None
+        if response is None or response.status != 200:
+            # NOTE(hzyangtk): retry later on retry scheduler instead of
+            #                 sleeping here, which blocks consuming.
+            endpoint = '%s%s' % (self.url, self.request_uri)
+            retry_scheduler.SCHEDULER.schedule(
+                    endpoint, functools.partial(self._deliver, params),
+                    attempts, breaker=self.breaker)
+        return response
+
+    def _deliver(self, params):
+        response = self._send(params)
+        return response is not None and response.status == 200
+
+    def _send(self, params):
+        '''
+            Send request once, return response or None when failed.
+            Connection errors and server errors count as failures of
+            the circuit.
+        '''
+        try:
+            response, res_content = http_pool.get_pool(self.url).request(
+                                        self.httpMethod, self.request_uri,
+                                        params, self.headers)
+            if isinstance(res_content, unicode):
+                res_content = res_content.encode('UTF-8')
+        except Exception:
+            LOG.exception("Http communication failed ")
+            self.breaker.record_failure()
+            return None
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if response.status == 200:
+            LOG.info("Http send successfully")
+        else:
+            LOG.warning("Http communication failed ")
+            LOG.warning("Http Communication response exception with "
+                        "status: %s, message: %s."
+                        % (response.status, res_content))
         return response
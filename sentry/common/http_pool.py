@@ -0,0 +1,162 @@
+#
+# Created on 2013-4-11
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import httplib
+import select
+import socket
+import time
+
+from eventlet import semaphore
+
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+CONF = cfg.CONF
+
+http_pool_configs = [
+    cfg.IntOpt('http_pool_max_connections',
+               default=10,
+               help='Max number of connections to one host:port.'),
+    cfg.IntOpt('http_pool_max_idle_time',
+               default=4,
+               help='Seconds an idle keep-alive connection is reused, '
+                    'keep it below the keep-alive timeout of servers.'),
+]
+
+CONF.register_opts(http_pool_configs)
+
+_POOLS = {}
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+
+def normalize_url(url):
+    '''
+        Strip scheme of url, return host:port used by httplib.
+    '''
+    url = str(url)
+    if url.startswith('http://'):
+        url = url.split("http://")[-1]
+    return url.rstrip('/')
+
+
+class HTTPConnectionPool(object):
+    '''
+        Keep-alive http connections to one host:port.
+    '''
+    def __init__(self, host, max_connections=None, max_idle_time=None):
+        if max_connections is None:
+            max_connections = CONF.http_pool_max_connections
+        if max_idle_time is None:
+            max_idle_time = CONF.http_pool_max_idle_time
+        self.host = host
+        self.max_idle_time = max_idle_time
+        self._free_conns = []
+        self._semaphore = semaphore.Semaphore(max_connections)
+
+    def _is_connection_dropped(self, conn):
+        '''
+            An idle keep-alive socket should have nothing to read, if it
+            is readable the server has closed it (or sent garbage).
+        '''
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            return False
+        try:
+            readable, _w, _x = select.select([sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return True
+        return bool(readable)
+
+    def _get_conn(self):
+        '''
+            Return (conn, reused), drop connections idle too long or
+            closed by server.
+        '''
+        now = time.time()
+        while self._free_conns:
+            conn, idle_since = self._free_conns.pop()
+            if (now - idle_since < self.max_idle_time and
+                    not self._is_connection_dropped(conn)):
+                return conn, True
+            conn.close()
+        return httplib.HTTPConnection(self.host), False
+
+    def _put_conn(self, conn):
+        self._free_conns.append((conn, time.time()))
+
+    def _read_response(self, conn):
+        response = conn.getresponse()
+        content = response.read()
+        return response, content
+
+    def _reconnect(self, conn):
+        conn.close()
+        LOG.debug(_("Stale connection to %s, reconnecting") % self.host)
+        return httplib.HTTPConnection(self.host)
+
+    def request(self, method, uri, body=None, headers={}):
+        '''
+            Send request through a pooled connection.
+            @return (response, content)
+        '''
+        with self._semaphore:
+            conn, reused = self._get_conn()
+            try:
+                try:
+                    conn.request(method, uri, body, headers)
+                except (httplib.HTTPException, socket.error):
+                    if not reused:
+                        raise
+                    # NOTE(hzyangtk): keep-alive socket may be closed by
+                    #                 server while idle. The request was
+                    #                 not sent, resend it once on a new
+                    #                 connection.
+                    conn = self._reconnect(conn)
+                    conn.request(method, uri, body, headers)
+                try:
+                    response, content = self._read_response(conn)
+                except (httplib.HTTPException, socket.error):
+                    # NOTE(hzyangtk): server may have handled the request
+                    #                 already, only idempotent ones are
+                    #                 safe to be sent again.
+                    if not reused or method not in IDEMPOTENT_METHODS:
+                        raise
+                    conn = self._reconnect(conn)
+                    conn.request(method, uri, body, headers)
+                    response, content = self._read_response(conn)
+            except Exception:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._put_conn(conn)
+            return response, content
+
+    def close(self):
+        while self._free_conns:
+            conn, idle_since = self._free_conns.pop()
+            conn.close()
+
+
+def get_pool(url):
+    '''
+        Return the connection pool shared by all requests to url.
+    '''
+    host = normalize_url(url)
+    pool = _POOLS.get(host)
+    if pool is None:
+        pool = _POOLS.setdefault(host, HTTPConnectionPool(host))
+    return pool
+
+
+def reset():
+    for pool in _POOLS.values():
+        pool.close()
+    _POOLS.clear()
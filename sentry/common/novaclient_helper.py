@@ -4,6 +4,9 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+from eventlet import pools
+from eventlet import semaphore
+
 from sentry.common import exception
 from sentry.openstack.common import cfg
 from sentry.openstack.common import log as logging
@@ -27,10 +30,46 @@ nova_client_configs = [
     cfg.StrOpt('novaclient_keystoneUrl',
                 default='default',
                 help='Nova Client Keystone Url'),
+    cfg.IntOpt('novaclient_pool_size',
+               default=8,
+               help='Max number of nova clients shared in process'),
 ]
 
 FLAGS.register_opts(nova_client_configs)
 
+_POOL = None
+_pool_create_sem = semaphore.Semaphore()
+
+
+class NovaClientPool(pools.Pool):
+    '''
+        Pool of authenticated nova clients. A pooled client keeps its
+        keystone token and http connection between calls, novaclient
+        re-authenticates by itself when the token was rejected(401).
+    '''
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_size', FLAGS.novaclient_pool_size)
+        kwargs.setdefault('order_as_stack', True)
+        super(NovaClientPool, self).__init__(*args, **kwargs)
+
+    def create(self):
+        LOG.debug(_('Pool creating new nova client'))
+        return CallNovaClient()
+
+
+def get_client_pool():
+    global _POOL
+    with _pool_create_sem:
+        # Make sure only one thread tries to create the client pool.
+        if _POOL is None:
+            _POOL = NovaClientPool()
+    return _POOL
+
+
+def reset_client_pool():
+    global _POOL
+    _POOL = None
+
 
 class CallNovaClient(object):
     '''
@@ -40,6 +79,10 @@ class CallNovaClient(object):
         '''
             Get nova client object by admin user.
         '''
+        self.nova_client = None
+        self._connect()
+
+    def _connect(self):
         try:
             self.nova_client = Client(FLAGS.novaclient_username,
                                       FLAGS.novaclient_password,
@@ -51,15 +94,25 @@ class CallNovaClient(object):
                             "cause of error auth for keystone"))
             self.nova_client = None
 
-    def get_all_instances(self):
+    def get_all_instances(self, changes_since=None, marker=None,
+                          limit=None):
         '''
             Get all instances obeject in different hosts by nova client
+            :param changes_since: only instances changed since this ISO
+                                  8601 time, deleted ones are included
+            :param marker: uuid of the last instance of previous page
+            :param limit: max number of instances returned
         '''
         try:
+            if self.nova_client is None:
+                self._connect()
             if self.nova_client is None:
                 raise Exception()
             detailed = True
-            search_opts = {'all_tenants': 'True'}
+            search_opts = {'all_tenants': 'True',
+                           'changes-since': changes_since,
+                           'marker': marker,
+                           'limit': limit}
             instances = self.nova_client.servers.list(detailed, search_opts)
             return instances
         except Exception:
@@ -73,6 +126,8 @@ class CallNovaClient(object):
             Get instance object with UUID by nova client call
         '''
         try:
+            if self.nova_client is None:
+                self._connect()
             if self.nova_client is None:
                 raise Exception()
             instance = self.nova_client.servers.get(instance_id)
@@ -88,6 +143,8 @@ class CallNovaClient(object):
             Get flavors datas by nova client
         '''
         try:
+            if self.nova_client is None:
+                self._connect()
             if self.nova_client is None:
                 raise Exception()
             flavors = self.nova_client.flavors.get(flavorId)
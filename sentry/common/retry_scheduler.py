@@ -0,0 +1,127 @@
+#
+# Created on 2013-4-12
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import random
+
+import eventlet
+
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+CONF = cfg.CONF
+
+retry_configs = [
+    cfg.IntOpt('http_retry_count',
+               default=3,
+               help='Retry counts when http connection failed.'),
+    cfg.FloatOpt('http_retry_delay',
+                 default=3,
+                 help='Initial retry delay when http connection failed, '
+                      'doubled on each retry.'),
+    cfg.FloatOpt('http_retry_max_delay',
+                 default=60,
+                 help='Max delay of backoff between http retries.'),
+]
+
+CONF.register_opts(retry_configs)
+
+
+class RetryScheduler(object):
+    '''
+        Park failed deliveries and retry them later on eventlet timers,
+        so that the caller never sleeps between attempts. Delay grows
+        exponentially from http_retry_delay with random jitter.
+    '''
+    def __init__(self):
+        self._stats = {}
+
+    def _get_endpoint_stats(self, endpoint):
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats.setdefault(endpoint, {'in_flight': 0,
+                                                      'retries': 0,
+                                                      'deferred': 0,
+                                                      'succeeded': 0,
+                                                      'failed': 0})
+        return stats
+
+    def get_delay(self, retry_num):
+        delay = min(CONF.http_retry_delay * (2 ** retry_num),
+                    CONF.http_retry_max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    def schedule(self, endpoint, func, attempts, on_failure=None,
+                 breaker=None):
+        '''
+            Retry func later until it returns True.
+            :param endpoint: name of the endpoint, key of the stats
+            :param func: delivery function, return True on success
+            :param attempts: max number of retries
+            :param on_failure: called when all retries failed
+            :param breaker: circuit breaker of the endpoint, func is only
+                            called when it allows the request
+        '''
+        if attempts <= 0:
+            if on_failure is not None:
+                on_failure()
+            return
+        self._get_endpoint_stats(endpoint)['in_flight'] += 1
+        eventlet.spawn_after(self.get_delay(0), self._retry, endpoint,
+                             func, attempts, 0, on_failure, breaker)
+
+    def _retry(self, endpoint, func, attempts, retry_num, on_failure,
+               breaker=None):
+        stats = self._get_endpoint_stats(endpoint)
+        if breaker is not None and not breaker.allow_request():
+            # NOTE(hzyangtk): a retry rejected by the open circuit was not
+            #                 sent, so it is not an attempt. Try again
+            #                 when the circuit half opens.
+            stats['deferred'] += 1
+            delay = max(breaker.get_retry_after(), self.get_delay(retry_num))
+            eventlet.spawn_after(delay, self._retry, endpoint, func,
+                                 attempts, retry_num, on_failure, breaker)
+            return
+
+        stats['retries'] += 1
+        try:
+            succeeded = func()
+        except Exception:
+            LOG.exception(_("Retry to %s failed") % endpoint)
+            succeeded = False
+
+        attempts -= 1
+        if succeeded:
+            stats['in_flight'] -= 1
+            stats['succeeded'] += 1
+        elif attempts <= 0:
+            stats['in_flight'] -= 1
+            stats['failed'] += 1
+            LOG.warning(_("Give up retrying to %s") % endpoint)
+            if on_failure is not None:
+                on_failure()
+        else:
+            LOG.warning(_("Go retrying %(endpoint)s, left %(attempts)s time")
+                        % locals())
+            eventlet.spawn_after(self.get_delay(retry_num + 1), self._retry,
+                                 endpoint, func, attempts, retry_num + 1,
+                                 on_failure, breaker)
+
+    def get_stats(self, endpoint=None):
+        '''
+            Return per endpoint in flight, retry and deferred counts.
+        '''
+        if endpoint is not None:
+            return dict(self._get_endpoint_stats(endpoint))
+        return dict((key, dict(value))
+                    for key, value in self._stats.iteritems())
+
+    def reset(self):
+        self._stats = {}
+
+
+SCHEDULER = RetryScheduler()
@@ -0,0 +1,395 @@
+#
+# Created on 2013-4-16
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import errno
+import fcntl
+import os
+import random
+import signal
+import time
+
+import eventlet
+from eventlet import hubs
+
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+CONF = cfg.CONF
+
+service_configs = [
+    cfg.IntOpt('worker_heartbeat_interval',
+               default=5,
+               help='Seconds between heartbeats sent by a worker process'),
+    cfg.IntOpt('worker_heartbeat_timeout',
+               default=60,
+               help='Kill a worker process silent for this many seconds, '
+                    '0 to never kill silent workers'),
+    cfg.IntOpt('worker_respawn_delay',
+               default=1,
+               help='Seconds to wait before respawning a worker process '
+                    'which died soon after started'),
+    cfg.IntOpt('worker_health_log_interval',
+               default=60,
+               help='Seconds between logs of worker health and of the '
+                    'stats of each worker, 0 to never log them'),
+]
+
+CONF.register_opts(service_configs)
+
+_STATS = {}
+_STATS_THREAD = None
+
+
+def register_stats(name, func):
+    '''
+        Log func() with the health of this process, func returns a dict
+        of stats or None when there is nothing to report.
+    '''
+    _STATS[name] = func
+
+
+def log_stats():
+    '''
+        Log stats registered in this process, return number of logged.
+    '''
+    logged = 0
+    for name, func in sorted(_STATS.iteritems()):
+        try:
+            stats = func()
+        except Exception:
+            LOG.exception(_('Failed to get stats of %s') % name)
+            continue
+        if stats is None:
+            continue
+        LOG.info(_('Stats of %(name)s: %(stats)s')
+                 % {'name': name, 'stats': stats})
+        logged += 1
+    return logged
+
+
+def _stats_loop(interval):
+    while True:
+        eventlet.sleep(interval)
+        log_stats()
+
+
+def start_stats_log():
+    '''
+        Log registered stats every worker_health_log_interval seconds,
+        once started in a process later calls do nothing.
+    '''
+    global _STATS_THREAD
+    if _STATS_THREAD is None and CONF.worker_health_log_interval:
+        _STATS_THREAD = eventlet.spawn(_stats_loop,
+                                       CONF.worker_health_log_interval)
+
+
+def reset_stats():
+    global _STATS_THREAD
+    if _STATS_THREAD is not None:
+        _STATS_THREAD.kill()
+        _STATS_THREAD = None
+    _STATS.clear()
+
+
+class SignalExit(SystemExit):
+
+    def __init__(self, signo, exccode=1):
+        super(SignalExit, self).__init__(exccode)
+        self.signo = signo
+
+
+class WorkerInfo(object):
+    '''
+        State of a worker process kept by the parent.
+    '''
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.pipe = None
+        self.started_at = None
+        self.last_heartbeat = None
+        self.restarts = 0
+
+
+class ProcessLauncher(object):
+    '''
+        Fork workers and supervise them from the parent process.
+
+        worker_factory(index, count) is called in each child and returns
+        an object with start(), wait() and stop(). The parent respawns
+        crashed workers, kills workers whose heartbeat stopped, restarts
+        all workers one by one on SIGHUP and stops them on SIGTERM/SIGINT.
+    '''
+    def __init__(self):
+        self.children = {}
+        self.workers = []
+        self.worker_factory = None
+        self.running = True
+        self.restarting = []
+        self._restarting_pid = None
+        self._health_logged_at = None
+
+    def _handle_signal(self, signo, frame):
+        if signo == signal.SIGHUP:
+            LOG.info(_('Caught SIGHUP, restarting workers'))
+            self.restarting = [worker.index for worker in self.workers]
+            return
+        self.running = False
+        # NOTE(hzyangtk): restore default handlers, so that a second
+        #                 signal kills the parent at once.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    def _setup_signals(self):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        signal.signal(signal.SIGHUP, self._handle_signal)
+
+    def _child_handle_signal(self, signo, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        raise SignalExit(signo)
+
+    def _heartbeat_loop(self, write_fd):
+        while True:
+            try:
+                os.write(write_fd, '.')
+            except OSError:
+                LOG.exception(_('Failed to send heartbeat to parent'))
+            eventlet.sleep(CONF.worker_heartbeat_interval)
+
+    def _child_process(self, worker, write_fd):
+        signal.signal(signal.SIGTERM, self._child_handle_signal)
+        # NOTE(hzyangtk): parent handles SIGINT and SIGHUP, and tells
+        #                 children what to do with SIGTERM.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        # NOTE(hzyangtk): start a fresh hub and reseed, so that workers
+        #                 share neither timers nor the random sequence
+        #                 inherited from the parent.
+        hubs.use_hub()
+        random.seed()
+
+        heartbeat = eventlet.spawn(self._heartbeat_loop, write_fd)
+        service = None
+        status = 0
+        try:
+            service = self.worker_factory(worker.index, len(self.workers))
+            service.start()
+            service.wait()
+        except SignalExit as exc:
+            LOG.info(_('Worker %(index)s caught signal %(signo)s, '
+                       'exiting') % {'index': worker.index,
+                                     'signo': exc.signo})
+        except BaseException:
+            LOG.exception(_('Unhandled exception in worker %s')
+                          % worker.index)
+            status = 2
+        finally:
+            heartbeat.kill()
+            if service is not None:
+                try:
+                    service.stop()
+                except Exception:
+                    LOG.exception(_('Failed to stop worker %s')
+                                  % worker.index)
+        return status
+
+    def _start_child(self, worker):
+        if (worker.started_at is not None and
+                time.time() - worker.started_at < CONF.worker_respawn_delay):
+            # NOTE(hzyangtk): a worker dying at once is likely to die
+            #                 again, do not respawn it in a tight loop.
+            time.sleep(CONF.worker_respawn_delay)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 1
+            try:
+                status = self._child_process(worker, write_fd)
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        flags = fcntl.fcntl(read_fd, fcntl.F_GETFL)
+        fcntl.fcntl(read_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        if worker.pid is not None:
+            worker.restarts += 1
+        worker.pid = pid
+        worker.pipe = read_fd
+        worker.started_at = time.time()
+        worker.last_heartbeat = worker.started_at
+        self.children[pid] = worker
+        eventlet.spawn_n(self._read_heartbeats, worker, read_fd)
+        LOG.info(_('Started worker %(index)s with pid %(pid)s')
+                 % {'index': worker.index, 'pid': pid})
+        return pid
+
+    def launch(self, worker_factory, workers=1):
+        self.worker_factory = worker_factory
+        self.workers = [WorkerInfo(index) for index in range(workers)]
+        self._setup_signals()
+        for worker in self.workers:
+            self._start_child(worker)
+
+    def _read_heartbeats(self, worker, read_fd):
+        '''
+            Record heartbeats of a worker until its pipe is closed.
+        '''
+        try:
+            while True:
+                try:
+                    data = os.read(read_fd, 512)
+                except OSError as exc:
+                    if exc.errno == errno.EAGAIN:
+                        hubs.trampoline(read_fd, read=True)
+                        continue
+                    if exc.errno == errno.EINTR:
+                        continue
+                    raise
+                if not data:
+                    break
+                if worker.pipe == read_fd:
+                    worker.last_heartbeat = time.time()
+        except Exception:
+            LOG.exception(_('Failed to read heartbeat of worker %s')
+                          % worker.index)
+        finally:
+            os.close(read_fd)
+
+    def check_health(self):
+        '''
+            Kill workers silent for too long, the killed ones are
+            respawned once reaped.
+        '''
+        now = time.time()
+        for pid, worker in self.children.items():
+            timeout = CONF.worker_heartbeat_timeout
+            if timeout and now - worker.last_heartbeat > timeout:
+                LOG.warning(_('Worker %(index)s (pid %(pid)s) has no '
+                              'heartbeat for %(timeout)s seconds, '
+                              'killing it') % {'index': worker.index,
+                                               'pid': pid,
+                                               'timeout': timeout})
+                self._kill(pid, signal.SIGKILL)
+
+    def get_health(self):
+        '''
+            Return pid, seconds since last heartbeat and restart
+            count of each worker.
+        '''
+        now = time.time()
+        health = {}
+        for worker in self.workers:
+            health[worker.index] = {
+                'pid': worker.pid,
+                'alive': worker.pid in self.children,
+                'heartbeat_age': now - (worker.last_heartbeat or now),
+                'restarts': worker.restarts}
+        return health
+
+    def log_health(self):
+        '''
+            Log health of each worker every worker_health_log_interval
+            seconds, return True if logged.
+        '''
+        interval = CONF.worker_health_log_interval
+        now = time.time()
+        if not interval or (self._health_logged_at is not None and
+                            now - self._health_logged_at < interval):
+            return False
+        self._health_logged_at = now
+        for index, health in sorted(self.get_health().iteritems()):
+            log_info = dict(health, index=index)
+            if health['alive']:
+                LOG.info(_('Worker %(index)s (pid %(pid)s) is alive, last '
+                           'heartbeat %(heartbeat_age)d seconds ago, '
+                           'restarted %(restarts)d times') % log_info)
+            else:
+                LOG.warning(_('Worker %(index)s (pid %(pid)s) is down, '
+                              'restarted %(restarts)d times') % log_info)
+        return True
+
+    def _kill(self, pid, signo):
+        try:
+            os.kill(pid, signo)
+        except OSError as exc:
+            if exc.errno != errno.ESRCH:
+                raise
+
+    def _reap_child(self):
+        try:
+            pid, status = os.waitpid(0, os.WNOHANG)
+        except OSError as exc:
+            if exc.errno != errno.ECHILD:
+                raise
+            return None
+        if not pid or pid not in self.children:
+            return None
+
+        worker = self.children.pop(pid)
+        if os.WIFSIGNALED(status):
+            LOG.info(_('Worker %(index)s (pid %(pid)s) killed by signal '
+                       '%(sig)s') % {'index': worker.index, 'pid': pid,
+                                     'sig': os.WTERMSIG(status)})
+        else:
+            LOG.info(_('Worker %(index)s (pid %(pid)s) exited with status '
+                       '%(code)s') % {'index': worker.index, 'pid': pid,
+                                      'code': os.WEXITSTATUS(status)})
+        return worker
+
+    def _restart_next(self):
+        '''
+            Restart one worker at a time, so that the others keep
+            consuming during a graceful restart.
+        '''
+        if (self._restarting_pid in self.children or
+                len(self.children) < len(self.workers)):
+            return
+        worker = self.workers[self.restarting.pop(0)]
+        self._restarting_pid = worker.pid
+        self._kill(worker.pid, signal.SIGTERM)
+
+    def wait(self):
+        '''
+            Supervise workers until the parent is told to stop.
+        '''
+        while self.running:
+            worker = self._reap_child()
+            if worker is not None:
+                if self.running:
+                    self._start_child(worker)
+                continue
+            if self.restarting:
+                self._restart_next()
+            elif self._restarting_pid is not None:
+                self._restarting_pid = None
+            self.check_health()
+            self.log_health()
+            eventlet.sleep(0.1)
+
+        self.stop()
+
+    def stop(self):
+        LOG.info(_('Stopping %d workers') % len(self.children))
+        for pid in self.children:
+            self._kill(pid, signal.SIGTERM)
+        while self.children:
+            try:
+                pid, status = os.waitpid(0, 0)
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                if exc.errno != errno.ECHILD:
+                    raise
+                break
+            self.children.pop(pid, None)
@@ -4,8 +4,10 @@
 # @author: hzyangtk
 #
 
+import calendar
 import datetime
 import os
+import re
 import time
 
 from dateutil import tz
@@ -18,6 +20,20 @@ LOG = logging.getLogger(__name__)
 
 ALARM_LEVEL = ['INFO', 'WARN', 'ERROR', 'FATAL']
 PERFECT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+NOTIFICATION_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+_NOTIFICATION_TIME_RE = re.compile(
+                r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{1,6}\Z')
+# NOTE(hzyangtk): dict lookup is several times faster than int()
+_TWO_DIGITS = dict(('%02d' % number, number) for number in range(100))
+_DAYS_BEFORE_MONTH = (0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304,
+                      334)
+_DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# NOTE(hzyangtk): proleptic gregorian ordinal of 1970-01-01
+_EPOCH_ORDINAL = 719163
+
+_TZ_UTC = tz.tzutc()
+_TZ_LOCAL = tz.tzlocal()
 
 
 def get_alarm_level(level):
@@ -69,11 +85,9 @@ def tz_utc_to_local(utc):
         utc: datetime
     """
     # NOTE(hzyangtk): Change format of created_at from utc to local.
-    to_zone = tz.tzlocal()
     if utc.tzinfo is None:
-        from_zone = tz.tzutc()
-        utc = utc.replace(tzinfo=from_zone)
-    result = utc.astimezone(to_zone)
+        utc = utc.replace(tzinfo=_TZ_UTC)
+    result = utc.astimezone(_TZ_LOCAL)
     return result
 
 
@@ -87,6 +101,48 @@ def parse_strtime(timestr, fmt=PERFECT_TIME_FORMAT):
     return datetime.datetime.strptime(timestr, fmt)
 
 
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def utc_strtime_to_timestamp(timestr):
+    """
+    Turn a utc time of nova notification, like 2012-03-27 15:51:11.123,
+    into epoch milliseconds of whole seconds, the same as converting it
+    to local time and calling datetime_to_timestamp.
+
+    Epoch does not depend on timezone, so it is computed from the utc
+    fields directly. Other layouts go through strptime.
+    """
+    if _NOTIFICATION_TIME_RE.match(timestr) is None:
+        utc = parse_strtime(timestr, NOTIFICATION_TIME_FORMAT)
+        return long(calendar.timegm(utc.timetuple()) * 1000)
+
+    year = _TWO_DIGITS[timestr[0:2]] * 100 + _TWO_DIGITS[timestr[2:4]]
+    month = _TWO_DIGITS[timestr[5:7]]
+    day = _TWO_DIGITS[timestr[8:10]]
+    hour = _TWO_DIGITS[timestr[11:13]]
+    minute = _TWO_DIGITS[timestr[14:16]]
+    second = _TWO_DIGITS[timestr[17:19]]
+    if not 1 <= month <= 12:
+        raise ValueError(_("month out of range: %s") % timestr)
+    days_in_month = _DAYS_IN_MONTH[month]
+    if month == 2 and _is_leap(year):
+        days_in_month = 29
+    if (year < 1 or not 1 <= day <= days_in_month or hour > 23 or
+            minute > 59 or second > 59):
+        raise ValueError(_("time out of range: %s") % timestr)
+
+    last_year = year - 1
+    ordinal = (last_year * 365 + last_year // 4 - last_year // 100 +
+               last_year // 400 + _DAYS_BEFORE_MONTH[month] + day)
+    if month > 2 and _is_leap(year):
+        ordinal += 1
+    seconds = ((ordinal - _EPOCH_ORDINAL) * 86400 + hour * 3600 +
+               minute * 60 + second)
+    return long(seconds * 1000)
+
+
 def strtime(at=None, fmt=PERFECT_TIME_FORMAT):
     """Returns formatted utcnow."""
     if not at:
@@ -0,0 +1,112 @@
+#
+# Created on 2013-4-15
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import itertools
+
+import eventlet
+from eventlet import queue
+from eventlet import semaphore
+
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+
+dispatcher_configs = [
+    cfg.IntOpt('handler_workers',
+               default=8,
+               help='Number of green threads handling messages, 0 to '
+                    'handle messages inline in consumer'),
+    cfg.IntOpt('handler_max_in_flight',
+               default=64,
+               help='Max number of messages received but not handled'),
+]
+
+
+CONF = cfg.CONF
+CONF.register_opts(dispatcher_configs)
+LOG = log.getLogger(__name__)
+
+
+def get_instance_id(message):
+    payload = message.get('payload')
+    if not isinstance(payload, dict):
+        return None
+    instance_id = payload.get('instance_id') or payload.get('uuid')
+    if instance_id is None:
+        try:
+            instance_id = payload['request_spec']['instance_uuids'][0]
+        except (KeyError, IndexError, TypeError):
+            pass
+    return instance_id
+
+
+class Dispatcher(object):
+    '''
+        Hand messages from consumer to a fixed number of worker lanes.
+        Messages of the same instance always go to the same lane, so
+        they are handled in order. A message is acked after handled
+        or skipped, and consumer blocks while max_in_flight messages
+        are unfinished.
+    '''
+    def __init__(self, handle_func, workers=None, max_in_flight=None):
+        if workers is None:
+            workers = CONF.handler_workers
+        if max_in_flight is None:
+            max_in_flight = CONF.handler_max_in_flight
+        self.handle_func = handle_func
+        self.max_in_flight = max(max_in_flight, 1)
+        self._semaphore = semaphore.Semaphore(self.max_in_flight)
+        self._lanes = [queue.LightQueue() for i in range(workers)]
+        self._round_robin = itertools.cycle(range(workers))
+        self._threads = [eventlet.spawn(self._lane_loop, lane)
+                         for lane in self._lanes]
+
+    def _get_lane(self, message):
+        instance_id = get_instance_id(message)
+        if instance_id is None:
+            return self._lanes[self._round_robin.next()]
+        return self._lanes[hash(instance_id) % len(self._lanes)]
+
+    def dispatch(self, message, ack=None):
+        '''
+            Kombu callback, ack is called once the message was handled.
+        '''
+        if not self._lanes:
+            self._handle(message, ack)
+            return
+        # NOTE(hzyangtk): block consumer when too many messages are in
+        #                 flight, the unacked ones stay in the queue.
+        self._semaphore.acquire()
+        self._get_lane(message).put((message, ack))
+
+    def _handle(self, message, ack):
+        try:
+            self.handle_func(message)
+        except Exception:
+            LOG.exception(_("Failed to handle message... skipping it."))
+        # NOTE(hzyangtk): ack skipped message too, with batched acks an
+        #                 unacked message holds back every later ack.
+        if ack is not None:
+            ack()
+
+    def _lane_loop(self, lane):
+        while True:
+            message, ack = lane.get()
+            try:
+                self._handle(message, ack)
+            except Exception:
+                LOG.exception(_("Failed to ack message"))
+            finally:
+                self._semaphore.release()
+
+    def get_stats(self):
+        return {'in_flight': self.max_in_flight - self._semaphore.balance,
+                'lanes': [lane.qsize() for lane in self._lanes]}
+
+    def stop(self):
+        for thread in self._threads:
+            thread.kill()
+        self._threads = []
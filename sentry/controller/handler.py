@@ -4,8 +4,14 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+import collections
+import os
+import time
+
+from sentry.common import file_watcher
 from sentry.common import utils
 from sentry.controller import helper as controller_helper
+from sentry.filter import index as filter_index
 from sentry.openstack.common import cfg
 from sentry.openstack.common import importutils
 from sentry.openstack.common import log
@@ -20,6 +26,9 @@ handler_configs = [
                 default=['sentry.filter.alarm_filter.AlarmFilter',
                          'sentry.filter.owner_filter.OwnerFilter'],
                 help='Driver or drivers to filter alarm messages'),
+    cfg.BoolOpt('enable_filter_reload',
+                default=True,
+                help='Reload filter rules when their files change'),
 ]
 
 
@@ -27,12 +36,25 @@ CONF = cfg.CONF
 CONF.register_opts(handler_configs)
 LOG = log.getLogger(__name__)
 
+# NOTE(hzyangtk): config of the message pipeline compiled once, it is
+#                 replaced as a whole when filter rules are reloaded and
+#                 never changed in place.
+PipelineContext = collections.namedtuple('PipelineContext',
+                                         ['alarm_levels', 'helper_actions',
+                                          'filter_index'])
+
 
 class Handler(object):
 
     def __init__(self):
         LOG.debug("Controller handler init.")
         self._filter_drivers = None
+        self._filter_index = None
+        self._context = None
+        self._reload_stats = {'reloads': 0,
+                              'failures': 0,
+                              'last_latency': None,
+                              'last_error': None}
 
     def handle_message(self, message):
         """
@@ -47,14 +69,15 @@ class Handler(object):
         }
         """
         try:
+            context = self._get_context()
             # NOTE(hzyangtk): handle message before alarm like notify
             #                 cloud monitor to stop alarm when instance
             #                 was deleted.
-            controller_helper.handle_before_alarm(message)
+            controller_helper.handle_before_alarm(message,
+                                                  context.helper_actions)
 
-            alarm_levels = utils.get_alarm_level(CONF.alarm_level)
             message_priority = message.get('priority')
-            if message_priority in alarm_levels:
+            if message_priority in context.alarm_levels:
                 # NOTE(hzyangtk): flow_data is origin data that will be
                 #                 filtered alarm_type is like
                 #                 compute.create.start
@@ -74,7 +97,33 @@ class Handler(object):
         except Exception:
             LOG.exception("Alarm failed")
 
+    def _get_context(self):
+        """Compile and cache the pipeline context."""
+        context = self._context
+        if context is None:
+            try:
+                index = self._get_filter_index()
+            except Exception:
+                LOG.exception(_("Failed to compile filter rules"))
+                index = None
+            context = PipelineContext(
+                alarm_levels=frozenset(
+                            utils.get_alarm_level(CONF.alarm_level)),
+                helper_actions=controller_helper.get_actions(),
+                filter_index=index)
+            self._context = context
+        return context
+
     def _do_filter(self, flow_data):
+        # NOTE(hzyangtk): resolve the whole filter chain with one lookup
+        #                 in the compiled index, fall back to run the
+        #                 chain when the drivers can not be compiled.
+        index = self._get_context().filter_index
+        if index is not None:
+            try:
+                return index.filter(flow_data)
+            except TypeError:
+                LOG.debug(_("Flow data %s is not indexable") % flow_data)
         for driver in self._get_filter_drivers():
             try:
                 flow_data = driver.filter(flow_data)
@@ -84,6 +133,16 @@ class Handler(object):
                                 locals())
         return flow_data
 
+    def _get_filter_index(self):
+        """Compile and cache the index of the filter drivers."""
+        if self._filter_index is None:
+            self._filter_index = filter_index.FilterIndex.build(
+                                            self._get_filter_drivers())
+            if self._filter_index is None:
+                # NOTE(hzyangtk): do not try to compile on each message
+                self._filter_index = False
+        return self._filter_index or None
+
     def _get_filter_drivers(self):
         """Instantiate, cache, and return drivers based on the CONF."""
         if self._filter_drivers is None:
@@ -103,6 +162,7 @@ class Handler(object):
             try:
                 driver = importutils.import_object(filter_driver)
                 self._filter_drivers[filter_driver] = driver
+                self._watch_filter_driver(driver)
             except ImportError:
                 LOG.exception(_("Failed to load filter %s. "
                                 "These filters will not be sent.") %
@@ -110,10 +170,58 @@ class Handler(object):
         else:
             # Driver is already loaded; just add the object.
             self._filter_drivers[filter_driver] = filter_driver
+            self._watch_filter_driver(filter_driver)
+        self._filter_index = None
+        self._context = None
+
+    def _watch_filter_driver(self, driver):
+        if not CONF.enable_filter_reload:
+            return
+        get_rule_files = getattr(driver, 'get_rule_files', None)
+        if get_rule_files is None:
+            return
+        watcher = file_watcher.get_watcher()
+        for path in get_rule_files():
+            watcher.watch(path, self.reload_filters)
+
+    def reload_filters(self, path):
+        """
+        Reload filters of the changed rule file in the file watcher
+        thread, then swap in a new index. Messages being filtered keep
+        the old index, and the old rules stay when reloading failed.
+        """
+        start = time.time()
+        drivers = self._get_filter_drivers()
+        try:
+            for driver in drivers:
+                rule_files = getattr(driver, 'get_rule_files', lambda: [])()
+                if path in [os.path.abspath(rule_file)
+                            for rule_file in rule_files]:
+                    driver.reload()
+            index = filter_index.FilterIndex.build(drivers)
+        except Exception as ex:
+            self._reload_stats['failures'] += 1
+            self._reload_stats['last_error'] = str(ex)
+            LOG.exception(_("Failed to reload filter rules from %s, "
+                            "keep using the old rules") % path)
+            return
+        self._filter_index = index or False
+        self._context = None
+        latency = time.time() - start
+        self._reload_stats['reloads'] += 1
+        self._reload_stats['last_latency'] = latency
+        self._reload_stats['last_error'] = None
+        LOG.info(_("Reloaded filter rules from %(path)s in %(ms).1f ms")
+                 % {'path': path, 'ms': latency * 1000})
+
+    def get_reload_stats(self):
+        return dict(self._reload_stats)
 
     def _reset_filter_drivers(self):
         """Used by unit tests to reset the drivers."""
         self._filter_drivers = None
+        self._filter_index = None
+        self._context = None
 
     def _do_send_alarm(self, message):
         """Send messages to alarm system."""
@@ -4,9 +4,13 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+import eventlet
+from eventlet import queue
+
 from sentry.common import http_communication
 from sentry.openstack.common import cfg
 from sentry.openstack.common import log
+from sentry.sender import handler as sender_handler
 
 
 LOG = log.getLogger(__name__)
@@ -31,35 +35,220 @@ notify_configs = [
     cfg.StrOpt('alarm_binding_request_uri',
                default=None,
                help='Binding alarm request uri.'),
+    cfg.IntOpt('platform_notify_workers',
+               default=2,
+               help='Green threads sending stop alarm and binding '
+                    'notifications in background, 0 to send them before '
+                    'handling the message'),
+    cfg.IntOpt('platform_notify_queue_size',
+               default=1000,
+               help='Max pending stop alarm and binding notifications, '
+                    'new ones are dropped when full'),
 ]
 
 CONF.register_opts(notify_configs)
+CONF.import_opt('url_port', 'sentry.sender.http_sender')
+
+
+_ENDPOINTS = {}
+
+
+def _get_endpoint(url, request_uri):
+    """
+    Return the sender of a platform endpoint, shared by all notifications
+    to it since params are given per request.
+    """
+    endpoint = _ENDPOINTS.get((url, request_uri))
+    if endpoint is None:
+        headers = {'Content-type': 'application/x-www-form-urlencoded'}
+        endpoint = _ENDPOINTS.setdefault((url, request_uri),
+                http_communication.HttpCommunication(url, request_uri,
+                                                     headers, 'POST'))
+    return endpoint
+
+
+class PlatformNotifier(object):
+    """
+    Send stop alarm and binding notifications in background workers, so
+    that alarm handling never waits for the platform. Pending
+    notifications of the same kind for an instance are coalesced into
+    the latest one.
+    """
+    def __init__(self, workers=None, queue_size=None):
+        if workers is None:
+            workers = CONF.platform_notify_workers
+        if queue_size is None:
+            queue_size = CONF.platform_notify_queue_size
+        self.workers = workers
+        self.queue_size = queue_size
+        self._pending = {}
+        self._queue = queue.LightQueue()
+        self._threads = []
+        self._stats = {'submitted': 0, 'coalesced': 0, 'cancelled': 0,
+                       'dropped': 0, 'sent': 0, 'failed': 0}
+
+    def submit(self, key, func, message, merge=None):
+        """
+        Call func(message) later, replacing the pending call of key.
+        If merge is given, the pending message is replaced by
+        merge(pending_message, message) instead.
+        Return False if dropped because the queue is full.
+        """
+        self._stats['submitted'] += 1
+        if self.workers <= 0:
+            self._notify(func, message)
+            return True
+        if key in self._pending:
+            if merge is not None:
+                message = merge(self._pending[key][1], message)
+            self._pending[key] = (func, message)
+            self._stats['coalesced'] += 1
+            return True
+        if len(self._pending) >= self.queue_size:
+            self._stats['dropped'] += 1
+            LOG.warning(_("Too many pending platform notifications, drop "
+                          "%s") % str(key))
+            return False
+        self._pending[key] = (func, message)
+        self._queue.put(key)
+        self._start()
+        return True
+
+    def cancel(self, key):
+        if self._pending.pop(key, None) is not None:
+            self._stats['cancelled'] += 1
+
+    def _notify(self, func, message):
+        try:
+            func(message)
+            self._stats['sent'] += 1
+        except Exception:
+            self._stats['failed'] += 1
+            LOG.exception(_("Failed to notify platform of message: %s")
+                          % message)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            # NOTE(hzyangtk): keys coalesced or cancelled are gone
+            item = self._pending.pop(key, None)
+            if item is not None:
+                self._notify(*item)
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            self._threads.append(eventlet.spawn(self._run))
+
+    def stop(self):
+        for thread in self._threads:
+            thread.kill()
+        self._threads = []
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats['pending'] = len(self._pending)
+        return stats
+
+
+_NOTIFIER = None
+
 
+def get_notifier():
+    global _NOTIFIER
+    if _NOTIFIER is None:
+        _NOTIFIER = PlatformNotifier()
+    return _NOTIFIER
 
-def handle_before_alarm(message):
+
+def get_stats():
+    """
+    Return stats of the platform notifier, None if it is not used yet.
+    """
+    if _NOTIFIER is None:
+        return None
+    return _NOTIFIER.get_stats()
+
+
+def reset():
+    global _NOTIFIER
+    if _NOTIFIER is not None:
+        _NOTIFIER.stop()
+    _NOTIFIER = None
+
+
+def get_actions():
+    """
+    Return names of the enabled platform notifications.
+    """
+    actions = []
+    if CONF.enable_platform_stop_alarm:
+        actions.append('stop_alarm')
+    if CONF.enable_platform_binding:
+        actions.append('binding')
+    return frozenset(actions)
+
+
+def handle_before_alarm(message, actions=None):
     """
     handle process before alarm
     include: notify cloud monitor to stop alarm when VM
              was deleted.
              notify cloud monitor to bind alarm when VM
              was created or renamed.
+             refresh instance ip cache when VM was created,
+             updated or deleted.
+    :param actions: enabled notifications, from the config if None
     """
+    # NOTE(hzyangtk): instance lifecycle notifications keep the instance
+    #                 ip cache of sender fresh.
+    sender_handler.refresh_instance_ip_cache(message)
+
+    if actions is None:
+        actions = get_actions()
+    if not actions:
+        return
     event_type = message.get('event_type')
-    if CONF.enable_platform_stop_alarm:
+    notifier = get_notifier()
+    if 'stop_alarm' in actions:
         destroy_vm_notification = ['compute.instance.delete.end']
         if event_type in destroy_vm_notification:
-            _notify_platform_stop_alarm(message)
-    if CONF.enable_platform_binding:
+            instance_id = message.get('payload').get('instance_id')
+            # NOTE(hzyangtk): binding a deleted instance is useless
+            notifier.cancel(('binding', instance_id))
+            notifier.submit(('stop_alarm', instance_id),
+                            _notify_platform_stop_alarm, message)
+    if 'binding' in actions:
         create_vm_notification = ['compute.instance.create.end']
         change_vm_name_notification = ['compute.instance.update']
         if event_type in create_vm_notification:
-            _notify_platform_binding(message)
+            instance_id = message.get('payload').get('instance_id')
+            notifier.submit(('binding', instance_id),
+                            _notify_platform_binding, message,
+                            merge=_merge_binding)
         elif event_type in change_vm_name_notification:
             old_display_name = message.get('payload').get('old_display_name')
             display_name = message.get('payload').get('display_name')
             if (old_display_name != display_name and
                                         old_display_name is not None):
-                _notify_platform_binding(message)
+                instance_id = message.get('payload').get('instance_id')
+                notifier.submit(('binding', instance_id),
+                                _notify_platform_binding, message,
+                                merge=_merge_binding)
+
+
+def _merge_binding(pending, message):
+    """
+    Coalesce two binding messages of an instance. Update notifications
+    of a rename carry no ip info, keep the one of a pending create.
+    """
+    if message.get('payload').get('fixed_ips'):
+        return message
+    fixed_ips = pending.get('payload').get('fixed_ips')
+    if not fixed_ips:
+        return message
+    merged = dict(message)
+    merged['payload'] = dict(message['payload'], fixed_ips=fixed_ips)
+    return merged
 
 
 def _notify_platform_stop_alarm(message):
@@ -67,10 +256,6 @@ def _notify_platform_stop_alarm(message):
     Notify platform to stop alarm when instance was deleted
     """
     LOG.debug(_("Begin notify platform stop alarm. Message is: %s") % message)
-    url = CONF.stop_alarm_url_port
-    request_uri = CONF.stop_alarm_request_uri
-    headers = {'Content-type': 'application/x-www-form-urlencoded'}
-    httpMethod = 'POST'
     project_id = message.get('payload').get('tenant_id')
     namespace = 'openstack'
     dimension = 'openstack=' + message.get('payload').get('instance_id')
@@ -79,9 +264,10 @@ def _notify_platform_stop_alarm(message):
                    'Namespace': namespace,
                    'Dimension': dimension
     }
-    send_notification = http_communication.HttpCommunication(url,
-                        request_uri, headers, httpMethod, params_dict)
-    response = send_notification.send_request_to_server()
+    send_notification = _get_endpoint(CONF.stop_alarm_url_port,
+                                      CONF.stop_alarm_request_uri)
+    response = send_notification.send_request_to_server(
+                                                    params_dict=params_dict)
     if response == None:
         LOG.warning(_("Notify platform binding error occurs"))
         return
@@ -97,10 +283,6 @@ def _notify_platform_binding(message):
     Notify platform to binding vm`s UUID to instance_id
     """
     LOG.debug(_("Begin notify platform binding. Message is: %s") % message)
-    url = CONF.alarm_binding_url_port
-    request_uri = CONF.alarm_binding_request_uri
-    headers = {'Content-type': 'application/x-www-form-urlencoded'}
-    httpMethod = 'POST'
     project_id = message.get('payload').get('tenant_id')
     namespace = 'openstack'
     instance_id = message.get('payload').get('instance_id')
@@ -122,9 +304,10 @@ def _notify_platform_binding(message):
                    'Dimension': dimension,
                    'ScreenName': screen_name
                    }
-    send_notification = http_communication.HttpCommunication(url,
-                        request_uri, headers, httpMethod, params_dict)
-    response = send_notification.send_request_to_server()
+    send_notification = _get_endpoint(CONF.alarm_binding_url_port,
+                                      CONF.alarm_binding_request_uri)
+    response = send_notification.send_request_to_server(
+                                                    params_dict=params_dict)
     if response == None:
         LOG.warning(_("Notify platform binding error occurs"))
         return
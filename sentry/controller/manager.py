@@ -7,10 +7,21 @@
 import eventlet
 from eventlet import greenpool
 
+from sentry.common import circuit_breaker
+from sentry.common import file_watcher
+from sentry.common import retry_scheduler
+from sentry.common import service
+from sentry.controller import dispatcher
 from sentry.controller import handler
+from sentry.controller import helper
 from sentry.openstack.common import cfg
 from sentry.openstack.common import log
 from sentry.openstack.common import rpc
+from sentry.sender import dedup
+from sentry.sender import handler as sender_handler
+from sentry.sender import http_sender
+from sentry.sender import inventory
+from sentry.sender import outbox
 
 """
     Sentry listenning on rabbitmq and receive notification
@@ -38,6 +49,30 @@ manager_configs = [
     cfg.ListOpt('glance_mq_level_list',
                 default=['error', 'info', 'warn', ],
                 help='notifications levels for message queue of glance'),
+    cfg.IntOpt('nova_mq_prefetch_count',
+               default=64,
+               help='Max number of unacked messages per nova queue, '
+                    '0 for no limit'),
+    cfg.IntOpt('glance_mq_prefetch_count',
+               default=64,
+               help='Max number of unacked messages per glance queue, '
+                    '0 for no limit'),
+    cfg.IntOpt('mq_ack_batch_size',
+               default=1,
+               help='Number of messages acked together, 1 to ack each '
+                    'message once handled'),
+    cfg.FloatOpt('mq_ack_batch_interval',
+                 default=1.0,
+                 help='Max seconds a handled message waits for batch ack'),
+    cfg.IntOpt('controller_workers',
+               default=0,
+               help='Number of forked controller processes, each with '
+                    'its own AMQP connection, 0 to run in one process'),
+    cfg.BoolOpt('controller_queue_sharding',
+                default=True,
+                help='Spread queues across controller processes, so '
+                     'messages of a queue are handled in order. If '
+                     'false, all processes compete on every queue'),
 ]
 
 
@@ -48,8 +83,38 @@ LOG = log.getLogger(__name__)
 
 class Manager(object):
 
-    def __init__(self):
+    def __init__(self, worker_index=0, worker_count=1):
+        self.worker_index = worker_index
+        self.worker_count = worker_count
         self.conn = rpc.create_connection(new=True)
+        self.handler = None
+        self.dispatcher = None
+        self.consumer_thread = None
+
+    def get_queues(self):
+        '''
+            Return (exchange, topic, queue, prefetch) of the queues
+            consumed by this worker.
+        '''
+        queues = []
+        for level in CONF.nova_mq_level_list:
+            queues.append(('nova', CONF.nova_sentry_mq_topic,
+                           self.get_queue_name(CONF.nova_sentry_mq_topic,
+                                               level),
+                           CONF.nova_mq_prefetch_count))
+        for level in CONF.glance_mq_level_list:
+            queues.append(('glance', CONF.glance_sentry_mq_topic,
+                           self.get_queue_name(CONF.glance_sentry_mq_topic,
+                                               level),
+                           CONF.glance_mq_prefetch_count))
+
+        if self.worker_count <= 1 or not CONF.controller_queue_sharding:
+            return queues
+        # NOTE(hzyangtk): with more workers than queues, several workers
+        #                 compete on the same queue.
+        shards = min(self.worker_count, len(queues))
+        return [queue for index, queue in enumerate(queues)
+                if index % shards == self.worker_index % shards]
 
     def serve(self):
         """
@@ -60,39 +125,87 @@ class Manager(object):
             "notifications.info"
         """
         LOG.info('Start sentry')
-        nova_topic = CONF.nova_sentry_mq_topic
-        glance_topic = CONF.glance_sentry_mq_topic
-        controller_hanler = handler.Handler()
-
-        LOG.info('Listening on topic: "%s"' % nova_topic)
-        # NOTE(hzyangtk): declare consumer binding on nova exchange
-        for nova_level in CONF.nova_mq_level_list:
-            nova_queue = self.get_queue_name(nova_topic, nova_level)
+        self.handler = handler.Handler()
+        # NOTE(hzyangtk): messages are handled concurrently by dispatcher
+        #                 lanes, and acked after handled.
+        self.dispatcher = dispatcher.Dispatcher(
+                                self.handler.handle_message)
+
+        # NOTE(hzyangtk): ack handled messages in batches with one
+        #                 multiple ack when mq_ack_batch_size > 1.
+        self.conn.set_ack_batch(CONF.mq_ack_batch_size,
+                                CONF.mq_ack_batch_interval)
+
+        for exchange, topic, queue_name, prefetch in self.get_queues():
+            # NOTE(hzyangtk): declare consumer binding on nova or glance
+            #                 exchange
             self.conn.declare_topic_consumer(
-                    topic=nova_topic,
-                    callback=controller_hanler.handle_message,
-                    queue_name=nova_queue,
-                    exchange_name='nova')
-            LOG.debug(_("Listening on the queue: %s") % nova_queue)
-
-        LOG.info('Listening on topic: "%s"' % glance_topic)
-        # NOTE(hzyangtk): declare consumer binding on glance exchange
-        for glance_level in CONF.glance_mq_level_list:
-            glance_queue = self.get_queue_name(glance_topic, glance_level)
-            self.conn.declare_topic_consumer(
-                    topic=glance_topic,
-                    callback=controller_hanler.handle_message,
-                    queue_name=glance_queue,
-                    exchange_name='glance')
-            LOG.debug(_("Listening on the queue: %s") % glance_queue)
-
-        self.conn.consume_in_thread()
+                    topic=topic,
+                    callback=self.dispatcher.dispatch,
+                    queue_name=queue_name,
+                    exchange_name=exchange,
+                    manual_ack=True,
+                    prefetch_count=prefetch)
+            LOG.info(_("Listening on the queue: %s") % queue_name)
+
+        if CONF.enable_instance_inventory:
+            LOG.info('Start instance inventory refresh')
+            inventory.get_inventory().start()
+
+        # NOTE(hzyangtk): replay alarms spooled while the alarm system
+        #                 was unreachable.
+        spool = outbox.init_outbox(self.worker_index, self.worker_count)
+        if spool is not None:
+            spool.start(http_sender.replay_alarm)
+
+        # NOTE(hzyangtk): watch rule files registered by filters
+        file_watcher.get_watcher().start()
+
+        self.register_stats()
+        service.start_stats_log()
+
+        self.consumer_thread = self.conn.consume_in_thread()
+
+    def register_stats(self):
+        '''
+            Register stats of this worker, logged with its health.
+        '''
+        service.register_stats('instance_ip_cache',
+                               sender_handler.get_instance_ip_cache_stats)
+        service.register_stats('http_retry',
+                               retry_scheduler.SCHEDULER.get_stats)
+        service.register_stats('http_circuit', circuit_breaker.get_stats)
+        service.register_stats('platform_notifier', helper.get_stats)
+        service.register_stats('alarm_dedup', dedup.get_stats)
+        service.register_stats('alarm_outbox', outbox.get_stats)
+        if self.dispatcher is not None:
+            service.register_stats('dispatcher', self.dispatcher.get_stats)
+        if self.handler is not None:
+            service.register_stats('filter_reload',
+                                   self.handler.get_reload_stats)
 
     def create(self):
         return eventlet.spawn(self.serve())
 
+    def start(self):
+        self.serve()
+
+    def wait(self):
+        if self.consumer_thread is not None:
+            self.consumer_thread.wait()
+
+    def stop(self):
+        self.cleanup()
+
     def cleanup(self):
         LOG.info('Cleanup sentry')
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+        inventory.reset()
+        helper.reset()
+        outbox.reset()
+        file_watcher.reset()
+        service.reset_stats()
         rpc.cleanup()
 
     def get_queue_name(self, topic, level):
@@ -4,10 +4,8 @@
 #    @author: hzyangtk@corp.netease.com
 #
 
-import os
-
 from sentry.common import exception
-from sentry.common import utils
+from sentry.common import file_watcher
 from sentry.openstack.common import cfg
 from sentry.openstack.common import jsonutils
 
@@ -22,40 +20,24 @@ alarm_content_opts = [
 FLAGS = cfg.CONF
 FLAGS.register_opts(alarm_content_opts)
 
-_ALARM_CONTENT_PATH = None
-_ALARM_CONTENT_CACHE = {}
-_ALARM_CONTENT_DICT = {}
-
-
-def reset():
-    global _ALARM_CONTENT_PATH
-    global _ALARM_CONTENT_CACHE
-    _ALARM_CONTENT_PATH = None
-    _ALARM_CONTENT_CACHE = {}
-
-
-def init():
-    global _ALARM_CONTENT_PATH
-    global _ALARM_CONTENT_CACHE
-    if not _ALARM_CONTENT_PATH:
-        _ALARM_CONTENT_PATH = FLAGS.alarm_content_file
-        if not os.path.exists(_ALARM_CONTENT_PATH):
-            _ALARM_CONTENT_PATH = FLAGS.find_file(_ALARM_CONTENT_PATH)
-        if not _ALARM_CONTENT_PATH:
-            raise exception.ConfigNotFound(path=FLAGS.alarm_content_file)
-    utils.read_cached_file(_ALARM_CONTENT_PATH, _ALARM_CONTENT_CACHE,
-                           reload_func=_load_alarm_content)
-
 
 def _load_alarm_content(data):
-    global _ALARM_CONTENT_DICT
     try:
-        _ALARM_CONTENT_DICT = jsonutils.loads(data)
+        return jsonutils.loads(data)
     except ValueError:
         raise exception.Invalid()
 
 
+_ALARM_CONTENT = file_watcher.WatchedFile('alarm_content_file',
+                                          _load_alarm_content)
+
+
+def reset():
+    _ALARM_CONTENT.reset()
+
+
 def get_alarm_content():
-    global _ALARM_CONTENT_DICT
-    init()
-    return _ALARM_CONTENT_DICT
+    """
+    Return the parsed snapshot, callers must copy it before changing.
+    """
+    return _ALARM_CONTENT.get()
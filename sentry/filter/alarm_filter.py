@@ -38,8 +38,10 @@ class AlarmFilter(Filter):
     def init_filter(self):
         json_data = open(CONF.alarm_filter_config, 'r').read()
         dict_data = json.loads(json_data)
-        self.filter_reject_rule = dict_data['sentry_reject_levels']
-        self.filter_accept_rule = dict_data['sentry_accept_levels']
+        reject_rule = dict_data['sentry_reject_levels']
+        accept_rule = dict_data['sentry_accept_levels']
+        self.filter_reject_rule = reject_rule
+        self.filter_accept_rule = accept_rule
 
     def register_filter(self):
         self.filters = []
@@ -53,6 +55,13 @@ class AlarmFilter(Filter):
             flow_data = filter_func(flow_data)
         return flow_data
 
+    def get_rule_files(self):
+        return [CONF.alarm_filter_config]
+
+    def get_rule_types(self):
+        return self._merge_rule_types(self.filter_reject_rule,
+                                      self.filter_accept_rule)
+
     def _reject_filter(self, flow_data):
         """black list"""
         if flow_data['alarm_level'] in self.filter_reject_rule:
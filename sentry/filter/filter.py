@@ -25,3 +25,32 @@ class Filter(object):
     @abstractmethod
     def filter(self):
         pass
+
+    def get_rule_files(self):
+        """
+        Return the rule files, the filter is reloaded when they change.
+        """
+        return []
+
+    def reload(self):
+        """
+        Load the rules again. init_filter() should parse the whole file
+        before replacing any rule, so that the old rules are kept when
+        loading fails and a half loaded rule set is never seen.
+        """
+        self.init_filter()
+
+    def get_rule_types(self):
+        """
+        Return a dict of alarm level to the alarm types named by the
+        rules, or None if the result of filter() depends on more than
+        membership in the rules, so that it can not be compiled.
+        """
+        return None
+
+    def _merge_rule_types(self, *rules):
+        rule_types = {}
+        for rule in rules:
+            for level, alarm_types in rule.iteritems():
+                rule_types.setdefault(level, set()).update(alarm_types)
+        return rule_types
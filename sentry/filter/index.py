@@ -0,0 +1,98 @@
+#
+# Created on 2013-4-17
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+from sentry.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+
+# NOTE(hzyangtk): stands for any alarm level or alarm type not named by
+#                 the rules, filters treat all of them the same way.
+_UNKNOWN = object()
+
+
+class FilterIndex(object):
+    '''
+        The whole filter chain compiled into one dict.
+
+        Filters only test membership of alarm level and alarm type in
+        their rules, so every type not named by the rules behaves the
+        same within a level, and every level not named behaves the same.
+        The chain is run once per named (level, type) pair, per named
+        level and for the unknown level at build time, and the results,
+        None for rejected or the tuple of owners, are kept.
+    '''
+    def __init__(self, drivers):
+        self.drivers = drivers
+        self._index = {}
+        self._build()
+
+    @classmethod
+    def build(cls, drivers):
+        '''
+            Return the index of drivers, or None if one of them can not
+            be compiled.
+        '''
+        for driver in drivers:
+            get_rule_types = getattr(driver, 'get_rule_types', None)
+            if get_rule_types is None or get_rule_types() is None:
+                LOG.info(_("Filter %s can not be compiled, run filter "
+                           "chain for each message") % driver)
+                return None
+        return cls(drivers)
+
+    def _run(self, alarm_level, alarm_type):
+        flow_data = {'alarm_type': alarm_type,
+                     'alarm_level': alarm_level,
+                     'alarm_owner': []}
+        # NOTE(hzyangtk): filters after a rejecting one raise on None,
+        #                 which is expected here.
+        for driver in self.drivers:
+            try:
+                flow_data = driver.filter(flow_data)
+            except Exception:
+                pass
+        if flow_data is None:
+            return None
+        return tuple(flow_data['alarm_owner'])
+
+    def _build(self):
+        rule_types = {}
+        for driver in self.drivers:
+            for level, alarm_types in driver.get_rule_types().iteritems():
+                rule_types.setdefault(level, set()).update(alarm_types)
+
+        for level, alarm_types in rule_types.iteritems():
+            self._index[(level, _UNKNOWN)] = self._run(level, _UNKNOWN)
+            for alarm_type in alarm_types:
+                self._index[(level, alarm_type)] = self._run(level,
+                                                             alarm_type)
+        self._index[(_UNKNOWN, _UNKNOWN)] = self._run(_UNKNOWN, _UNKNOWN)
+        LOG.debug(_("Compiled %(count)d filter rules of %(levels)d "
+                    "levels") % {'count': len(self._index),
+                                 'levels': len(rule_types)})
+
+    def lookup(self, alarm_level, alarm_type):
+        '''
+            Return None if the alarm is rejected, else tuple of owners.
+        '''
+        try:
+            return self._index[(alarm_level, alarm_type)]
+        except KeyError:
+            pass
+        try:
+            return self._index[(alarm_level, _UNKNOWN)]
+        except KeyError:
+            return self._index[(_UNKNOWN, _UNKNOWN)]
+
+    def filter(self, flow_data):
+        owners = self.lookup(flow_data['alarm_level'],
+                             flow_data['alarm_type'])
+        if owners is None:
+            return None
+        flow_data['alarm_owner'] = flow_data['alarm_owner'] + list(owners)
+        return flow_data
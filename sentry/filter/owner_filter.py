@@ -38,14 +38,18 @@ class OwnerFilter(Filter):
     def init_filter(self):
         json_data = open(CONF.owner_filter_config, 'r').read()
         dict_data = json.loads(json_data)
-        self.product_manager_blacklist_rule = \
+        product_manager_blacklist_rule = \
                                 dict_data['product_manager_blacklist']
-        self.platform_manager_blacklist_rule = \
+        platform_manager_blacklist_rule = \
                                 dict_data['platform_manager_blacklist']
-        self.product_manager_whitelist_rule = \
+        product_manager_whitelist_rule = \
                                 dict_data['product_manager_whitelist']
-        self.platform_manager_whitelist_rule = \
+        platform_manager_whitelist_rule = \
                                 dict_data['platform_manager_whitelist']
+        self.product_manager_blacklist_rule = product_manager_blacklist_rule
+        self.platform_manager_blacklist_rule = platform_manager_blacklist_rule
+        self.product_manager_whitelist_rule = product_manager_whitelist_rule
+        self.platform_manager_whitelist_rule = platform_manager_whitelist_rule
 
     def register_filter(self):
         self.filters = []
@@ -61,6 +65,15 @@ class OwnerFilter(Filter):
             flow_data = filter_func(flow_data)
         return flow_data
 
+    def get_rule_files(self):
+        return [CONF.owner_filter_config]
+
+    def get_rule_types(self):
+        return self._merge_rule_types(self.product_manager_blacklist_rule,
+                                      self.platform_manager_blacklist_rule,
+                                      self.product_manager_whitelist_rule,
+                                      self.platform_manager_whitelist_rule)
+
     def _product_manager_blacklist_filter(self, flow_data):
         """
         When the level not appear in the product manager level rule,
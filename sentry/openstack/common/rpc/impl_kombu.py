@@ -14,6 +14,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import functools
 import itertools
 import socket
@@ -100,9 +101,17 @@ class ConsumerBase(object):
 
         queue name, exchange name, and other kombu options are
         passed in here as a dictionary.
+
+        If 'manual_ack' is True, the callback is called with the message
+        and its ack function, and becomes responsible for acking it.
+        If 'prefetch_count' is set, the broker delivers at most that
+        many unacked messages to this consumer.
         """
         self.callback = callback
         self.tag = str(tag)
+        self.manual_ack = kwargs.pop('manual_ack', False)
+        self.prefetch_count = kwargs.pop('prefetch_count', None)
+        self.ack_batcher = None
         self.kwargs = kwargs
         self.queue = None
         self.reconnect(channel)
@@ -127,7 +136,8 @@ class ConsumerBase(object):
         a message is read.
 
         Messages will automatically be acked if the callback doesn't
-        raise an exception
+        raise an exception, unless the consumer was declared with
+        manual_ack.
         """
 
         options = {'consumer_tag': self.tag}
@@ -138,12 +148,34 @@ class ConsumerBase(object):
 
         def _callback(raw_message):
             message = self.channel.message_to_python(raw_message)
+            ack = message.ack
+            batcher = self.ack_batcher
+            if batcher is not None:
+                batcher.track(message.delivery_tag)
+                finished = []
+
+                def ack():
+                    if not finished:
+                        finished.append(True)
+                        batcher.ack(message.delivery_tag)
             try:
-                callback(message.payload)
-                message.ack()
+                if self.manual_ack:
+                    callback(message.payload, ack)
+                else:
+                    callback(message.payload)
+                    ack()
             except Exception:
                 LOG.exception(_("Failed to process message... skipping it."))
-
+                # NOTE(hzyangtk): a tracked message must be finished even
+                #                 if skipped, or the batcher never acks
+                #                 past it.
+                if batcher is not None:
+                    ack()
+
+        if self.prefetch_count:
+            # NOTE(hzyangtk): qos applies to consumers started after it
+            #                 on the channel.
+            self.channel.basic_qos(0, self.prefetch_count, False)
         self.queue.consume(*args, callback=_callback, **options)
 
     def cancel(self):
@@ -257,6 +289,75 @@ class FanoutConsumer(ConsumerBase):
                                              **options)
 
 
+class AckBatcher(object):
+    """Ack messages of a channel in batches with basic_ack(multiple=True).
+
+    Delivery tags grow in delivery order on a channel and a multiple ack
+    covers every unacked tag up to the given one, so only the highest
+    tag below which all delivered messages finished is acked.  Acks are
+    flushed once batch_size messages are pending or after interval
+    seconds.
+    """
+
+    def __init__(self, channel, batch_size, interval):
+        self.channel = channel
+        self.batch_size = batch_size
+        self.interval = interval
+        self._delivered = collections.deque()
+        self._finished = set()
+        self._pending = 0
+        self._last_tag = None
+        self._timer = None
+        self._discarded = False
+
+    def track(self, delivery_tag):
+        """Record a delivered message, in delivery order"""
+        self._delivered.append(delivery_tag)
+
+    def ack(self, delivery_tag):
+        """Mark a message finished, ack when a batch is ready"""
+        if self._discarded:
+            return
+        self._finished.add(delivery_tag)
+        while self._delivered and self._delivered[0] in self._finished:
+            self._last_tag = self._delivered.popleft()
+            self._finished.discard(self._last_tag)
+            self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+        elif self._pending and self._timer is None:
+            self._timer = eventlet.spawn_after(self.interval,
+                                               self._flush_on_timer)
+
+    def _flush_on_timer(self):
+        self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            LOG.exception(_("Failed to ack messages in batch"))
+
+    def flush(self):
+        """Ack all pending messages with one multiple ack"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            self._pending = 0
+            self.channel.basic_ack(self._last_tag, multiple=True)
+
+    def discard(self):
+        """Drop pending acks, their delivery tags are invalid once the
+        channel is closed and the broker redelivers those messages.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._discarded = True
+        self._delivered.clear()
+        self._finished.clear()
+        self._pending = 0
+
+
 class Publisher(object):
     """Base Publisher class"""
 
@@ -357,6 +458,9 @@ class Connection(object):
     def __init__(self, conf, server_params=None):
         self.consumers = []
         self.consumer_thread = None
+        self.ack_batch_size = 1
+        self.ack_batch_interval = None
+        self.ack_batcher = None
         self.conf = conf
         self.max_retries = self.conf.rabbit_max_retries
         # Try forever?
@@ -450,6 +554,7 @@ class Connection(object):
         # work around 'memory' transport bug in 1.1.3
         if self.memory_transport:
             self.channel._new_queue('ae.undeliver')
+        self._reset_ack_batcher()
         for consumer in self.consumers:
             consumer.reconnect(self.channel)
         LOG.info(_('Connected to AMQP server on %(hostname)s:%(port)d'),
@@ -528,6 +633,27 @@ class Connection(object):
                 error_callback(e)
             self.reconnect()
 
+    def _reset_ack_batcher(self):
+        """Delivery tags are per channel, batch acks on a new channel"""
+        if self.ack_batcher is not None:
+            self.ack_batcher.discard()
+        self.ack_batcher = None
+        # NOTE(hzyangtk): memory transport can't ack multiple messages
+        if self.ack_batch_size > 1 and not self.memory_transport:
+            self.ack_batcher = AckBatcher(self.channel,
+                                          self.ack_batch_size,
+                                          self.ack_batch_interval)
+        for consumer in self.consumers:
+            consumer.ack_batcher = self.ack_batcher
+
+    def set_ack_batch(self, batch_size, interval):
+        """Ack messages of this connection in batches of batch_size,
+        pending acks are flushed after interval seconds at the latest.
+        """
+        self.ack_batch_size = batch_size
+        self.ack_batch_interval = interval
+        self._reset_ack_batcher()
+
     def get_channel(self):
         """Convenience call for bin/clear_rabbit_queues"""
         return self.channel
@@ -547,6 +673,7 @@ class Connection(object):
         if self.memory_transport:
             self.channel._new_queue('ae.undeliver')
         self.consumers = []
+        self._reset_ack_batcher()
 
     def declare_consumer(self, consumer_cls, topic, callback):
         """Create a Consumer using the class that was passed in and
@@ -561,6 +688,7 @@ class Connection(object):
         def _declare_consumer():
             consumer = consumer_cls(self.conf, self.channel, topic, callback,
                                     self.consumer_num.next())
+            consumer.ack_batcher = self.ack_batcher
             self.consumers.append(consumer)
             return consumer
 
@@ -628,11 +756,14 @@ class Connection(object):
         self.declare_consumer(DirectConsumer, topic, callback)
 
     def declare_topic_consumer(self, topic, callback=None, queue_name=None,
-                               exchange_name=None):
+                               exchange_name=None, manual_ack=False,
+                               prefetch_count=None):
         """Create a 'topic' consumer."""
         self.declare_consumer(functools.partial(TopicConsumer,
                                                 name=queue_name,
                                                 exchange_name=exchange_name,
+                                                manual_ack=manual_ack,
+                                                prefetch_count=prefetch_count,
                                                 ),
                               topic, callback)
 
@@ -0,0 +1,121 @@
+#
+# Created on 2013-4-19
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+from sentry.openstack.common import log
+
+"""
+    Classify alarm messages by the "alarm_event_type" section of
+    alarm_content.json, compiled into an event_type dispatch table.
+
+    An alarm type maps to a list of event types:
+        "NbsError": ["api_nbs.nvs_connect_nbs_failure"]
+    or to a dict, to plug in an alarm type with an existing formatter
+    and payload predicates:
+        "InstanceSuspendError": {
+            "event_types": ["compute.instance.update"],
+            "formatter": "InstanceError",
+            "payload": {"state": "suspended"}
+        }
+"""
+
+
+LOG = log.getLogger(__name__)
+
+# NOTE(hzyangtk): alarm types checked first when an event type belongs
+#                 to several of them, others follow in name order.
+ALARM_TYPE_ORDER = ['InstanceOffLine', 'InstanceError', 'NosError',
+                    'NbsError']
+DEFAULT_PAYLOAD_PREDICATES = {'InstanceError': {'state': 'error'}}
+
+
+def _sort_key(alarm_type):
+    if alarm_type in ALARM_TYPE_ORDER:
+        return (0, ALARM_TYPE_ORDER.index(alarm_type))
+    return (1, alarm_type)
+
+
+def _match_payload(message, predicates):
+    if not predicates:
+        return True
+    payload = message.get('payload')
+    if not isinstance(payload, dict):
+        return False
+    for key, value in predicates.iteritems():
+        if payload.get(key) != value:
+            return False
+    return True
+
+
+class AlarmClassifier(object):
+    '''
+        Dispatch table of event_type to a list of (alarm type,
+        formatter name, payload predicates), in precedence order.
+    '''
+    def __init__(self, alarm_event_type, formatters):
+        '''
+            :param alarm_event_type: alarm_event_type section of
+                                     alarm_content.json
+            :param formatters: names of alarm types with a formatter
+        '''
+        self._table = {}
+        for alarm_type in sorted(alarm_event_type, key=_sort_key):
+            rule = alarm_event_type[alarm_type]
+            if isinstance(rule, dict):
+                event_types = rule.get('event_types', [])
+                formatter = rule.get('formatter', alarm_type)
+                predicates = rule.get('payload')
+            else:
+                event_types = rule
+                formatter = alarm_type
+                predicates = None
+            if predicates is None:
+                predicates = DEFAULT_PAYLOAD_PREDICATES.get(alarm_type)
+
+            if formatter not in formatters:
+                if event_types:
+                    LOG.warning(_("No formatter %(formatter)s for alarm "
+                                  "type %(alarm_type)s, skip it")
+                                % locals())
+                continue
+            for event_type in event_types:
+                self._table.setdefault(event_type, []).append(
+                                    (alarm_type, formatter, predicates))
+
+    def classify(self, message):
+        '''
+            Return (alarm type, formatter name) of the message, or None
+            if the message is not an alarm.
+        '''
+        candidates = self._table.get(message.get('event_type'), [])
+        for alarm_type, formatter, predicates in candidates:
+            if _match_payload(message, predicates):
+                return alarm_type, formatter
+        return None
+
+
+_CLASSIFIER = None
+_CLASSIFIER_CONTENT = None
+
+
+def get_classifier(content, formatters):
+    '''
+        Return classifier of the alarm content, compiled again only
+        when the alarm content file was reloaded.
+    '''
+    global _CLASSIFIER
+    global _CLASSIFIER_CONTENT
+    if _CLASSIFIER is None or _CLASSIFIER_CONTENT is not content:
+        _CLASSIFIER = AlarmClassifier(content.get('alarm_event_type', {}),
+                                      formatters)
+        _CLASSIFIER_CONTENT = content
+    return _CLASSIFIER
+
+
+def reset():
+    global _CLASSIFIER
+    global _CLASSIFIER_CONTENT
+    _CLASSIFIER = None
+    _CLASSIFIER_CONTENT = None
@@ -0,0 +1,127 @@
+#
+# Created on 2013-4-20
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import copy
+
+import eventlet
+
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+CONF = cfg.CONF
+
+dedup_configs = [
+    cfg.IntOpt('alarm_dedup_window',
+               default=0,
+               help='Seconds repeats of an alarm are suppressed and '
+                    'aggregated after it was sent, 0 to send every alarm'),
+]
+
+CONF.register_opts(dedup_configs)
+
+
+def get_dedup_key(format_data, alarm_owner):
+    return (format_data['projectId'], format_data['namespace'],
+            format_data['alarmType'], format_data['identifier'],
+            tuple(sorted(alarm_owner)))
+
+
+class AlarmDeduplicator(object):
+    '''
+        Send the first alarm of a key at once and count its repeats
+        during the window. When the window closes with repeats, one
+        aggregated alarm carrying the repeat count is sent and a new
+        window opens, so an alarm storm costs one alarm per window.
+    '''
+    def __init__(self, window=None):
+        if window is None:
+            window = CONF.alarm_dedup_window
+        self.window = window
+        self._windows = {}
+        self._stats = {'sent': 0, 'suppressed': 0, 'aggregated': 0}
+
+    def submit(self, key, format_data, send_func):
+        '''
+            Send format_data by send_func(format_data) unless it repeats
+            an alarm sent in the window. Return True if sent at once.
+        '''
+        if self.window <= 0:
+            send_func(format_data)
+            self._stats['sent'] += 1
+            return True
+
+        window = self._windows.get(key)
+        if window is not None:
+            window['repeats'] += 1
+            window['format_data'] = format_data
+            window['send_func'] = send_func
+            self._stats['suppressed'] += 1
+            return False
+
+        self._windows[key] = {'repeats': 0,
+                              'format_data': format_data,
+                              'send_func': send_func}
+        eventlet.spawn_after(self.window, self._close_window, key)
+        send_func(format_data)
+        self._stats['sent'] += 1
+        return True
+
+    def _close_window(self, key):
+        window = self._windows.get(key)
+        if window is None:
+            return
+        if not window['repeats']:
+            del self._windows[key]
+            return
+
+        format_data = self._aggregate(window['format_data'],
+                                      window['repeats'])
+        window['repeats'] = 0
+        eventlet.spawn_after(self.window, self._close_window, key)
+        try:
+            window['send_func'](format_data)
+            self._stats['aggregated'] += 1
+        except Exception:
+            LOG.exception(_("Failed to send aggregated alarm %s")
+                          % str(format_data))
+
+    def _aggregate(self, format_data, repeats):
+        format_data = copy.copy(format_data)
+        format_data['alarmContent'] = '%s (repeated %d times in %d seconds)' \
+                    % (format_data['alarmContent'], repeats, self.window)
+        return format_data
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats['windows'] = len(self._windows)
+        return stats
+
+
+_DEDUPLICATOR = None
+
+
+def get_deduplicator():
+    global _DEDUPLICATOR
+    if _DEDUPLICATOR is None:
+        _DEDUPLICATOR = AlarmDeduplicator()
+    return _DEDUPLICATOR
+
+
+def get_stats():
+    '''
+        Return stats of the deduplicator, None if dedup is disabled.
+    '''
+    deduplicator = get_deduplicator()
+    if deduplicator.window <= 0:
+        return None
+    return deduplicator.get_stats()
+
+
+def reset():
+    global _DEDUPLICATOR
+    _DEDUPLICATOR = None
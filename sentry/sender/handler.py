@@ -6,65 +6,104 @@
 
 import time
 
+from sentry.common import cache
 from sentry.common import utils
 from sentry.common import novaclient_helper
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+from sentry.sender import inventory
 
 
-def is_instance_down(message, alarm_content):
-    alarm_event_type = alarm_content.get('alarm_event_type', {})
-    if message.get('event_type') in alarm_event_type.get('InstanceOffLine',
-                                                         []):
-        return True
-    else:
-        return False
+handler_configs = [
+    cfg.IntOpt('instance_ip_cache_size',
+               default=10000,
+               help='Max number of instance ips cached, 0 to disable'),
+    cfg.IntOpt('instance_ip_cache_ttl',
+               default=3600,
+               help='Seconds an instance ip stays in cache'),
+]
 
 
-def is_instance_state_error(message, alarm_content):
-    alarm_event_type = alarm_content.get('alarm_event_type', {})
-    if message.get('event_type') in alarm_event_type.get('InstanceError',
-                                                         []):
-        if message.get('payload').get('state') == 'error':
-            return True
-    return False
+CONF = cfg.CONF
+CONF.register_opts(handler_configs)
+LOG = log.getLogger(__name__)
+INSTANCE_IP_NOTIFICATIONS = ['compute.instance.create.end',
+                             'compute.instance.update',
+                             'compute.instance.delete.end']
 
+_INSTANCE_IP_CACHE = None
 
-def is_nos_connection_failure(message, alarm_content):
-    alarm_event_type = alarm_content.get('alarm_event_type', {})
-    if message.get('event_type') in alarm_event_type.get('NosError',
-                                                         []):
-        return True
-    else:
-        return False
 
+def _get_instance_ip_cache():
+    global _INSTANCE_IP_CACHE
+    if _INSTANCE_IP_CACHE is None:
+        _INSTANCE_IP_CACHE = cache.LRUCache(CONF.instance_ip_cache_size,
+                                            CONF.instance_ip_cache_ttl)
+    return _INSTANCE_IP_CACHE
 
-def is_nbs_connection_failure(message, alarm_content):
-    alarm_event_type = alarm_content.get('alarm_event_type', {})
-    if message.get('event_type') in alarm_event_type.get('NbsError',
-                                                         []):
-        return True
-    else:
-        return False
 
+def reset_instance_ip_cache():
+    global _INSTANCE_IP_CACHE
+    _INSTANCE_IP_CACHE = None
 
-def is_other_alarm(message, alarm_content):
-    return False
+
+def get_instance_ip_cache_stats():
+    return _get_instance_ip_cache().get_stats()
 
 
 def get_instance_ip(instance_uuid):
     if instance_uuid == None:
         return '-'
-    # NOTE(hzyangtk): call nova client to get isntance detail info
-    call_nova_client = novaclient_helper.CallNovaClient()
-    instance = call_nova_client.get_instance_by_UUID(instance_uuid)
+    ip_cache = _get_instance_ip_cache()
+    instance_ip = ip_cache.get(instance_uuid)
+    if instance_ip is not None:
+        return instance_ip
+
+    # NOTE(hzyangtk): instance inventory snapshot answers most lookups
+    #                 during alarm storm, nova api only for a miss.
+    instance_info = inventory.lookup(instance_uuid)
+    if instance_info is not None:
+        instance_ip = instance_info[0]
+    else:
+        # NOTE(hzyangtk): call nova client to get isntance detail info
+        with novaclient_helper.get_client_pool().item() as call_nova_client:
+            instance = call_nova_client.get_instance_by_UUID(instance_uuid)
+        instance_ip = inventory.get_instance_address(instance)
 
-    try:
-        addrName = instance.addresses.keys()[0]
-        instance_ip = instance.addresses[addrName][0]['addr']
-    except Exception:
-        instance_ip = '-'
+    if instance_ip != '-':
+        ip_cache.set(instance_uuid, instance_ip)
     return instance_ip
 
 
+def refresh_instance_ip_cache(message):
+    """
+    Keep instance ip cache fresh by instance lifecycle notifications:
+        compute.instance.create.end: cache the new fixed ip
+        compute.instance.update: cache the fixed ip if carried,
+                                 evict when instance was deleted
+        compute.instance.delete.end: evict the instance
+    """
+    event_type = message.get('event_type')
+    if event_type not in INSTANCE_IP_NOTIFICATIONS:
+        return
+    payload = message.get('payload') or {}
+    instance_uuid = payload.get('instance_id')
+    if instance_uuid is None:
+        return
+
+    ip_cache = _get_instance_ip_cache()
+    if (event_type == 'compute.instance.delete.end' or
+            payload.get('state') == 'deleted'):
+        LOG.debug(_("Evict instance %s from ip cache") % instance_uuid)
+        ip_cache.delete(instance_uuid)
+        return
+    try:
+        fixed_ip = payload['fixed_ips'][0]['address']
+    except (KeyError, IndexError, TypeError):
+        return
+    ip_cache.set(instance_uuid, fixed_ip)
+
+
 def set_alarm_timestamp(message):
     # NOTE(hzyangtk): change message`s time from datetime string to
     #                 time long
@@ -76,11 +115,8 @@ def set_alarm_timestamp(message):
             if not isinstance(datetime_string, str) and \
                     not isinstance(datetime_string, unicode):
                 raise TypeError()
-            ori_datetime = utils.parse_strtime(datetime_string,
-                                               '%Y-%m-%d %H:%M:%S.%f')
-            local_datetime = utils.tz_utc_to_local(ori_datetime)
-            message['timestamp'] = utils.datetime_to_timestamp(
-                                            local_datetime)
+            message['timestamp'] = utils.utc_strtime_to_timestamp(
+                                            datetime_string)
     except (ValueError, TypeError):
         # NOTE(hzyangtk): ValueError will be thrown when datetime
         #                 format not match.
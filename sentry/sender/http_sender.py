@@ -4,14 +4,19 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+import functools
 import hashlib
 import hmac
-import httplib
-import time
 import urllib
 
+from eventlet import greenpool
+
+from sentry.common import circuit_breaker
+from sentry.common import http_pool
+from sentry.common import retry_scheduler
 from sentry.openstack.common import cfg
 from sentry.openstack.common import log
+from sentry.sender import outbox
 
 
 LOG = log.getLogger(__name__)
@@ -33,36 +38,113 @@ request_configs = [
     cfg.StrOpt('access_secret',
                default=None,
                help='Alarm system access secret key.'),
+    cfg.IntOpt('platform_send_concurrency',
+               default=10,
+               help='Max number of platform project copies of an alarm '
+                    'sent at the same time.'),
 ]
 
 CONF.register_opts(request_configs)
 
 
+_SENDERS = {}
+
+
+def get_sender(request_uri):
+    '''
+        Return the sender of an alarm system endpoint. Senders are never
+        changed after created, so they are shared by concurrent sending.
+    '''
+    key = (CONF.url_port, request_uri, CONF.access_key, CONF.access_secret)
+    sender = _SENDERS.get(key)
+    if sender is None:
+        sender = _SENDERS.setdefault(key, SendRequest(request_uri))
+    return sender
+
+
+def reset():
+    _SENDERS.clear()
+
+
 def product_send_alarm(data):
-    SEND_REQUEST.request_uri = CONF.product_request_uri
-    SEND_REQUEST.send_request_to_server(data)
+    return get_sender(CONF.product_request_uri).send_request_to_server(data)
 
 
 def platform_send_alarm(data):
-    SEND_REQUEST.request_uri = CONF.platform_request_uri
-    SEND_REQUEST.send_request_to_server(data)
+    return get_sender(CONF.platform_request_uri).send_request_to_server(data)
+
+
+def replay_alarm(record):
+    '''
+        Deliver an alarm spooled in outbox, return True on success.
+    '''
+    return get_sender(record['request_uri']).resend(record['params'])
+
+
+def platform_send_alarm_batch(data, project_ids):
+    '''
+        Send a copy of the alarm to each platform project concurrently.
+        Copies failed at the first attempt are retried by the retry
+        scheduler as usual.
+        @return dict of succeeded and failed project ids
+    '''
+    def _send_copy(project_id):
+        data_copy = dict(data, projectId=project_id)
+        try:
+            response = platform_send_alarm(data_copy)
+        except Exception:
+            LOG.exception(_("Failed to send alarm to platform project %s")
+                          % project_id)
+            return project_id, False
+        return project_id, response is not None and response.status == 200
+
+    result = {'succeeded': [], 'failed': []}
+    pool = greenpool.GreenPool(max(CONF.platform_send_concurrency, 1))
+    for project_id, succeeded in pool.imap(_send_copy, project_ids):
+        if succeeded:
+            result['succeeded'].append(project_id)
+        else:
+            result['failed'].append(project_id)
+
+    if result['failed']:
+        LOG.warning(_("Alarm %(type)s of %(identifier)s sent to "
+                      "%(succeeded)d/%(total)d platform projects, failed "
+                      "projects: %(failed)s")
+                    % {'type': data.get('alarmType'),
+                       'identifier': data.get('identifier'),
+                       'succeeded': len(result['succeeded']),
+                       'total': len(project_ids),
+                       'failed': result['failed']})
+    else:
+        LOG.info(_("Alarm %(type)s of %(identifier)s sent to all "
+                   "%(total)d platform projects")
+                 % {'type': data.get('alarmType'),
+                    'identifier': data.get('identifier'),
+                    'total': len(project_ids)})
+    return result
 
 
 class SendRequest(object):
     '''
         Send datas to monitor server by accesskey authorization.
+        A sender posts to one endpoint only, nothing is changed after
+        created.
     '''
-    def __init__(self):
+    def __init__(self, request_uri=''):
         self.url = CONF.url_port
-        self.request_uri = ''
+        self.request_uri = request_uri
         self.headers = {'Content-type': 'application/x-www-form-urlencoded'}
         self.httpMethod = 'POST'
         self.access_key = CONF.access_key
         self.access_secret = CONF.access_secret
+        self.breaker = circuit_breaker.get_breaker('%s%s' % (self.url,
+                                                              request_uri))
 
     def send_request_to_server(self, format_data):
         '''
             Send alarm datas to collect server by POST request.
+            Failed alarm is retried later by retry scheduler, return
+            response of the first attempt.
         '''
         if self.url is None:
             LOG.exception("Alarm http configuration error.")
@@ -82,37 +164,89 @@ class SendRequest(object):
                 #'AccessKey': self.access_key,
                 #'Signature': self.generate_signature(format_data)
         })
-        if str(self.url).startswith('http://'):
-            self.url = str(self.url).split("http://")[-1]
-
-        attempts = CONF.http_retry_count
-        while attempts > 0:
-            attempts -= 1
-            try:
-                conn = httplib.HTTPConnection(self.url)
-                conn.request(self.httpMethod, self.request_uri,
-                             params, self.headers)
-                response = conn.getresponse()
-                res_content = response.read()
-                if isinstance(res_content, unicode):
-                    res_content = res_content.encode('UTF-8')
-                conn.close()
-            except Exception:
-                response = None
-                LOG.exception("Alarm send failed ")
-                LOG.warning("Go retrying, left %s time" % attempts)
-                time.sleep(CONF.http_retry_delay)
-                continue
-            if response.status == 200:
-                LOG.info("Alarm send successfully")
-                break
+        if not self.breaker.allow_request():
+            if outbox.get_outbox() is not None:
+                # NOTE(hzyangtk): alarm system is known to be down, spool
+                #                 the alarm at once, it is replayed when
+                #                 the circuit closes again.
+                LOG.warning(_("Circuit of %s%s is open, spool alarm")
+                            % (self.url, self.request_uri))
+                self._spool(params)
             else:
-                LOG.warning("Alarm send failed")
-                LOG.warning("Alarm Sender response exception with "
-                            "status: %s, message: %s."
-                            % (response.status, res_content))
-                LOG.warning("Go retrying, left %s time" % attempts)
-                time.sleep(CONF.http_retry_delay)
+                # NOTE(hzyangtk): without outbox, retry the alarm later
+                #                 as if the first attempt failed.
+                LOG.warning(_("Circuit of %s%s is open, retry alarm "
+                              "later") % (self.url, self.request_uri))
+                self._schedule_retry(params, CONF.http_retry_count)
+            return None
+        response = self._send(params)
+        if response is None or response.status != 200:
+            # NOTE(hzyangtk): retry later on retry scheduler instead of
+            #                 sleeping here, which blocks consuming.
+            self._schedule_retry(params, CONF.http_retry_count - 1)
+        return response
+
+    def _schedule_retry(self, params, attempts):
+        endpoint = '%s%s' % (self.url, self.request_uri)
+        retry_scheduler.SCHEDULER.schedule(
+                endpoint, functools.partial(self._deliver, params),
+                attempts, on_failure=functools.partial(self._spool, params),
+                breaker=self.breaker)
+
+    def _spool(self, params):
+        '''
+            Keep alarm failed after all retries in outbox, to replay it
+            when the alarm system recovers.
+        '''
+        spool = outbox.get_outbox()
+        if spool is None:
+            LOG.error(_("Drop alarm to %(url)s%(uri)s: %(params)s")
+                      % {'url': self.url, 'uri': self.request_uri,
+                         'params': params})
+            return
+        spool.append({'request_uri': self.request_uri, 'params': params})
+
+    def resend(self, params):
+        '''
+            Send urlencoded params of an alarm again, return True on
+            success. Used by retries and outbox replay.
+        '''
+        if not self.breaker.allow_request():
+            return False
+        return self._deliver(params)
+
+    def _deliver(self, params):
+        '''
+            Send params allowed by the circuit, return True on success.
+        '''
+        response = self._send(params)
+        return response is not None and response.status == 200
+
+    def _send(self, params):
+        '''
+            Send alarm once, return response or None when failed.
+        '''
+        try:
+            response, res_content = http_pool.get_pool(self.url).request(
+                                        self.httpMethod, self.request_uri,
+                                        params, self.headers)
+            if isinstance(res_content, unicode):
+                res_content = res_content.encode('UTF-8')
+        except Exception:
+            LOG.exception("Alarm send failed ")
+            self.breaker.record_failure()
+            return None
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if response.status == 200:
+            LOG.info("Alarm send successfully")
+        else:
+            LOG.warning("Alarm send failed")
+            LOG.warning("Alarm Sender response exception with "
+                        "status: %s, message: %s."
+                        % (response.status, res_content))
         return response
 
     def generate_stringToSign(self, format_data):
@@ -127,7 +261,7 @@ class SendRequest(object):
                      format_data['namespace'], format_data['projectId'])
 
         StringToSign = '%s\n%s\n%s\n%s\n' % \
-                      (self.httpMethod, self.requestURI,
+                      (self.httpMethod, self.request_uri,
                        CanonicalizedHeaders, CanonicalizedResources)
 
         return StringToSign
@@ -146,6 +280,3 @@ class SendRequest(object):
         s = hashed.digest()
         signature = s.encode('base64').rstrip()
         return signature
-
-
-SEND_REQUEST = SendRequest()
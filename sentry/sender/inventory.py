@@ -0,0 +1,164 @@
+#
+# Created on 2013-4-10
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import time
+
+import eventlet
+
+from sentry.common import novaclient_helper
+from sentry.common import utils
+from sentry.openstack.common import cfg
+from sentry.openstack.common import log
+
+
+inventory_configs = [
+    cfg.BoolOpt('enable_instance_inventory',
+                default=False,
+                help='Keep a snapshot of all instances for ip lookup'),
+    cfg.IntOpt('instance_inventory_interval',
+               default=60,
+               help='Seconds between instance inventory refresh'),
+    cfg.IntOpt('instance_inventory_full_interval',
+               default=3600,
+               help='Seconds between full instance inventory refresh, '
+                    'refresh in between only fetch changed instances'),
+    cfg.IntOpt('instance_inventory_page_size',
+               default=1000,
+               help='Number of instances fetched per nova request'),
+]
+
+
+CONF = cfg.CONF
+CONF.register_opts(inventory_configs)
+LOG = log.getLogger(__name__)
+CHANGES_SINCE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+_INVENTORY = None
+
+
+def get_instance_address(instance):
+    try:
+        addrName = instance.addresses.keys()[0]
+        return instance.addresses[addrName][0]['addr']
+    except Exception:
+        return '-'
+
+
+class InstanceInventory(object):
+    '''
+        Snapshot of all instances built from nova. Each instance is
+        kept as uuid -> (ip, name, tenant_id).
+    '''
+    def __init__(self):
+        self._index = {}
+        self._changes_since = None
+        self._last_full_refresh = None
+        self._thread = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def is_ready(self):
+        return self._last_full_refresh is not None
+
+    def lookup(self, instance_uuid):
+        return self._index.get(instance_uuid)
+
+    def _list_instances(self, changes_since):
+        instances = []
+        marker = None
+        limit = CONF.instance_inventory_page_size
+        with novaclient_helper.get_client_pool().item() as call_nova_client:
+            while True:
+                page = call_nova_client.get_all_instances(
+                                        changes_since=changes_since,
+                                        marker=marker, limit=limit)
+                instances.extend(page)
+                # NOTE(hzyangtk): nova caps a page at its osapi_max_limit,
+                #                 which may be below the page size asked,
+                #                 so only an empty page ends the listing.
+                if not limit or not page:
+                    return instances
+                marker = page[-1].id
+
+    def refresh(self):
+        '''
+            Refresh the snapshot, fetch only instances changed since
+            last refresh unless a full refresh is due.
+        '''
+        now = utils.utcnow()
+        started_at = time.time()
+        full_refresh = (self._last_full_refresh is None or
+                        started_at - self._last_full_refresh >=
+                        CONF.instance_inventory_full_interval)
+        changes_since = None
+        if not full_refresh:
+            changes_since = utils.strtime(self._changes_since,
+                                          CHANGES_SINCE_FORMAT)
+        instances = self._list_instances(changes_since)
+
+        index = {} if full_refresh else self._index
+        for instance in instances:
+            if getattr(instance, 'status', None) == 'DELETED':
+                index.pop(instance.id, None)
+                continue
+            index[instance.id] = (get_instance_address(instance),
+                                  getattr(instance, 'name', None),
+                                  getattr(instance, 'tenant_id', None))
+        # NOTE(hzyangtk): full refresh builds a new index and swaps it in,
+        #                 so lookups never see a half built snapshot.
+        self._index = index
+        self._changes_since = now
+        if full_refresh:
+            self._last_full_refresh = started_at
+        LOG.debug(_("Instance inventory refreshed, full: %(full_refresh)s,"
+                    " changed: %(changed)d, total: %(total)d") %
+                  {'full_refresh': full_refresh, 'changed': len(instances),
+                   'total': len(index)})
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                LOG.exception(_("Refresh instance inventory failed"))
+            eventlet.sleep(CONF.instance_inventory_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._refresh_loop)
+        return self._thread
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+
+
+def get_inventory():
+    global _INVENTORY
+    if _INVENTORY is None:
+        _INVENTORY = InstanceInventory()
+    return _INVENTORY
+
+
+def reset():
+    global _INVENTORY
+    if _INVENTORY is not None:
+        _INVENTORY.stop()
+    _INVENTORY = None
+
+
+def lookup(instance_uuid):
+    '''
+        Return (ip, name, tenant_id) of the instance, or None when
+        inventory is disabled, not ready yet or misses the instance.
+    '''
+    if not CONF.enable_instance_inventory or _INVENTORY is None:
+        return None
+    if not _INVENTORY.is_ready():
+        return None
+    return _INVENTORY.lookup(instance_uuid)
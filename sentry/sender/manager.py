@@ -4,8 +4,12 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+import functools
+
 from sentry.common import utils
 from sentry.file_cache import alarm_content as alarm_content_list
+from sentry.sender import classifier
+from sentry.sender import dedup
 from sentry.sender import handler
 from sentry.sender import http_sender
 from sentry.openstack.common import log
@@ -52,13 +56,24 @@ def send_alarm(message):
         return
 
     LOG.debug("Alarm owner: %s" % str(alarm_owner))
+    # NOTE(hzyangtk): repeats of an alarm are suppressed in dedup window
+    #                 and sent later as one alarm with the repeat count.
+    dedup_key = dedup.get_dedup_key(format_data, alarm_owner)
+    if not dedup.get_deduplicator().submit(
+                        dedup_key, format_data,
+                        functools.partial(_deliver_alarm, alarm_owner)):
+        LOG.info(_("Suppressed repeated alarm: %s") % str(dedup_key))
+
+
+def _deliver_alarm(alarm_owner, format_data):
     for owner in alarm_owner:
         if owner in PRODUCT_MANAGER:
             http_sender.product_send_alarm(format_data)
         elif owner in PLATFORM_MANAGER:
-            for project_id in CONF.platform_project_id_list:
-                format_data['projectId'] = project_id
-                http_sender.platform_send_alarm(format_data)
+            # NOTE(hzyangtk): copies for platform projects are sent
+            #                 concurrently, format_data is not changed.
+            http_sender.platform_send_alarm_batch(
+                                format_data, CONF.platform_project_id_list)
 
 
 def _format_instance_offline(message, alarm_summary_content, alarm_contents):
@@ -245,6 +260,9 @@ def _data_formater(message):
     "InstanceOffLine",
     "UnknowError"
 
+    The alarm type is looked up in the event_type dispatch table
+    compiled from alarm_event_type of alarm content.
+
     Data description of format_data:
     format_data: {
             "projectId":"",
@@ -263,27 +281,33 @@ def _data_formater(message):
 
     LOG.debug("Alarm data: %s" % message)
 
-    if handler.is_instance_down(message, content):
+    formatters = _get_formatters()
+    alarm_classifier = classifier.get_classifier(content, formatters)
+    classified = alarm_classifier.classify(message)
+    if classified is None:
+        LOG.info(_("Skip this alarm message, event_type is: %s")
+                 % str(message.get('event_type')))
+        return None
+    alarm_type, formatter = classified
+    LOG.debug("Classified as alarm type: %s" % alarm_type)
+    return formatters[formatter](message, alarm_summary_content,
+                                 alarm_contents)
+
+
+def _get_formatters():
+    """
+    Formatters of alarm types, which alarm_event_type of alarm content
+    may refer to.
+    """
+    return {
         # InstanceOffline: instance offline (heartbeat fail)
-        return _format_instance_offline(message, alarm_summary_content,
-                                        alarm_contents)
-    elif handler.is_instance_state_error(message, content):
+        'InstanceOffLine': _format_instance_offline,
         # InstanceError: instance state to error
-        return _format_instance_error(message, alarm_summary_content,
-                                      alarm_contents)
-    elif handler.is_nos_connection_failure(message, content):
+        'InstanceError': _format_instance_error,
         # NosError: NOS connection error
-        return _format_nos_error(message, alarm_summary_content,
-                                 alarm_contents)
-    elif handler.is_nbs_connection_failure(message, content):
+        'NosError': _format_nos_error,
         # NbsError: NBS connection error
-        return _format_nbs_error(message, alarm_summary_content,
-                                 alarm_contents)
-    elif handler.is_other_alarm(message, content):
+        'NbsError': _format_nbs_error,
         # UnknownError: other alarms
-        return _format_unknown_error(message, alarm_summary_content,
-                                     alarm_contents)
-    else:
-        LOG.info(_("Skip this alarm message, event_type is: %s")
-                 % str(message.get('event_type')))
-        return None
+        'UnknownError': _format_unknown_error,
+    }
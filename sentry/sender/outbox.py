@@ -0,0 +1,384 @@
+#
+# Created on 2013-4-22
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import errno
+import os
+import shutil
+
+import eventlet
+
+from sentry.openstack.common import cfg
+from sentry.openstack.common import jsonutils
+from sentry.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+CONF = cfg.CONF
+
+outbox_configs = [
+    cfg.StrOpt('alarm_outbox_dir',
+               default=None,
+               help='Directory to spool alarms failed after all http '
+                    'retries, they are replayed when the alarm system '
+                    'recovers. Unset to drop them.'),
+    cfg.IntOpt('alarm_outbox_segment_size',
+               default=1048576,
+               help='Max bytes of an outbox segment file'),
+    cfg.IntOpt('alarm_outbox_max_size',
+               default=67108864,
+               help='Max bytes of all outbox segment files'),
+    cfg.StrOpt('alarm_outbox_drop_policy',
+               default='oldest',
+               help='What to drop when the outbox is full, "oldest" drops '
+                    'the oldest segment, "newest" refuses new alarms'),
+    cfg.FloatOpt('alarm_outbox_fsync_interval',
+                 default=1.0,
+                 help='Seconds appended alarms may wait to be fsynced '
+                      'together, 0 to fsync each alarm'),
+    cfg.FloatOpt('alarm_outbox_drain_interval',
+                 default=10.0,
+                 help='Seconds between attempts to replay spooled alarms'),
+]
+
+CONF.register_opts(outbox_configs)
+
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor'
+
+
+class Outbox(object):
+    '''
+        Append-only spool of undeliverable alarms on local disk.
+
+        Records are json lines appended to numbered segment files, a
+        cursor file keeps the position of the oldest record not replayed
+        yet. Only per segment sizes are kept in memory. Records are
+        replayed in order and at least once: the cursor is saved after
+        each drain, so a crash while draining replays some again.
+    '''
+    def __init__(self, path, segment_size=None, max_size=None,
+                 drop_policy=None):
+        self.path = path
+        self.segment_size = segment_size or CONF.alarm_outbox_segment_size
+        self.max_size = max_size or CONF.alarm_outbox_max_size
+        self.drop_policy = drop_policy or CONF.alarm_outbox_drop_policy
+        # NOTE(hzyangtk): seq -> [bytes, records] of each segment
+        self._segments = {}
+        self._size = 0
+        self._depth = 0
+        self._cursor = (0, 0)
+        self._write_seq = None
+        self._write_fd = None
+        self._sync_timer = None
+        self._thread = None
+        self._stats = {'appended': 0, 'replayed': 0, 'dropped': 0}
+        self._load()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, '%020d%s' % (seq, SEGMENT_SUFFIX))
+
+    def _load(self):
+        try:
+            os.makedirs(self.path)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        for name in os.listdir(self.path):
+            if name.endswith(SEGMENT_SUFFIX):
+                seq = int(name[:-len(SEGMENT_SUFFIX)])
+                with open(self._segment_path(seq)) as segment:
+                    data = segment.read()
+                self._segments[seq] = [len(data), data.count('\n')]
+                self._size += len(data)
+
+        seq, offset = self._load_cursor()
+        for old_seq in sorted(self._segments):
+            if old_seq < seq:
+                self._remove_segment(old_seq)
+        if seq not in self._segments:
+            seq, offset = min(self._segments or [seq + 1]), 0
+        self._cursor = (seq, offset)
+
+        self._depth = sum(records for size, records
+                          in self._segments.itervalues())
+        if self._cursor[0] in self._segments and offset:
+            with open(self._segment_path(self._cursor[0])) as segment:
+                self._depth -= segment.read(offset).count('\n')
+        if self._depth:
+            LOG.info(_("Found %(depth)d alarms in outbox %(path)s")
+                     % {'depth': self._depth, 'path': self.path})
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.path, CURSOR_FILE)) as cursor:
+                seq, offset = jsonutils.loads(cursor.read())
+            return int(seq), int(offset)
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            LOG.warning(_("Broken outbox cursor in %s, replay all "
+                          "segments") % self.path)
+        return 0, 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.path, CURSOR_FILE)
+        with open(path + '.tmp', 'w') as cursor:
+            cursor.write(jsonutils.dumps(list(self._cursor)))
+            # NOTE(hzyangtk): sync before rename, else a crash may leave
+            #                 an empty cursor file.
+            cursor.flush()
+            os.fsync(cursor.fileno())
+        os.rename(path + '.tmp', path)
+
+    def _remove_segment(self, seq):
+        size, records = self._segments.pop(seq)
+        self._size -= size
+        try:
+            os.unlink(self._segment_path(seq))
+        except OSError:
+            LOG.exception(_("Failed to remove outbox segment %s") % seq)
+
+    def _roll(self):
+        self._close_write()
+        # NOTE(hzyangtk): never append to a segment left by the last run,
+        #                 which may end with a record cut by a crash.
+        self._write_seq = max(self._segments.keys() +
+                              [self._cursor[0] - 1]) + 1
+        self._write_fd = os.open(self._segment_path(self._write_seq),
+                                 os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                 0644)
+        self._segments[self._write_seq] = [0, 0]
+
+    def _close_write(self):
+        if self._write_fd is not None:
+            self._sync()
+            os.close(self._write_fd)
+            self._write_fd = None
+            self._write_seq = None
+
+    def append(self, record):
+        '''
+            Spool a record, return False if it was dropped.
+        '''
+        line = jsonutils.dumps(record) + '\n'
+        if (self.drop_policy == 'newest' and
+                self._size + len(line) > self.max_size):
+            self._stats['dropped'] += 1
+            LOG.warning(_("Outbox %s is full, drop new alarm") % self.path)
+            return False
+
+        if (self._write_fd is None or
+                self._segments[self._write_seq][0] + len(line) >
+                self.segment_size):
+            self._roll()
+        # NOTE(hzyangtk): one unbuffered write per record, so that the
+        #                 drainer never reads half a record.
+        os.write(self._write_fd, line)
+        segment = self._segments[self._write_seq]
+        segment[0] += len(line)
+        segment[1] += 1
+        self._size += len(line)
+        self._depth += 1
+        self._stats['appended'] += 1
+        self._schedule_sync()
+
+        while self._size > self.max_size and len(self._segments) > 1:
+            self._drop_oldest()
+        return True
+
+    def _schedule_sync(self):
+        if CONF.alarm_outbox_fsync_interval <= 0:
+            self._sync()
+        elif self._sync_timer is None:
+            self._sync_timer = eventlet.spawn_after(
+                    CONF.alarm_outbox_fsync_interval, self._sync)
+
+    def _sync(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        if self._write_fd is not None:
+            os.fsync(self._write_fd)
+
+    def _drop_oldest(self):
+        seq = min(self._segments)
+        records = self._segments[seq][1]
+        if seq == self._cursor[0]:
+            with open(self._segment_path(seq)) as segment:
+                records -= segment.read(self._cursor[1]).count('\n')
+            self._cursor = (min(set(self._segments) - set([seq])), 0)
+            self._save_cursor()
+        self._remove_segment(seq)
+        self._depth -= records
+        self._stats['dropped'] += records
+        LOG.warning(_("Outbox %(path)s is full, drop %(records)d oldest "
+                      "alarms") % {'path': self.path, 'records': records})
+
+    def drain(self, deliver):
+        '''
+            Replay spooled records in order by deliver(record), until one
+            of them fails. Return number of replayed records.
+        '''
+        replayed = 0
+        try:
+            while self._depth:
+                seq, offset = self._cursor
+                with open(self._segment_path(seq)) as segment:
+                    segment.seek(offset)
+                    for line in iter(segment.readline, ''):
+                        if not line.endswith('\n'):
+                            LOG.warning(_("Skip a cut record in outbox "
+                                          "segment %s") % seq)
+                            break
+                        try:
+                            record = jsonutils.loads(line)
+                        except ValueError:
+                            LOG.warning(_("Drop a broken record in outbox "
+                                          "segment %s") % seq)
+                            record = None
+                        if record is None:
+                            succeeded = True
+                            self._stats['dropped'] += 1
+                        else:
+                            try:
+                                succeeded = deliver(record)
+                            except Exception:
+                                LOG.exception(_("Failed to replay alarm"))
+                                succeeded = False
+                            if self._cursor[0] != seq:
+                                # NOTE(hzyangtk): segment was dropped while
+                                #                 delivering, which counted
+                                #                 this record as dropped.
+                                #                 Go on from the new cursor.
+                                if succeeded:
+                                    self._stats['dropped'] -= 1
+                                    self._stats['replayed'] += 1
+                                    replayed += 1
+                                break
+                            if succeeded:
+                                self._stats['replayed'] += 1
+                                replayed += 1
+                        if not succeeded:
+                            return replayed
+                        offset += len(line)
+                        self._cursor = (seq, offset)
+                        self._depth -= 1
+                if self._cursor[0] != seq:
+                    continue
+                if seq == self._write_seq:
+                    break
+                self._remove_segment(seq)
+                self._cursor = (min(self._segments or [seq + 1]), 0)
+        finally:
+            if replayed:
+                self._save_cursor()
+                LOG.info(_("Replayed %(replayed)d alarms of outbox, "
+                           "%(depth)d left") % {'replayed': replayed,
+                                                'depth': self._depth})
+        return replayed
+
+    def _drain_loop(self, deliver):
+        while True:
+            eventlet.sleep(CONF.alarm_outbox_drain_interval)
+            if self._depth:
+                try:
+                    self.drain(deliver)
+                except Exception:
+                    LOG.exception(_("Failed to drain outbox %s")
+                                  % self.path)
+
+    def start(self, deliver):
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._drain_loop, deliver)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+        self._close_write()
+
+    def get_depth(self):
+        return self._depth
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats.update({'depth': self._depth,
+                      'size': self._size,
+                      'segments': len(self._segments)})
+        return stats
+
+
+_OUTBOX = None
+
+
+def _adopt_orphans(spool, worker_count):
+    '''
+        Move alarms left by workers removed since the last run, such as
+        after controller_workers was reduced, into spool and remove
+        their sub directories.
+    '''
+    for name in os.listdir(CONF.alarm_outbox_dir):
+        if not name.isdigit() or int(name) < worker_count:
+            continue
+        path = os.path.join(CONF.alarm_outbox_dir, name)
+        try:
+            orphan = Outbox(path)
+            moved = orphan.drain(spool.append)
+            orphan.stop()
+        except (IOError, OSError):
+            LOG.exception(_("Failed to adopt outbox %s") % path)
+            continue
+        if orphan.get_depth():
+            LOG.warning(_("Outbox %(path)s still has %(depth)d alarms, "
+                          "adopt them on next start")
+                        % {'path': path, 'depth': orphan.get_depth()})
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        LOG.info(_("Adopted %(moved)d alarms of removed worker outbox "
+                   "%(path)s") % {'moved': moved, 'path': path})
+
+
+def init_outbox(worker_index=0, worker_count=1):
+    '''
+        Open the outbox of the worker, each worker spools into its own
+        sub directory. The first worker also adopts sub directories of
+        workers index >= worker_count. Return None if the outbox is
+        disabled.
+    '''
+    global _OUTBOX
+    if _OUTBOX is None and CONF.alarm_outbox_dir:
+        try:
+            _OUTBOX = Outbox(os.path.join(CONF.alarm_outbox_dir,
+                                          str(worker_index)))
+        except (IOError, OSError):
+            LOG.exception(_("Failed to open outbox in %s, failed alarms "
+                            "are dropped") % CONF.alarm_outbox_dir)
+        else:
+            if worker_index == 0:
+                _adopt_orphans(_OUTBOX, worker_count)
+    return _OUTBOX
+
+
+def get_outbox():
+    return _OUTBOX
+
+
+def get_stats():
+    '''
+        Return stats of the outbox, None if it is disabled.
+    '''
+    if _OUTBOX is None:
+        return None
+    return _OUTBOX.get_stats()
+
+
+def reset():
+    global _OUTBOX
+    if _OUTBOX is not None:
+        _OUTBOX.stop()
+    _OUTBOX = None
@@ -4,9 +4,16 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+import json
+import signal
+import time
+
+import eventlet
+import eventlet.wsgi
 import webob
 
 from sentry.api import base
+from sentry.common import exception
 from sentry.file_cache import setting_list
 from sentry.openstack import client
 from sentry.tests import test
@@ -73,14 +80,84 @@ class FakeRequest(object):
         self.headers = headers
 
 
+def fake_alarm_handler(signo, frame):
+    raise AssertionError('nova request blocked the hub')
+
+
+class FakeNovaServer(object):
+    """Nova api over a real green socket, each request takes delay
+    seconds, so that overlapping requests can be told apart.
+    """
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.paths = []
+        self.in_flight = [0, 0]
+        self._socket = eventlet.listen(('127.0.0.1', 0))
+        self.port = self._socket.getsockname()[1]
+        self._thread = eventlet.spawn(eventlet.wsgi.server, self._socket,
+                                      self._app, log=FakeLog())
+        test.FLAGS.set_override('nova_host', '127.0.0.1')
+        test.FLAGS.set_override('nova_port', self.port)
+
+    def _app(self, environ, start_response):
+        self.paths.append(environ['PATH_INFO'])
+        self.in_flight[0] += 1
+        self.in_flight[1] = max(self.in_flight)
+        eventlet.sleep(self.delay)
+        self.in_flight[0] -= 1
+        if environ['PATH_INFO'].endswith('/servers/detail'):
+            body = {'servers': [{'id': 'fake_uuid%d' % i,
+                                 'image': {'id': 'fake_img_id%d' % i}}
+                                for i in range(4)]}
+        elif environ['PATH_INFO'].endswith('/os-hosts'):
+            body = {'hosts': [{'host_name': 'host1'}]}
+        else:
+            body = {'image': {'metadata': {'hypervisor_type': 'lxc'}}}
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [json.dumps(body)]
+
+    def run(self, func, *args):
+        """Run func, fail if it blocks the server."""
+        # NOTE(hzyangtk): a blocking socket never lets the green server
+        #                 answer, fail in time instead of hanging.
+        signal.signal(signal.SIGALRM, fake_alarm_handler)
+        signal.alarm(5)
+        try:
+            return func(*args)
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+
+    def stop(self):
+        self._thread.kill()
+        test.FLAGS.clear_override('nova_host')
+        test.FLAGS.clear_override('nova_port')
+
+
+class FakeLog(object):
+
+    def write(self, data):
+        pass
+
+
 class TestBase(test.TestCase):
 
     def setUp(self):
         super(TestBase, self).setUp()
         self.stubs.Set(setting_list, "get_setting_list", fake_get_setting_list)
+        base.reset_image_cache()
+        # NOTE(hzyangtk): each case below expects its own nova response
+        self.flags(api_response_cache_ttl=0)
+        base.reset_response_cache()
 
     def tearDown(self):
         super(TestBase, self).tearDown()
+        base.reset_image_cache()
+        base.reset_response_cache()
+        test.FLAGS.clear_override('api_response_cache_ttl')
+        test.FLAGS.clear_override('api_instance_page_size')
+        test.FLAGS.clear_override('image_fetch_concurrency')
 
     def test_get_product_metric_list(self):
         expect_result = '[{"test": "test"}]'
@@ -111,6 +188,20 @@ class TestBase(test.TestCase):
         result = base.get_platform_alarm_event_list('')
         self.assertEquals(expect_result, result)
 
+    def test_serialize_setting_list_once(self):
+        settings = fake_get_setting_list()
+        self.stubs.Set(setting_list, "get_setting_list", lambda: settings)
+        result = base.get_product_metric_list('')
+        self.assertTrue(result is base.get_product_metric_list(''))
+        self.assertEquals(32, len(result.etag))
+
+        # NOTE(hzyangtk): a reloaded file is a new snapshot
+        settings = fake_get_setting_list()
+        settings['product_metric_list'].append({'new': 'new'})
+        new_result = base.get_product_metric_list('')
+        self.assertEquals('[{"test": "test"}, {"new": "new"}]', new_result)
+        self.assertNotEquals(result.etag, new_result.etag)
+
     def test_get_instance_list_for_lxc_virt_type(self):
         self.send_request_called_times = 0
 
@@ -171,6 +262,45 @@ class TestBase(test.TestCase):
         result = base._get_instance_list_for_certain_virt_type(req)
         self.assertEquals(expect_result, result)
 
+    def test_get_instance_list_fetch_each_image_once(self):
+        paths = []
+
+        def fake_send_request(fake_self, method, path, params, headers):
+            paths.append(path)
+            if path.endswith('/servers/detail'):
+                return {'servers': [{'id': 'fake_uuid%d' % i,
+                                     'image': {'id': 'fake_img_id%d' % i}}
+                                    for i in range(3)] * 10}, {}
+            if path.endswith('fake_img_id0'):
+                return {'image': {'metadata': {}}}, {}
+            return {'image': {'metadata': {'hypervisor_type': 'lxc'}}}, {}
+
+        self.stubs.Set(client.NovaClient, "send_request", fake_send_request)
+        req = FakeRequest(params={'ProjectId': '0001', 'VirtType': 'lxc'},
+                          headers={'x-auth-token': '001'})
+        result = base._get_instance_list_for_certain_virt_type(req)
+        self.assertEquals(20, len(result))
+        self.assertEquals(4, len(paths))
+
+        # NOTE(hzyangtk): hypervisor types are cached across requests
+        del paths[:]
+        result = base._get_instance_list_for_certain_virt_type(req)
+        self.assertEquals(20, len(result))
+        self.assertEquals(1, len(paths))
+
+    def test_fetch_images_over_green_socket_concurrently(self):
+        self.flags(image_fetch_concurrency=4)
+        server = FakeNovaServer()
+        self.addCleanup(server.stop)
+        started_at = time.time()
+        result = server.run(base._get_hypervisor_types,
+                            client.NovaClient('001'), '0001',
+                            ['fake_img_id%d' % i for i in range(4)])
+        elapsed = time.time() - started_at
+        self.assertEquals(4, len(result))
+        self.assertEquals(4, server.in_flight[1])
+        self.assertTrue(elapsed < 2 * server.delay)
+
     def test_get_product_instance_list(self):
         # project id invalid
         req = FakeRequest(params={})
@@ -209,6 +339,127 @@ class TestBase(test.TestCase):
         result = base.get_product_instance_list(req)
         self.assertEquals(expect_res, result)
 
+    def _stub_servers(self, count, max_limit=None):
+        servers = [{'name': 'fake_name%d' % i, 'id': 'fake_uuid%d' % i,
+                    'addresses': {'private': [{'addr': '1.0.0.%d' % i}]}}
+                   for i in range(count)]
+        self.requests = []
+
+        def fake_send_request(fake_self, method, path, params, headers):
+            self.requests.append(dict(params))
+            start = 0
+            if params.get('marker'):
+                start = int(params['marker'][len('fake_uuid'):]) + 1
+            # NOTE(hzyangtk): nova caps limit by its osapi_max_limit
+            end = start + min(params.get('limit', len(servers)),
+                              max_limit or len(servers))
+            return {'servers': servers[start:end]}, {}
+
+        self.stubs.Set(client.NovaClient, "send_request", fake_send_request)
+
+    def test_get_product_instance_page(self):
+        self._stub_servers(5)
+        self.flags(api_instance_page_size=10)
+        req = FakeRequest(params={'ProjectId': '0001', 'Limit': '2'},
+                          headers={'x-auth-token': '001'})
+        response = base.get_product_instance_list(req)
+        self.assertEquals(['fake_uuid0', 'fake_uuid1'],
+                          [item['id'] for item in json.loads(response.body)])
+        self.assertEquals('fake_uuid1', response.headers['X-Next-Marker'])
+        self.assertEquals(2, self.requests[0]['limit'])
+
+        req = FakeRequest(params={'ProjectId': '0001', 'Limit': '3',
+                                  'Marker': 'fake_uuid1'},
+                          headers={'x-auth-token': '001'})
+        response = base.get_product_instance_list(req)
+        self.assertEquals(3, len(json.loads(response.body)))
+        self.assertEquals('fake_uuid4', response.headers['X-Next-Marker'])
+
+        req = FakeRequest(params={'ProjectId': '0001', 'Limit': '3',
+                                  'Marker': 'fake_uuid4'},
+                          headers={'x-auth-token': '001'})
+        response = base.get_product_instance_list(req)
+        self.assertEquals('[]', response.body)
+        self.assertFalse('X-Next-Marker' in response.headers)
+
+        # NOTE(hzyangtk): a page cut short by nova is not the last one
+        self._stub_servers(5, max_limit=2)
+        req = FakeRequest(params={'ProjectId': '0001', 'Limit': '3',
+                                  'Marker': 'fake_uuid0'},
+                          headers={'x-auth-token': '001'})
+        response = base.get_product_instance_list(req)
+        self.assertEquals(2, len(json.loads(response.body)))
+        self.assertEquals('fake_uuid2', response.headers['X-Next-Marker'])
+
+        for limit in ('0', '11', 'x'):
+            req = FakeRequest(params={'ProjectId': '0001', 'Limit': limit},
+                              headers={'x-auth-token': '001'})
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              base.get_product_instance_list, req)
+
+    def test_stream_product_instance_list(self):
+        self._stub_servers(5)
+        self.flags(api_instance_page_size=2)
+        req = FakeRequest(params={'ProjectId': '0001'},
+                          headers={'x-auth-token': '001'})
+        expect_result = base.get_product_instance_list(req)
+
+        self.requests = []
+        req = FakeRequest(params={'ProjectId': '0001', 'Stream': '1'},
+                          headers={'x-auth-token': '001'})
+        response = base.get_product_instance_list(req)
+        # NOTE(hzyangtk): first page is read before the response
+        self.assertEquals(1, len(self.requests))
+        self.assertEquals(expect_result, ''.join(response.app_iter))
+        # NOTE(hzyangtk): only the empty fourth page ends the list
+        self.assertEquals(4, len(self.requests))
+
+    def test_stream_product_instance_list_capped_by_nova(self):
+        self._stub_servers(5, max_limit=2)
+        self.flags(api_instance_page_size=3)
+        req = FakeRequest(params={'ProjectId': '0001', 'Stream': '1'},
+                          headers={'x-auth-token': '001'})
+        response = base.get_product_instance_list(req)
+        self.assertEquals(['fake_uuid%d' % i for i in range(5)],
+                          [item['id'] for item
+                           in json.loads(''.join(response.app_iter))])
+
+    def test_stream_product_instance_list_nova_error(self):
+        self._stub_servers(5)
+        self.flags(api_instance_page_size=2)
+        fake_send_request = client.NovaClient.send_request
+
+        def fake_send_request_fail_page_2(fake_self, method, path, params,
+                                          headers):
+            if params.get('marker'):
+                raise exception.ClientConnectionError('nova is down')
+            return fake_send_request(fake_self, method, path, params,
+                                     headers)
+
+        self.stubs.Set(client.NovaClient, "send_request",
+                       fake_send_request_fail_page_2)
+        req = FakeRequest(params={'ProjectId': '0001', 'Stream': '1'},
+                          headers={'x-auth-token': '001'})
+        response = base.get_product_instance_list(req)
+        body = []
+        self.assertRaises(exception.ClientConnectionError,
+                          lambda: body.extend(response.app_iter))
+        # NOTE(hzyangtk): the array is never closed
+        self.assertEquals('[', body[0])
+        self.assertNotEquals(']', body[-1])
+        self.assertEquals(3, len(body))
+
+    def test_stream_product_instance_list_first_page_error(self):
+        def fake_send_request_fail(fake_self, method, path, params, headers):
+            raise exception.ClientConnectionError('nova is down')
+
+        self.stubs.Set(client.NovaClient, "send_request",
+                       fake_send_request_fail)
+        req = FakeRequest(params={'ProjectId': '0001', 'Stream': '1'},
+                          headers={'x-auth-token': '001'})
+        self.assertRaises(exception.ClientConnectionError,
+                          base.get_product_instance_list, req)
+
     def test_get_platform_instance_list(self):
         # project id invalid
         req = FakeRequest(params={})
@@ -279,3 +530,62 @@ class TestBase(test.TestCase):
                        fake_send_request_without_AZ)
         self.assertRaises(webob.exc.HTTPNotFound,
                           base._get_platform_AZ_list, tenant_id, token)
+
+
+class TestResponseCache(test.TestCase):
+
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        base.reset_response_cache()
+        self.paths = []
+
+        def fake_send_request(fake_self, method, path, params, headers):
+            self.paths.append(path)
+            eventlet.sleep(0)
+            return {'hosts': [{'host_name': 'host1'}]}, {}
+
+        self.stubs.Set(client.NovaClient, "send_request", fake_send_request)
+
+    def tearDown(self):
+        super(TestResponseCache, self).tearDown()
+        base.reset_response_cache()
+
+    def _get_host_list(self, token='001'):
+        req = FakeRequest(params={'ProjectId': '0001',
+                                  'DimensionName': 'host'},
+                          headers={'x-auth-token': token})
+        return base.get_platform_instance_list(req)
+
+    def test_cache_host_list(self):
+        expect_result = '[{"id": "host1", "screenName": "host1"}]'
+        self.assertEquals(expect_result, self._get_host_list())
+        self.assertEquals(expect_result, self._get_host_list())
+        self.assertEquals(1, len(self.paths))
+
+        # NOTE(hzyangtk): another token is checked by nova again
+        self._get_host_list(token='002')
+        self.assertEquals(2, len(self.paths))
+        stats = base.get_response_cache_stats()
+        self.assertEquals(1, stats['hits'])
+
+    def test_single_flight(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(lambda i: self._get_host_list(), range(5)))
+        self.assertEquals(1, len(self.paths))
+        self.assertEquals(1, len(set(results)))
+        self.assertEquals(4, base.get_response_cache_stats()['coalesced'])
+
+    def test_single_flight_over_green_socket(self):
+        self.stubs.UnsetAll()
+        server = FakeNovaServer()
+        self.addCleanup(server.stop)
+
+        def _get_host_lists():
+            pool = eventlet.GreenPool()
+            return list(pool.imap(lambda i: self._get_host_list(),
+                                  range(5)))
+
+        results = server.run(_get_host_lists)
+        self.assertEquals(['/v2/0001/os-hosts'], server.paths)
+        self.assertEquals(1, len(set(results)))
+        self.assertEquals(4, base.get_response_cache_stats()['coalesced'])
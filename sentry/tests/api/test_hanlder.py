@@ -119,3 +119,26 @@ class TestHandler(test.TestCase):
         # other request path
         req = FakeRequest(path_info='/other')
         self.assertRaises(webob.exc.HTTPBadRequest, handler_ins, req)
+
+    def test_not_modified(self):
+        body = base.SerializedList('["metric1"]')
+        body.etag = 'etag1'
+        self.stubs.Set(base, "get_product_metric_list", lambda req: body)
+        handler_ins = handler.SentryRequestHandler()
+
+        req = webob.Request.blank('/get-metric-list')
+        response = req.get_response(handler_ins)
+        self.assertEquals(200, response.status_int)
+        self.assertEquals('["metric1"]', response.body)
+        self.assertEquals('etag1', response.etag)
+
+        req = webob.Request.blank('/get-metric-list',
+                                  headers={'If-None-Match': '"etag1"'})
+        response = req.get_response(handler_ins)
+        self.assertEquals(304, response.status_int)
+        self.assertEquals('', response.body)
+
+        req = webob.Request.blank('/get-metric-list',
+                                  headers={'If-None-Match': '"etag0"'})
+        response = req.get_response(handler_ins)
+        self.assertEquals(200, response.status_int)
@@ -0,0 +1,139 @@
+#
+# Created on 2013-4-26
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import os
+import signal
+
+import eventlet
+from eventlet.green import urllib2
+
+from sentry.api import manager
+from sentry.api import wsgi
+from sentry.common import service
+from sentry.tests import test
+
+
+def fake_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid())]
+
+
+class FakeLoader(object):
+
+    def load_app(self, name):
+        return fake_app
+
+
+class TestManager(test.TestCase):
+
+    def setUp(self):
+        super(TestManager, self).setUp()
+        self.flags(sentry_api_listen='127.0.0.1', sentry_api_listen_port=0)
+        self.launched = []
+        self.stubs.Set(service.ProcessLauncher, 'launch',
+                       lambda launcher, factory, workers:
+                           self.launched.append((factory, workers)))
+        self.stubs.Set(service.ProcessLauncher, 'wait',
+                       lambda launcher: None)
+
+    def tearDown(self):
+        super(TestManager, self).tearDown()
+        service.reset_stats()
+        test.FLAGS.clear_override('sentry_api_listen')
+        test.FLAGS.clear_override('sentry_api_listen_port')
+        test.FLAGS.clear_override('sentry_api_workers')
+
+    def test_serve_with_workers(self):
+        self.flags(sentry_api_workers=3)
+        mgr = manager.Manager('sentry-api', loader=FakeLoader())
+        mgr.serve()
+        self.assertEquals(1, len(self.launched))
+        factory, workers = self.launched[0]
+        self.assertEquals(3, workers)
+
+        server = factory(1, 3)
+        self.assertIsNone(mgr.server)
+        self.assertEquals(mgr.port, server.port)
+        mgr.socket.close()
+
+    def test_serve_in_single_process(self):
+        mgr = manager.Manager('sentry-api', loader=FakeLoader())
+        self.stubs.Set(wsgi.Server, 'wait', lambda server: None)
+        mgr.serve()
+        self.assertEquals([], self.launched)
+        self.assertEquals(mgr.port, mgr.server.port)
+        mgr.server.stop()
+
+    def test_register_stats(self):
+        mgr = manager.Manager('sentry-api', loader=FakeLoader())
+        mgr.register_stats()
+        self.assertEquals(['response_cache'], sorted(service._STATS))
+        self.assertEquals(1, service.log_stats())
+        mgr.socket.close()
+
+
+class TestManagerWorkers(test.TestCase):
+
+    def setUp(self):
+        super(TestManagerWorkers, self).setUp()
+        self.flags(sentry_api_listen='127.0.0.1', sentry_api_listen_port=0,
+                   sentry_api_workers=1)
+        self.handlers = dict((signo, signal.getsignal(signo))
+                             for signo in (signal.SIGTERM, signal.SIGINT,
+                                           signal.SIGHUP))
+
+    def tearDown(self):
+        super(TestManagerWorkers, self).tearDown()
+        for signo, handler in self.handlers.iteritems():
+            signal.signal(signo, handler)
+        test.FLAGS.clear_override('sentry_api_listen')
+        test.FLAGS.clear_override('sentry_api_listen_port')
+        test.FLAGS.clear_override('sentry_api_workers')
+
+    def test_forked_worker_serves_shared_socket(self):
+        mgr = manager.Manager('sentry-api', loader=FakeLoader())
+        thread = eventlet.spawn(mgr.serve)
+        try:
+            body = None
+            for i in range(50):
+                try:
+                    body = urllib2.urlopen('http://127.0.0.1:%d/'
+                                           % mgr.port, timeout=5).read()
+                    break
+                except urllib2.URLError:
+                    eventlet.sleep(0.1)
+            worker_pids = mgr.launcher.children.keys()
+            self.assertEquals(1, len(worker_pids))
+            self.assertEquals(str(worker_pids[0]), body)
+            self.assertNotEquals(str(os.getpid()), body)
+        finally:
+            # NOTE(hzyangtk): stop supervising as SIGTERM does, the
+            #                 launcher then stops and reaps the worker.
+            mgr.launcher.running = False
+            thread.wait()
+            mgr.socket.close()
+        self.assertEquals({}, mgr.launcher.children)
+
+
+class TestServer(test.TestCase):
+
+    def tearDown(self):
+        super(TestServer, self).tearDown()
+        test.FLAGS.clear_override('wsgi_shutdown_timeout')
+
+    def test_stop_waits_for_requests_in_flight(self):
+        self.flags(wsgi_shutdown_timeout=5)
+        server = wsgi.Server('test', None, host='127.0.0.1')
+        server.start()
+        finished = []
+
+        def _request():
+            eventlet.sleep(0.1)
+            finished.append(True)
+
+        server._pool.spawn(_request)
+        server.stop()
+        self.assertEquals([True], finished)
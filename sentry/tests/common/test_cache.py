@@ -0,0 +1,115 @@
+#
+# Created on 2013-4-8
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import time
+
+import eventlet
+
+from sentry.common import cache
+from sentry.tests import test
+
+
+class TestLRUCache(test.TestCase):
+
+    def setUp(self):
+        super(TestLRUCache, self).setUp()
+
+    def tearDown(self):
+        super(TestLRUCache, self).tearDown()
+
+    def test_get_and_set(self):
+        lru_cache = cache.LRUCache(2)
+        self.assertIsNone(lru_cache.get('key1'))
+        lru_cache.set('key1', 'value1')
+        self.assertEquals('value1', lru_cache.get('key1'))
+        self.assertTrue('key1' in lru_cache)
+
+        stats = lru_cache.get_stats()
+        self.assertEquals(1, stats['hits'])
+        self.assertEquals(1, stats['misses'])
+        self.assertEquals(1, stats['size'])
+
+    def test_evict_least_recently_used(self):
+        lru_cache = cache.LRUCache(2)
+        lru_cache.set('key1', 'value1')
+        lru_cache.set('key2', 'value2')
+        # key1 becomes most recently used
+        lru_cache.get('key1')
+        lru_cache.set('key3', 'value3')
+
+        self.assertEquals('value1', lru_cache.get('key1'))
+        self.assertIsNone(lru_cache.get('key2'))
+        self.assertEquals('value3', lru_cache.get('key3'))
+        self.assertEquals(1, lru_cache.get_stats()['evictions'])
+
+    def test_expire_by_ttl(self):
+        now = [1000.0]
+        self.stubs.Set(time, 'time', lambda: now[0])
+        lru_cache = cache.LRUCache(2, ttl=10)
+        lru_cache.set('key1', 'value1')
+        now[0] += 5
+        self.assertEquals('value1', lru_cache.get('key1'))
+        now[0] += 10
+        self.assertIsNone(lru_cache.get('key1'))
+        self.assertEquals(1, lru_cache.get_stats()['expirations'])
+        self.assertEquals(0, len(lru_cache))
+
+    def test_disabled_cache(self):
+        lru_cache = cache.LRUCache(0)
+        lru_cache.set('key1', 'value1')
+        self.assertIsNone(lru_cache.get('key1'))
+
+    def test_delete_and_clear(self):
+        lru_cache = cache.LRUCache(2)
+        lru_cache.set('key1', 'value1')
+        lru_cache.set('key2', 'value2')
+        lru_cache.delete('key1')
+        lru_cache.delete('not_exist')
+        self.assertIsNone(lru_cache.get('key1'))
+        lru_cache.clear()
+        self.assertEquals(0, len(lru_cache))
+
+
+class TestSingleFlightCache(test.TestCase):
+
+    def setUp(self):
+        super(TestSingleFlightCache, self).setUp()
+        self.calls = []
+
+    def _load(self, value):
+        self.calls.append(value)
+        eventlet.sleep(0)
+        if value == 'error':
+            raise ValueError()
+        return value
+
+    def test_load_once(self):
+        flight_cache = cache.SingleFlightCache(10)
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(
+                lambda i: flight_cache.get('key1', self._load, 'value1'),
+                range(3)))
+        self.assertEquals(['value1'] * 3, results)
+        self.assertEquals('value1', flight_cache.get('key1', self._load, 'x'))
+        self.assertEquals(['value1'], self.calls)
+        stats = flight_cache.get_stats()
+        self.assertEquals(2, stats['coalesced'])
+        self.assertEquals(0, stats['in_flight'])
+
+    def test_failed_load_not_cached(self):
+        flight_cache = cache.SingleFlightCache(10)
+
+        def _wait():
+            self.assertRaises(ValueError, flight_cache.get, 'key1',
+                              self._load, 'x')
+
+        waiter = eventlet.spawn(_wait)
+        self.assertRaises(ValueError, flight_cache.get, 'key1', self._load,
+                          'error')
+        waiter.wait()
+        self.assertEquals(['error'], self.calls)
+        self.assertEquals('value1',
+                          flight_cache.get('key1', self._load, 'value1'))
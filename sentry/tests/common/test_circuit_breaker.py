@@ -0,0 +1,77 @@
+#
+# Created on 2013-4-23
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import time
+
+from sentry.common import circuit_breaker
+from sentry.tests import test
+
+
+class TestCircuitBreaker(test.TestCase):
+
+    def setUp(self):
+        super(TestCircuitBreaker, self).setUp()
+        self.now = 1000.0
+        self.stubs.Set(time, 'time', lambda: self.now)
+        self.breaker = circuit_breaker.CircuitBreaker('endpoint',
+                                                      failure_threshold=3,
+                                                      reset_timeout=30)
+
+    def tearDown(self):
+        super(TestCircuitBreaker, self).tearDown()
+        circuit_breaker.reset()
+
+    def _fail(self, times):
+        for i in range(times):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+
+    def test_open_after_threshold(self):
+        self._fail(2)
+        self.assertEquals(circuit_breaker.CLOSED, self.breaker.state)
+        self._fail(1)
+        self.assertEquals(circuit_breaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow_request())
+        stats = self.breaker.get_stats()
+        self.assertEquals(1, stats['opened'])
+        self.assertEquals(1, stats['rejected'])
+
+    def test_success_resets_failures(self):
+        self._fail(2)
+        self.breaker.record_success()
+        self._fail(2)
+        self.assertEquals(circuit_breaker.CLOSED, self.breaker.state)
+
+    def test_half_open_trial(self):
+        self._fail(3)
+        self.now += 31
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEquals(circuit_breaker.HALF_OPEN, self.breaker.state)
+        # NOTE(hzyangtk): only one trial request at a time
+        self.assertFalse(self.breaker.allow_request())
+
+        self.breaker.record_success()
+        self.assertEquals(circuit_breaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_half_open_failure(self):
+        self._fail(3)
+        self.now += 31
+        self._fail(1)
+        self.assertEquals(circuit_breaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow_request())
+        self.assertEquals(2, self.breaker.get_stats()['opened'])
+
+    def test_never_open(self):
+        self.breaker = circuit_breaker.CircuitBreaker('endpoint',
+                                                      failure_threshold=0)
+        self._fail(10)
+        self.assertEquals(circuit_breaker.CLOSED, self.breaker.state)
+
+    def test_get_breaker(self):
+        breaker = circuit_breaker.get_breaker('endpoint')
+        self.assertTrue(breaker is circuit_breaker.get_breaker('endpoint'))
+        self.assertEquals(['endpoint'], circuit_breaker.get_stats().keys())
@@ -0,0 +1,66 @@
+#
+# Created on 2013-4-18
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import os
+import shutil
+import tempfile
+
+from sentry.common import file_watcher
+from sentry.tests import test
+
+
+class TestFileWatcher(test.TestCase):
+
+    def setUp(self):
+        super(TestFileWatcher, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'rule.conf')
+        self._write('a')
+        self.changed = []
+        self.watcher = file_watcher.FileWatcher(interval=1)
+        self.watcher.watch(self.path, self.changed.append)
+
+    def tearDown(self):
+        super(TestFileWatcher, self).tearDown()
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, data):
+        with open(self.path, 'w') as rule_file:
+            rule_file.write(data)
+
+    def test_not_changed(self):
+        self.assertEquals([], self.watcher.check())
+        self.assertEquals([], self.changed)
+
+    def test_changed(self):
+        self._write('ab')
+        self.assertEquals([self.path], self.watcher.check())
+        self.assertEquals([self.path], self.changed)
+        self.assertEquals([], self.watcher.check())
+
+    def test_replaced_by_rename(self):
+        new_path = os.path.join(self.temp_dir, 'rule.conf.new')
+        with open(new_path, 'w') as rule_file:
+            rule_file.write('b')
+        os.rename(new_path, self.path)
+        self.assertEquals([self.path], self.watcher.check())
+
+    def test_removed(self):
+        os.remove(self.path)
+        self.assertEquals([self.path], self.watcher.check())
+
+    def test_callback_failed(self):
+        def fake_callback(path):
+            raise Exception()
+        self.watcher.watch(self.path, fake_callback)
+        self._write('ab')
+        self.watcher.check()
+        self.assertEquals([self.path], self.changed)
+
+    def test_unwatch(self):
+        self.watcher.unwatch(self.path, self.changed.append)
+        self._write('ab')
+        self.assertEquals([], self.watcher.check())
@@ -0,0 +1,187 @@
+#
+# Created on 2013-4-11
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import httplib
+import socket
+import threading
+import time
+
+from sentry.common import http_pool
+from sentry.tests import test
+
+
+CREATED_CONNECTIONS = []
+
+
+class FakeResponse(object):
+
+    def __init__(self, status=200, will_close=False):
+        self.status = status
+        self.will_close = will_close
+
+    def read(self):
+        return 'ok'
+
+
+class FakeHTTPConnection(object):
+
+    def __init__(self, host):
+        self.host = host
+        self.closed = False
+        self.stale = False
+        self.stale_response = False
+        self.requests = 0
+        CREATED_CONNECTIONS.append(self)
+
+    def request(self, method, uri, body, headers):
+        if self.stale:
+            raise socket.error('connection reset by peer')
+        self.requests += 1
+
+    def getresponse(self):
+        if self.stale_response:
+            raise httplib.BadStatusLine('')
+        return FakeResponse()
+
+    def close(self):
+        self.closed = True
+
+
+class TestHTTPConnectionPool(test.TestCase):
+
+    def setUp(self):
+        super(TestHTTPConnectionPool, self).setUp()
+        del CREATED_CONNECTIONS[:]
+        http_pool.reset()
+        self.stubs.Set(httplib, 'HTTPConnection', FakeHTTPConnection)
+
+    def tearDown(self):
+        super(TestHTTPConnectionPool, self).tearDown()
+        http_pool.reset()
+
+    def test_normalize_url(self):
+        self.assertEquals('1.1.1.1:80',
+                          http_pool.normalize_url('http://1.1.1.1:80/'))
+        self.assertEquals('1.1.1.1:80', http_pool.normalize_url('1.1.1.1:80'))
+
+    def test_get_pool(self):
+        pool = http_pool.get_pool('http://1.1.1.1:80')
+        self.assertTrue(pool is http_pool.get_pool('1.1.1.1:80'))
+        self.assertFalse(pool is http_pool.get_pool('1.1.1.2:80'))
+
+    def test_reuse_connection(self):
+        pool = http_pool.get_pool('1.1.1.1:80')
+        response, content = pool.request('POST', '/test', 'a=1', {})
+        self.assertEquals(200, response.status)
+        self.assertEquals('ok', content)
+        pool.request('POST', '/test', 'a=1', {})
+        self.assertEquals(1, len(CREATED_CONNECTIONS))
+        self.assertEquals(2, CREATED_CONNECTIONS[0].requests)
+
+    def test_drop_idle_connection(self):
+        now = [1000.0]
+        self.stubs.Set(time, 'time', lambda: now[0])
+        pool = http_pool.HTTPConnectionPool('1.1.1.1:80', max_idle_time=10)
+        pool.request('POST', '/test')
+        now[0] += 20
+        pool.request('POST', '/test')
+        self.assertEquals(2, len(CREATED_CONNECTIONS))
+        self.assertTrue(CREATED_CONNECTIONS[0].closed)
+
+    def test_reconnect_stale_connection(self):
+        pool = http_pool.get_pool('1.1.1.1:80')
+        pool.request('POST', '/test')
+        CREATED_CONNECTIONS[0].stale = True
+        response, content = pool.request('POST', '/test')
+        self.assertEquals(200, response.status)
+        self.assertEquals(2, len(CREATED_CONNECTIONS))
+        self.assertTrue(CREATED_CONNECTIONS[0].closed)
+
+    def test_not_resend_post_after_sent(self):
+        pool = http_pool.get_pool('1.1.1.1:80')
+        pool.request('POST', '/test')
+        CREATED_CONNECTIONS[0].stale_response = True
+        self.assertRaises(httplib.BadStatusLine, pool.request,
+                          'POST', '/test')
+        self.assertEquals(1, len(CREATED_CONNECTIONS))
+        self.assertEquals(2, CREATED_CONNECTIONS[0].requests)
+        self.assertTrue(CREATED_CONNECTIONS[0].closed)
+
+    def test_resend_get_after_sent(self):
+        pool = http_pool.get_pool('1.1.1.1:80')
+        pool.request('GET', '/test')
+        CREATED_CONNECTIONS[0].stale_response = True
+        response, content = pool.request('GET', '/test')
+        self.assertEquals(200, response.status)
+        self.assertEquals(2, len(CREATED_CONNECTIONS))
+
+    def test_new_connection_failed(self):
+        def fake_request(self, method, uri, body, headers):
+            raise socket.error('connection refused')
+        self.stubs.Set(FakeHTTPConnection, 'request', fake_request)
+        pool = http_pool.get_pool('1.1.1.1:80')
+        self.assertRaises(socket.error, pool.request, 'POST', '/test')
+        self.assertTrue(CREATED_CONNECTIONS[0].closed)
+
+
+class OneShotServer(object):
+    '''
+        Answer one keep-alive request per connection, then close it
+        like a server whose keep-alive timeout expired.
+    '''
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.requests = []
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                client, _addr = self.sock.accept()
+            except socket.error:
+                return
+            data = ''
+            while '\r\n\r\n' not in data:
+                data += client.recv(4096)
+            self.requests.append(data.split(' ', 1)[0])
+            client.sendall('HTTP/1.1 200 OK\r\nContent-Length: 2\r\n'
+                           '\r\nok')
+            client.close()
+            self.closed.set()
+
+    def stop(self):
+        self.sock.close()
+
+
+class TestHTTPConnectionPoolSocket(test.TestCase):
+
+    def setUp(self):
+        super(TestHTTPConnectionPoolSocket, self).setUp()
+        self.server = OneShotServer()
+
+    def tearDown(self):
+        super(TestHTTPConnectionPoolSocket, self).tearDown()
+        self.server.stop()
+
+    def test_post_after_server_closed_idle_connection(self):
+        pool = http_pool.HTTPConnectionPool('127.0.0.1:%d' %
+                                            self.server.port)
+        response, content = pool.request('POST', '/test', 'a=1', {})
+        self.assertEquals('ok', content)
+        self.assertEquals(1, len(pool._free_conns))
+        self.assertTrue(self.server.closed.wait(5))
+        time.sleep(0.1)
+        response, content = pool.request('POST', '/test', 'a=1', {})
+        self.assertEquals(200, response.status)
+        self.assertEquals('ok', content)
+        self.assertEquals(['POST', 'POST'], self.server.requests)
+        pool.close()
@@ -0,0 +1,43 @@
+#
+# Created on 2013-4-9
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+from sentry.common import novaclient_helper
+from sentry.tests import test
+
+
+class TestNovaClientPool(test.TestCase):
+
+    def setUp(self):
+        super(TestNovaClientPool, self).setUp()
+        novaclient_helper.reset_client_pool()
+
+    def tearDown(self):
+        super(TestNovaClientPool, self).tearDown()
+        test.FLAGS.clear_override('novaclient_pool_size')
+        novaclient_helper.reset_client_pool()
+
+    def test_get_client_pool(self):
+        pool = novaclient_helper.get_client_pool()
+        self.assertTrue(pool is novaclient_helper.get_client_pool())
+
+    def test_reuse_pooled_client(self):
+        pool = novaclient_helper.get_client_pool()
+        with pool.item() as first_client:
+            self.assertTrue(isinstance(first_client,
+                                       novaclient_helper.CallNovaClient))
+        with pool.item() as second_client:
+            self.assertTrue(first_client is second_client)
+        self.assertEquals(1, pool.current_size)
+
+    def test_pool_is_bounded(self):
+        self.flags(novaclient_pool_size=2)
+        pool = novaclient_helper.get_client_pool()
+        clients = [pool.get(), pool.get()]
+        self.assertEquals(2, pool.current_size)
+        self.assertFalse(pool.free())
+        for client in clients:
+            pool.put(client)
+        self.assertEquals(2, pool.free())
@@ -0,0 +1,114 @@
+#
+# Created on 2013-4-12
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import eventlet
+
+from sentry.common import http_communication
+from sentry.common import retry_scheduler
+from sentry.tests import test
+
+
+SPAWNED_DELAYS = []
+
+
+def fake_spawn_after(seconds, func, *args, **kwargs):
+    SPAWNED_DELAYS.append(seconds)
+    func(*args, **kwargs)
+
+
+class FakeResponse(object):
+
+    def __init__(self, status=200):
+        self.status = status
+
+
+class FakeBreaker(object):
+
+    def __init__(self, rejects):
+        self.rejects = rejects
+
+    def allow_request(self):
+        if self.rejects:
+            self.rejects -= 1
+            return False
+        return True
+
+    def get_retry_after(self):
+        return 30
+
+
+class TestRetryScheduler(test.TestCase):
+
+    def setUp(self):
+        super(TestRetryScheduler, self).setUp()
+        del SPAWNED_DELAYS[:]
+        self.stubs.Set(eventlet, 'spawn_after', fake_spawn_after)
+        self.scheduler = retry_scheduler.RetryScheduler()
+
+    def tearDown(self):
+        super(TestRetryScheduler, self).tearDown()
+        test.FLAGS.clear_override('http_retry_delay')
+        test.FLAGS.clear_override('http_retry_max_delay')
+
+    def test_get_delay(self):
+        self.flags(http_retry_delay=2, http_retry_max_delay=10)
+        for retry_num, max_delay in [(0, 2), (1, 4), (2, 8), (5, 10)]:
+            delay = self.scheduler.get_delay(retry_num)
+            self.assertTrue(max_delay / 2.0 <= delay <= max_delay)
+
+    def test_retry_until_succeeded(self):
+        results = [False, True]
+        self.scheduler.schedule('endpoint', lambda: results.pop(0), 3)
+        stats = self.scheduler.get_stats('endpoint')
+        self.assertEquals(0, stats['in_flight'])
+        self.assertEquals(2, stats['retries'])
+        self.assertEquals(1, stats['succeeded'])
+        self.assertEquals(2, len(SPAWNED_DELAYS))
+
+    def test_retry_give_up(self):
+        failures = []
+
+        def fake_func():
+            raise Exception()
+
+        self.scheduler.schedule('endpoint', fake_func, 2,
+                                on_failure=lambda: failures.append(1))
+        stats = self.scheduler.get_stats()['endpoint']
+        self.assertEquals(2, stats['retries'])
+        self.assertEquals(1, stats['failed'])
+        self.assertEquals([1], failures)
+
+    def test_rejected_by_circuit_not_counted(self):
+        results = [False, True]
+        self.scheduler.schedule('endpoint', lambda: results.pop(0), 2,
+                                breaker=FakeBreaker(5))
+        stats = self.scheduler.get_stats('endpoint')
+        self.assertEquals(5, stats['deferred'])
+        self.assertEquals(2, stats['retries'])
+        self.assertEquals(1, stats['succeeded'])
+        self.assertEquals([30] * 5, SPAWNED_DELAYS[1:6])
+
+    def test_no_attempts_left(self):
+        self.scheduler.schedule('endpoint', lambda: True, 0)
+        self.assertEquals({}, self.scheduler.get_stats())
+
+    def test_http_communication_not_blocked(self):
+        responses = [None, FakeResponse(500), FakeResponse(200)]
+
+        def fake_send(self, params):
+            return responses.pop(0)
+
+        self.stubs.Set(retry_scheduler, 'SCHEDULER', self.scheduler)
+        self.stubs.Set(http_communication.HttpCommunication, '_send',
+                       fake_send)
+        communication = http_communication.HttpCommunication(
+                                            url='1.1.1.1:80',
+                                            request_uri='/test')
+        response = communication.send_request_to_server()
+        self.assertIsNone(response)
+        stats = self.scheduler.get_stats('1.1.1.1:80/test')
+        self.assertEquals(2, stats['retries'])
+        self.assertEquals(1, stats['succeeded'])
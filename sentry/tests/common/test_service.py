@@ -0,0 +1,142 @@
+#
+# Created on 2013-4-16
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import os
+import signal
+import time
+
+import eventlet
+
+from sentry.common import service
+from sentry.tests import test
+
+
+class TestProcessLauncher(test.TestCase):
+
+    def setUp(self):
+        super(TestProcessLauncher, self).setUp()
+        self.killed = []
+        self.now = [1000.0]
+        self.stubs.Set(os, 'kill',
+                       lambda pid, signo: self.killed.append((pid, signo)))
+        self.stubs.Set(time, 'time', lambda: self.now[0])
+        self.launcher = service.ProcessLauncher()
+        for index in range(3):
+            worker = service.WorkerInfo(index)
+            worker.pid = 100 + index
+            worker.started_at = self.now[0]
+            worker.last_heartbeat = self.now[0]
+            self.launcher.workers.append(worker)
+            self.launcher.children[worker.pid] = worker
+
+    def tearDown(self):
+        super(TestProcessLauncher, self).tearDown()
+        test.FLAGS.clear_override('worker_heartbeat_timeout')
+        test.FLAGS.clear_override('worker_health_log_interval')
+
+    def test_kill_silent_worker(self):
+        self.flags(worker_heartbeat_timeout=10)
+        self.now[0] += 20
+        self.launcher.workers[1].last_heartbeat = self.now[0]
+        self.launcher.check_health()
+        self.assertEquals([(100, signal.SIGKILL), (102, signal.SIGKILL)],
+                          sorted(self.killed))
+
+    def test_never_kill_without_timeout(self):
+        self.flags(worker_heartbeat_timeout=0)
+        self.now[0] += 1000
+        self.launcher.check_health()
+        self.assertEquals([], self.killed)
+
+    def test_get_health(self):
+        self.now[0] += 5
+        del self.launcher.children[101]
+        health = self.launcher.get_health()
+        self.assertEquals(5, health[0]['heartbeat_age'])
+        self.assertTrue(health[0]['alive'])
+        self.assertFalse(health[1]['alive'])
+        self.assertEquals(0, health[2]['restarts'])
+
+    def test_restart_one_by_one(self):
+        self.launcher.restarting = [0, 1, 2]
+        self.launcher._restart_next()
+        self.launcher._restart_next()
+        self.assertEquals([(100, signal.SIGTERM)], self.killed)
+
+        # worker 0 respawned
+        worker = self.launcher.children.pop(100)
+        worker.pid = 103
+        self.launcher.children[103] = worker
+        self.launcher._restart_next()
+        self.assertEquals([(100, signal.SIGTERM), (101, signal.SIGTERM)],
+                          self.killed)
+
+    def test_log_health(self):
+        self.flags(worker_health_log_interval=60)
+        logged = []
+        self.stubs.Set(service.LOG, 'info',
+                       lambda msg, *args: logged.append(msg))
+        self.stubs.Set(service.LOG, 'warning',
+                       lambda msg, *args: logged.append(msg))
+        del self.launcher.children[101]
+        self.assertTrue(self.launcher.log_health())
+        self.assertEquals(3, len(logged))
+        self.assertTrue('is down' in logged[1])
+
+        # not due yet
+        self.now[0] += 30
+        self.assertFalse(self.launcher.log_health())
+        self.now[0] += 30
+        self.assertTrue(self.launcher.log_health())
+        self.assertEquals(6, len(logged))
+
+    def test_never_log_health_without_interval(self):
+        self.flags(worker_health_log_interval=0)
+        self.assertFalse(self.launcher.log_health())
+
+
+class FakeThread(object):
+
+    def kill(self):
+        pass
+
+
+class TestStatsLog(test.TestCase):
+
+    def setUp(self):
+        super(TestStatsLog, self).setUp()
+        service.reset_stats()
+        self.logged = []
+        self.stubs.Set(service.LOG, 'info',
+                       lambda msg, *args: self.logged.append(msg))
+
+    def tearDown(self):
+        super(TestStatsLog, self).tearDown()
+        service.reset_stats()
+        test.FLAGS.clear_override('worker_health_log_interval')
+
+    def test_log_stats(self):
+        def fake_failed_stats():
+            raise Exception()
+
+        service.register_stats('cache', lambda: {'hits': 1})
+        service.register_stats('outbox', lambda: None)
+        service.register_stats('broken', fake_failed_stats)
+        self.assertEquals(1, service.log_stats())
+        self.assertEquals(["Stats of cache: {'hits': 1}"], self.logged)
+
+    def test_start_stats_log_once(self):
+        spawned = []
+        self.stubs.Set(eventlet, 'spawn',
+                       lambda func, *args: spawned.append(args) or
+                           FakeThread())
+        self.flags(worker_health_log_interval=0)
+        service.start_stats_log()
+        self.assertEquals([], spawned)
+        self.flags(worker_health_log_interval=60)
+        service.start_stats_log()
+        service.start_stats_log()
+        self.assertEquals([(60,)], spawned)
@@ -0,0 +1,44 @@
+#
+# Created on 2013-4-20
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+from sentry.common import utils
+from sentry.tests import test
+
+
+def old_timestamp(timestr):
+    utc = utils.parse_strtime(timestr, utils.NOTIFICATION_TIME_FORMAT)
+    return utils.datetime_to_timestamp(utils.tz_utc_to_local(utc))
+
+
+class TestUtils(test.TestCase):
+
+    def test_utc_strtime_to_timestamp(self):
+        self.assertEquals(0, utils.utc_strtime_to_timestamp(
+                                            '1970-01-01 00:00:00.0'))
+        self.assertEquals(1332863471000, utils.utc_strtime_to_timestamp(
+                                            '2012-03-27 15:51:11.123'))
+        self.assertEquals(1456790399000, utils.utc_strtime_to_timestamp(
+                                            u'2016-02-29 23:59:59.999999'))
+
+    def test_same_as_local_time_path(self):
+        for timestr in ['2012-03-27 15:51:11.123456',
+                        '2013-03-10 07:00:00.5',
+                        '2013-11-03 06:30:00.123',
+                        '2000-02-29 12:00:00.000001']:
+            self.assertEquals(old_timestamp(timestr),
+                              utils.utc_strtime_to_timestamp(timestr))
+
+    def test_fallback_to_strptime(self):
+        self.assertEquals(1332863471000, utils.utc_strtime_to_timestamp(
+                                            '2012-3-27 15:51:11.123'))
+
+    def test_invalid_time(self):
+        for timestr in ['2013-02-29 00:00:00.0', '2013-13-01 00:00:00.0',
+                        '2013-01-01 24:00:00.0', '2013-01-01 00:00:60.0',
+                        '2013-01-01 00:00:00.0\n', '2013-01-01T00:00:00.0',
+                        '']:
+            self.assertRaises(ValueError, utils.utc_strtime_to_timestamp,
+                              timestr)
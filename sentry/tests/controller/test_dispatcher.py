@@ -0,0 +1,98 @@
+#
+# Created on 2013-4-15
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import eventlet
+
+from sentry.controller import dispatcher
+from sentry.tests import test
+
+
+def _make_message(instance_id, seq):
+    return {'event_type': 'compute.instance.update',
+            'payload': {'instance_id': instance_id, 'seq': seq}}
+
+
+class TestDispatcher(test.TestCase):
+
+    def setUp(self):
+        super(TestDispatcher, self).setUp()
+        self.handled = []
+        self.acked = []
+
+    def tearDown(self):
+        super(TestDispatcher, self).tearDown()
+
+    def _handle_message(self, message):
+        # yield to other lanes during handling
+        eventlet.sleep(0)
+        self.handled.append((message['payload']['instance_id'],
+                             message['payload']['seq']))
+
+    def _ack(self, message):
+        def ack():
+            self.acked.append(message['payload']['seq'])
+        return ack
+
+    def test_get_instance_id(self):
+        self.assertEquals('uuid1', dispatcher.get_instance_id(
+                                    {'payload': {'instance_id': 'uuid1'}}))
+        self.assertEquals('uuid2', dispatcher.get_instance_id(
+                                    {'payload': {'uuid': 'uuid2'}}))
+        self.assertEquals('uuid3', dispatcher.get_instance_id(
+            {'payload': {'request_spec': {'instance_uuids': ['uuid3']}}}))
+        self.assertIsNone(dispatcher.get_instance_id({'payload': 'error'}))
+
+    def test_dispatch_inline(self):
+        message_dispatcher = dispatcher.Dispatcher(self._handle_message,
+                                                   workers=0)
+        message = _make_message('uuid1', 1)
+        message_dispatcher.dispatch(message, self._ack(message))
+        self.assertEquals([('uuid1', 1)], self.handled)
+        self.assertEquals([1], self.acked)
+
+    def test_dispatch_keeps_instance_order(self):
+        message_dispatcher = dispatcher.Dispatcher(self._handle_message,
+                                                   workers=4,
+                                                   max_in_flight=8)
+        for seq in range(10):
+            message = _make_message('uuid%d' % (seq % 3), seq)
+            message_dispatcher.dispatch(message, self._ack(message))
+        while message_dispatcher.get_stats()['in_flight']:
+            eventlet.sleep(0)
+        message_dispatcher.stop()
+
+        self.assertEquals(10, len(self.handled))
+        self.assertEquals(range(10), sorted(self.acked))
+        for instance_id in ['uuid0', 'uuid1', 'uuid2']:
+            seqs = [seq for handled_id, seq in self.handled
+                    if handled_id == instance_id]
+            self.assertEquals(sorted(seqs), seqs)
+
+    def test_ack_failed_message(self):
+        def fake_handle_message(message):
+            raise Exception()
+
+        message_dispatcher = dispatcher.Dispatcher(fake_handle_message,
+                                                   workers=1)
+        message = _make_message('uuid1', 1)
+        message_dispatcher.dispatch(message, self._ack(message))
+        while message_dispatcher.get_stats()['in_flight']:
+            eventlet.sleep(0)
+        message_dispatcher.stop()
+        self.assertEquals([1], self.acked)
+
+    def test_bounded_in_flight(self):
+        message_dispatcher = dispatcher.Dispatcher(self._handle_message,
+                                                   workers=1,
+                                                   max_in_flight=2)
+        for seq in range(2):
+            message_dispatcher.dispatch(_make_message('uuid1', seq))
+        self.assertEquals(2, message_dispatcher.get_stats()['in_flight'])
+
+        # third dispatch waits until a lane finished a message
+        message_dispatcher.dispatch(_make_message('uuid1', 2))
+        self.assertTrue(len(self.handled) >= 1)
+        message_dispatcher.stop()
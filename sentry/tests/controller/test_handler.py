@@ -4,6 +4,11 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+import os
+import shutil
+import tempfile
+
+from sentry.common import file_watcher
 from sentry.controller import handler
 from sentry.controller import helper as controller_helper
 from sentry.openstack.common import importutils
@@ -22,7 +27,7 @@ fake_message = {
 RESULT_SET = []
 
 
-def fake_handle_before_alarm(message):
+def fake_handle_before_alarm(message, actions=None):
     pass
 
 
@@ -66,6 +71,10 @@ class TestHandler(test.TestCase):
 
     def tearDown(self):
         super(TestHandler, self).tearDown()
+        test.FLAGS.clear_override('alarm_filter_config')
+        test.FLAGS.clear_override('owner_filter_config')
+        test.FLAGS.clear_override('alarm_level')
+        file_watcher.reset()
 
     def test_handle_message(self):
         self.stubs.Set(controller_helper, "handle_before_alarm",
@@ -76,6 +85,27 @@ class TestHandler(test.TestCase):
         self.controller_handler.handle_message(message)
         self.assertEquals('test', message.get('alarm_owner'))
 
+    def test_pipeline_context(self):
+        self.flags(alarm_level='ERROR')
+        self.stubs.Set(handler.Handler, "_get_filter_drivers",
+                       fake_get_filter_drivers)
+        context = self.controller_handler._get_context()
+        self.assertEquals(frozenset(['ERROR', 'FATAL']), context.alarm_levels)
+        self.assertTrue(context is self.controller_handler._get_context())
+
+        self.controller_handler._reset_filter_drivers()
+        self.assertFalse(context is self.controller_handler._get_context())
+
+    def test_handle_message_skip_level(self):
+        self.flags(alarm_level='ERROR')
+        self.stubs.Set(controller_helper, "handle_before_alarm",
+                       fake_handle_before_alarm)
+        self.stubs.Set(handler.Handler, "_do_filter", fake_do_filter)
+        self.stubs.Set(handler.Handler, "_do_send_alarm", fake_do_send_alarm)
+        message = dict(fake_message, priority='INFO')
+        self.controller_handler.handle_message(message)
+        self.assertIsNone(message.get('alarm_owner'))
+
     def test_handle_message_exception(self):
         self.stubs.Set(controller_helper, "handle_before_alarm",
                        fake_handle_before_alarm)
@@ -105,3 +135,57 @@ class TestHandler(test.TestCase):
         self.assertIsInstance(
                 self.controller_handler._filter_drivers.get('test_driver'),
                 FakeFilter)
+
+    def test_do_filter_with_index(self):
+        config_dir = os.path.join(os.path.dirname(__file__), '..', 'filter')
+        self.flags(alarm_filter_config=os.path.join(config_dir,
+                                                    'alarm_filter.conf'),
+                   owner_filter_config=os.path.join(config_dir,
+                                                    'owner_filter.conf'))
+        flow_data = {'alarm_type': 'compute.instance.update',
+                     'alarm_level': 'INFO',
+                     'alarm_owner': []}
+        result = self.controller_handler._do_filter(flow_data)
+        self.assertEquals(['platform_manager'], result['alarm_owner'])
+        self.assertTrue(self.controller_handler._filter_index)
+
+        self.controller_handler._reset_filter_drivers()
+        self.assertIsNone(self.controller_handler._filter_index)
+
+    def test_reload_filters(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        config_dir = os.path.join(os.path.dirname(__file__), '..', 'filter')
+        alarm_filter_config = os.path.join(temp_dir, 'alarm_filter.conf')
+        shutil.copy(os.path.join(config_dir, 'alarm_filter.conf'),
+                    alarm_filter_config)
+        self.flags(alarm_filter_config=alarm_filter_config,
+                   owner_filter_config=os.path.join(config_dir,
+                                                    'owner_filter.conf'))
+
+        def do_filter():
+            flow_data = {'alarm_type': 'instance.reboot.start',
+                         'alarm_level': 'ERROR',
+                         'alarm_owner': []}
+            return self.controller_handler._do_filter(flow_data)
+
+        self.assertIsNone(do_filter())
+        old_index = self.controller_handler._filter_index
+
+        with open(alarm_filter_config, 'w') as rule_file:
+            rule_file.write('{"sentry_accept_levels": {"ERROR": '
+                            '["instance.reboot.start"]}, '
+                            '"sentry_reject_levels": {"ERROR": []}}')
+        file_watcher.get_watcher().check()
+        self.assertFalse(old_index is self.controller_handler._filter_index)
+        self.assertEquals([], do_filter()['alarm_owner'])
+        self.assertEquals(1,
+                    self.controller_handler.get_reload_stats()['reloads'])
+
+        # broken rule file keeps the old rules
+        with open(alarm_filter_config, 'w') as rule_file:
+            rule_file.write('{"sentry_accept_levels": ')
+        file_watcher.get_watcher().check()
+        self.assertEquals([], do_filter()['alarm_owner'])
+        self.assertEquals(1,
+                    self.controller_handler.get_reload_stats()['failures'])
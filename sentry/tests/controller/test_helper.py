@@ -4,6 +4,8 @@
 # @author: hzyangtk@corp.netease.com
 #
 
+import eventlet
+
 from sentry.common import http_communication
 from sentry.controller import helper
 from sentry.tests import test
@@ -39,17 +41,17 @@ class FakeResponse(object):
         self.status = 200
 
 
-def fake_send_request_to_server(self):
+def fake_send_request_to_server(self, **kwargs):
     return FakeResponse()
 
 
-def fake_send_request_to_server_400(self):
+def fake_send_request_to_server_400(self, **kwargs):
     response = FakeResponse()
     response.status = 400
     return response
 
 
-def fake_send_request_to_server_None(self):
+def fake_send_request_to_server_None(self, **kwargs):
     return None
 
 
@@ -57,13 +59,17 @@ class TestHelper(test.TestCase):
 
     def setUp(self):
         super(TestHelper, self).setUp()
+        helper.reset()
 
     def tearDown(self):
         super(TestHelper, self).tearDown()
         global TEMP_RESULT
         TEMP_RESULT = None
+        helper.reset()
+        test.FLAGS.clear_override('platform_notify_workers')
 
     def test_handle_before_alarm(self):
+        self.flags(platform_notify_workers=0)
         self.flags(enable_platform_stop_alarm=True)
         self.flags(enable_platform_binding=True)
         self.stubs.Set(helper, "_notify_platform_stop_alarm",
@@ -116,3 +122,103 @@ class TestHelper(test.TestCase):
                        "send_request_to_server",
                        fake_send_request_to_server_None)
         helper._notify_platform_binding(fake_message)
+
+    def test_handle_before_alarm_in_background(self):
+        self.flags(enable_platform_stop_alarm=True)
+        self.flags(enable_platform_binding=True)
+        self.stubs.Set(helper, "_notify_platform_stop_alarm",
+                       fake_notify_platform_stop_alarm)
+        self.stubs.Set(helper, "_notify_platform_binding",
+                       fake_notify_platform_binding)
+        create_message = fake_message.copy()
+        create_message['event_type'] = 'compute.instance.create.end'
+        helper.handle_before_alarm(create_message)
+        self.assertIsNone(TEMP_RESULT)
+
+        # NOTE(hzyangtk): delete cancels the pending binding
+        helper.handle_before_alarm(fake_message.copy())
+        eventlet.sleep(0)
+        self.assertEquals('destroy', TEMP_RESULT)
+        stats = helper.get_stats()
+        self.assertEquals(1, stats['cancelled'])
+        self.assertEquals(1, stats['sent'])
+        self.assertEquals(0, stats['pending'])
+
+    def test_rename_keeps_pending_create_binding(self):
+        self.flags(enable_platform_binding=True)
+        sent = []
+        self.stubs.Set(http_communication.HttpCommunication,
+                       "send_request_to_server",
+                       lambda self, **kwargs: sent.append(kwargs) or
+                           FakeResponse())
+        create_message = fake_message.copy()
+        create_message['event_type'] = 'compute.instance.create.end'
+        create_message['payload'] = dict(fake_message['payload'],
+                fixed_ips=[{'address': '10.0.0.2'}])
+        rename_message = fake_message.copy()
+        rename_message['event_type'] = 'compute.instance.update'
+        rename_message['payload'] = dict(fake_message['payload'],
+                                         old_display_name='instance-name',
+                                         display_name='new-name')
+        helper.handle_before_alarm(create_message)
+        helper.handle_before_alarm(rename_message)
+        eventlet.sleep(0)
+
+        self.assertEquals(1, len(sent))
+        self.assertEquals('new-name:10.0.0.2',
+                          sent[0]['params_dict']['ScreenName'])
+        self.assertEquals(1, helper.get_notifier().get_stats()['coalesced'])
+
+
+class TestPlatformNotifier(test.TestCase):
+
+    def setUp(self):
+        super(TestPlatformNotifier, self).setUp()
+        self.notified = []
+        self.notifier = helper.PlatformNotifier(workers=2, queue_size=2)
+
+    def tearDown(self):
+        super(TestPlatformNotifier, self).tearDown()
+        self.notifier.stop()
+
+    def test_coalesce(self):
+        for name in ('name1', 'name2', 'name3'):
+            self.notifier.submit(('binding', 'instance1'),
+                                 self.notified.append, name)
+        self.notifier.submit(('binding', 'instance2'),
+                             self.notified.append, 'other')
+        eventlet.sleep(0)
+        self.assertEquals(['name3', 'other'], self.notified)
+        self.assertEquals(2, self.notifier.get_stats()['coalesced'])
+
+    def test_drop_when_full(self):
+        self.assertTrue(self.notifier.submit('key1', self.notified.append, 1))
+        self.assertTrue(self.notifier.submit('key2', self.notified.append, 2))
+        self.assertFalse(self.notifier.submit('key3', self.notified.append,
+                                              3))
+        eventlet.sleep(0)
+        self.assertEquals([1, 2], self.notified)
+        self.assertEquals(1, self.notifier.get_stats()['dropped'])
+
+    def test_failed_notification(self):
+        def fake_notify(message):
+            raise Exception()
+
+        self.notifier.submit('key1', fake_notify, 1)
+        self.notifier.submit('key2', self.notified.append, 2)
+        eventlet.sleep(0)
+        self.assertEquals([2], self.notified)
+        self.assertEquals(1, self.notifier.get_stats()['failed'])
+
+    def test_coalesce_with_merge(self):
+        for name in ('name1', 'name2'):
+            self.notifier.submit(('binding', 'instance1'),
+                                 self.notified.append, [name],
+                                 merge=lambda old, new: old + new)
+        eventlet.sleep(0)
+        self.assertEquals([['name1', 'name2']], self.notified)
+
+    def test_inline(self):
+        notifier = helper.PlatformNotifier(workers=0)
+        notifier.submit('key1', self.notified.append, 1)
+        self.assertEquals([1], self.notified)
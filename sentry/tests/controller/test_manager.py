@@ -0,0 +1,75 @@
+#
+# Created on 2013-4-16
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+from sentry.common import service
+from sentry.controller import dispatcher
+from sentry.controller import handler
+from sentry.controller import helper
+from sentry.controller import manager
+from sentry.openstack.common import rpc
+from sentry.tests import test
+
+
+class TestManager(test.TestCase):
+
+    def setUp(self):
+        super(TestManager, self).setUp()
+        self.stubs.Set(rpc, 'create_connection', lambda new: None)
+        self.flags(nova_mq_level_list=['error', 'info'],
+                   glance_mq_level_list=['error', 'info', 'warn'])
+
+    def tearDown(self):
+        super(TestManager, self).tearDown()
+        test.FLAGS.clear_override('nova_mq_level_list')
+        test.FLAGS.clear_override('glance_mq_level_list')
+        test.FLAGS.clear_override('controller_queue_sharding')
+        service.reset_stats()
+
+    def _get_queue_names(self, worker_index, worker_count):
+        mgr = manager.Manager(worker_index, worker_count)
+        return [queue[2] for queue in mgr.get_queues()]
+
+    def test_single_worker_gets_all_queues(self):
+        self.assertEquals(['notifications.error', 'notifications.info',
+                           'glance_notifications.error',
+                           'glance_notifications.info',
+                           'glance_notifications.warn'],
+                          self._get_queue_names(0, 1))
+
+    def test_queues_sharded_across_workers(self):
+        queues = [self._get_queue_names(index, 2) for index in range(2)]
+        self.assertEquals(['notifications.error',
+                           'glance_notifications.error',
+                           'glance_notifications.warn'], queues[0])
+        self.assertEquals(['notifications.info',
+                           'glance_notifications.info'], queues[1])
+
+    def test_more_workers_than_queues(self):
+        self.assertEquals(['notifications.error'],
+                          self._get_queue_names(0, 7))
+        self.assertEquals(['notifications.error'],
+                          self._get_queue_names(5, 7))
+
+    def test_workers_compete_without_sharding(self):
+        self.flags(controller_queue_sharding=False)
+        self.assertEquals(5, len(self._get_queue_names(1, 3)))
+
+    def test_register_stats(self):
+        service.reset_stats()
+        helper.reset()
+        mgr = manager.Manager()
+        mgr.dispatcher = dispatcher.Dispatcher(lambda message: None,
+                                               workers=0)
+        mgr.handler = handler.Handler()
+        mgr.register_stats()
+        names = ['alarm_dedup', 'alarm_outbox', 'dispatcher',
+                 'filter_reload', 'http_circuit', 'http_retry',
+                 'instance_ip_cache', 'platform_notifier']
+        self.assertEquals(names, sorted(service._STATS))
+        # NOTE(hzyangtk): dedup and outbox are disabled by default and
+        #                 no platform notification was sent, nothing to
+        #                 log for them
+        self.assertEquals(len(names) - 3, service.log_stats())
@@ -0,0 +1,72 @@
+#
+# Created on 2013-4-19
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import os
+import shutil
+import tempfile
+
+from sentry.common import file_watcher
+from sentry.file_cache import alarm_content
+from sentry.tests import test
+
+
+def fake_getmtime(path):
+    raise AssertionError('file checked on hot path')
+
+
+class TestAlarmContent(test.TestCase):
+
+    def setUp(self):
+        super(TestAlarmContent, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'alarm_content.json')
+        self._write('{"alarm_name": ["InstanceError"]}')
+        self.flags(alarm_content_file=self.path)
+        self.stubs.Set(file_watcher.FileWatcher, 'start', lambda self: None)
+        file_watcher.reset()
+        alarm_content.reset()
+
+    def tearDown(self):
+        super(TestAlarmContent, self).tearDown()
+        alarm_content.reset()
+        file_watcher.reset()
+        test.FLAGS.clear_override('alarm_content_file')
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, data):
+        with open(self.path, 'w') as content_file:
+            content_file.write(data)
+
+    def test_get_alarm_content(self):
+        content = alarm_content.get_alarm_content()
+        self.assertEquals({'alarm_name': ['InstanceError']}, content)
+
+        self.stubs.Set(os.path, 'getmtime', fake_getmtime)
+        self.assertTrue(content is alarm_content.get_alarm_content())
+
+    def test_reload_by_watcher(self):
+        content = alarm_content.get_alarm_content()
+        self._write('{"alarm_name": ["NosError"]}')
+        file_watcher.get_watcher().check()
+        new_content = alarm_content.get_alarm_content()
+        self.assertEquals({'alarm_name': ['NosError']}, new_content)
+        self.assertEquals({'alarm_name': ['InstanceError']}, content)
+
+    def test_keep_snapshot_when_reload_failed(self):
+        alarm_content.get_alarm_content()
+        self._write('{"alarm_name": ')
+        file_watcher.get_watcher().check()
+        self.assertEquals({'alarm_name': ['InstanceError']},
+                          alarm_content.get_alarm_content())
+
+    def test_watch_again_after_watcher_reset(self):
+        alarm_content.get_alarm_content()
+        file_watcher.reset()
+        alarm_content.get_alarm_content()
+        self._write('{"alarm_name": ["NbsError"]}')
+        file_watcher.get_watcher().check()
+        self.assertEquals({'alarm_name': ['NbsError']},
+                          alarm_content.get_alarm_content())
@@ -0,0 +1,80 @@
+#
+# Created on 2013-4-17
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import copy
+import os
+
+from sentry.filter import alarm_filter
+from sentry.filter import index as filter_index
+from sentry.filter import owner_filter
+from sentry.tests import test
+
+
+ALARM_TYPES = ['instance.create.start', 'instance.delete.end',
+               'compute.instance.update', 'unknown.type', None]
+ALARM_LEVELS = ['ERROR', 'INFO', 'WARN', None]
+
+
+class FakeFilter(object):
+
+    def filter(self, flow_data):
+        return flow_data
+
+
+def run_chain(drivers, flow_data):
+    for driver in drivers:
+        try:
+            flow_data = driver.filter(flow_data)
+        except Exception:
+            pass
+    return flow_data
+
+
+class TestFilterIndex(test.TestCase):
+
+    def setUp(self):
+        super(TestFilterIndex, self).setUp()
+        config_dir = os.path.dirname(__file__)
+        self.flags(alarm_filter_config=os.path.join(config_dir,
+                                                    'alarm_filter.conf'),
+                   owner_filter_config=os.path.join(config_dir,
+                                                    'owner_filter.conf'))
+        self.drivers = [alarm_filter.AlarmFilter(),
+                        owner_filter.OwnerFilter()]
+
+    def tearDown(self):
+        super(TestFilterIndex, self).tearDown()
+        test.FLAGS.clear_override('alarm_filter_config')
+        test.FLAGS.clear_override('owner_filter_config')
+
+    def _assert_same_as_chain(self, drivers):
+        index = filter_index.FilterIndex.build(drivers)
+        for alarm_level in ALARM_LEVELS:
+            for alarm_type in ALARM_TYPES:
+                flow_data = {'alarm_type': alarm_type,
+                             'alarm_level': alarm_level,
+                             'alarm_owner': []}
+                expect_result = run_chain(drivers, copy.deepcopy(flow_data))
+                self.assertEquals(expect_result, index.filter(flow_data))
+
+    def test_same_as_chain(self):
+        self._assert_same_as_chain(self.drivers)
+        self._assert_same_as_chain(list(reversed(self.drivers)))
+        self._assert_same_as_chain(self.drivers[:1])
+
+    def test_lookup(self):
+        index = filter_index.FilterIndex.build(self.drivers)
+        self.assertEquals(('product_manager', 'platform_manager'),
+                          index.lookup('ERROR', 'instance.create.start'))
+        self.assertEquals(('platform_manager',),
+                          index.lookup('INFO', 'compute.instance.update'))
+        self.assertIsNone(index.lookup('ERROR', 'instance.delete.end'))
+        self.assertIsNone(index.lookup('ERROR', 'unknown.type'))
+        self.assertIsNone(index.lookup('WARN', 'instance.create.start'))
+
+    def test_not_compiled(self):
+        self.assertIsNone(filter_index.FilterIndex.build(
+                                        self.drivers + [FakeFilter()]))
@@ -0,0 +1,238 @@
+#
+# Created on 2013-4-27
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import eventlet
+import kombu.entity
+
+from sentry.openstack.common.rpc import impl_kombu
+from sentry.tests import test
+
+
+class FakeChannel(object):
+
+    def __init__(self):
+        self.acked = []
+        self.qos = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acked.append((delivery_tag, multiple))
+
+    def basic_qos(self, prefetch_size, prefetch_count, a_global):
+        self.qos.append((prefetch_size, prefetch_count, a_global))
+
+    def message_to_python(self, raw_message):
+        return FakeMessage(*raw_message)
+
+
+class FakeMessage(object):
+
+    def __init__(self, delivery_tag, payload):
+        self.delivery_tag = delivery_tag
+        self._payload = payload
+
+    @property
+    def payload(self):
+        if isinstance(self._payload, Exception):
+            raise self._payload
+        return self._payload
+
+    def ack(self):
+        pass
+
+
+class FakeTimer(object):
+
+    def __init__(self, func):
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeQueue(object):
+
+    def __init__(self, **kwargs):
+        self.consumed = []
+        self.callback = None
+
+    def declare(self):
+        pass
+
+    def consume(self, *args, **kwargs):
+        self.consumed.append(kwargs['consumer_tag'])
+        self.callback = kwargs['callback']
+
+
+class FakeConsumer(object):
+    ack_batcher = None
+
+
+class TestAckBatcher(test.TestCase):
+
+    def setUp(self):
+        super(TestAckBatcher, self).setUp()
+        self.timers = []
+        self.stubs.Set(eventlet, 'spawn_after', self._fake_spawn_after)
+        self.channel = FakeChannel()
+
+    def _fake_spawn_after(self, seconds, func, *args, **kwargs):
+        timer = FakeTimer(func)
+        self.timers.append(timer)
+        return timer
+
+    def _track(self, batcher, tags):
+        for tag in tags:
+            batcher.track(tag)
+
+    def test_ack_contiguous_prefix(self):
+        batcher = impl_kombu.AckBatcher(self.channel, 3, 1)
+        self._track(batcher, [1, 2, 3, 4])
+        batcher.ack(2)
+        batcher.ack(3)
+        batcher.ack(4)
+        # NOTE(hzyangtk): message 1 is in flight, nothing can be acked.
+        self.assertEquals([], self.channel.acked)
+        batcher.ack(1)
+        self.assertEquals([(4, True)], self.channel.acked)
+
+    def test_ack_stops_at_unfinished(self):
+        batcher = impl_kombu.AckBatcher(self.channel, 2, 1)
+        self._track(batcher, [1, 2, 3, 4])
+        batcher.ack(1)
+        batcher.ack(3)
+        batcher.ack(4)
+        self.assertEquals([], self.channel.acked)
+        batcher.ack(2)
+        self.assertEquals([(4, True)], self.channel.acked)
+
+    def test_flush_on_timer(self):
+        batcher = impl_kombu.AckBatcher(self.channel, 10, 1)
+        self._track(batcher, [1, 2])
+        batcher.ack(1)
+        self.assertEquals(1, len(self.timers))
+        batcher.ack(2)
+        self.assertEquals(1, len(self.timers))
+        self.assertEquals([], self.channel.acked)
+
+        self.timers[0].func()
+        self.assertEquals([(2, True)], self.channel.acked)
+        # nothing pending, no more ack
+        batcher.flush()
+        self.assertEquals([(2, True)], self.channel.acked)
+
+    def test_flush_cancels_timer(self):
+        batcher = impl_kombu.AckBatcher(self.channel, 2, 1)
+        self._track(batcher, [1, 2])
+        batcher.ack(1)
+        batcher.ack(2)
+        self.assertTrue(self.timers[0].cancelled)
+        self.assertEquals([(2, True)], self.channel.acked)
+
+    def test_discard(self):
+        batcher = impl_kombu.AckBatcher(self.channel, 10, 1)
+        self._track(batcher, [1, 2])
+        batcher.ack(1)
+        batcher.discard()
+        self.assertTrue(self.timers[0].cancelled)
+        batcher.ack(2)
+        batcher.flush()
+        self.assertEquals([], self.channel.acked)
+
+
+class TestConnectionAckBatch(test.TestCase):
+
+    def _connection(self):
+        connection = impl_kombu.Connection.__new__(impl_kombu.Connection)
+        connection.ack_batcher = None
+        connection.memory_transport = False
+        connection.channel = FakeChannel()
+        connection.consumers = [FakeConsumer()]
+        return connection
+
+    def test_new_batcher_on_reconnect(self):
+        connection = self._connection()
+        connection.set_ack_batch(10, 1)
+        old_batcher = connection.ack_batcher
+        old_batcher.track(1)
+        old_batcher.ack(1)
+
+        connection.channel = FakeChannel()
+        connection._reset_ack_batcher()
+        self.assertFalse(connection.ack_batcher is old_batcher)
+        self.assertTrue(connection.consumers[0].ack_batcher is
+                        connection.ack_batcher)
+        self.assertTrue(connection.ack_batcher.channel is connection.channel)
+
+        # NOTE(hzyangtk): acks of messages delivered on the old channel
+        #                 are dropped, the broker redelivers them.
+        old_batcher.flush()
+        self.assertEquals([], old_batcher.channel.acked)
+
+    def test_no_batcher_without_batch(self):
+        connection = self._connection()
+        connection.set_ack_batch(1, 1)
+        self.assertIsNone(connection.ack_batcher)
+
+
+class TestConsumerPrefetch(test.TestCase):
+
+    def setUp(self):
+        super(TestConsumerPrefetch, self).setUp()
+        self.stubs.Set(kombu.entity, 'Queue', FakeQueue)
+        self.channel = FakeChannel()
+
+    def test_basic_qos_with_prefetch_count(self):
+        consumer = impl_kombu.ConsumerBase(self.channel, lambda msg: None,
+                                           1, prefetch_count=20)
+        consumer.consume()
+        self.assertEquals([(0, 20, False)], self.channel.qos)
+        self.assertEquals(['1'], consumer.queue.consumed)
+
+    def test_no_basic_qos_without_prefetch_count(self):
+        consumer = impl_kombu.ConsumerBase(self.channel, lambda msg: None, 1)
+        consumer.consume()
+        self.assertEquals([], self.channel.qos)
+
+
+class TestConsumerAckBatch(test.TestCase):
+
+    def setUp(self):
+        super(TestConsumerAckBatch, self).setUp()
+        self.stubs.Set(kombu.entity, 'Queue', FakeQueue)
+        self.channel = FakeChannel()
+        self.processed = []
+
+    def _consume(self, messages, callback, manual_ack=False):
+        consumer = impl_kombu.ConsumerBase(self.channel, callback, 1,
+                                           manual_ack=manual_ack)
+        consumer.ack_batcher = impl_kombu.AckBatcher(self.channel, 4, 1)
+        consumer.consume()
+        for message in messages:
+            consumer.queue.callback(message)
+        return consumer
+
+    def test_poison_message_between_good_ones(self):
+        def callback(payload):
+            if payload == 'poison':
+                raise ValueError(payload)
+            self.processed.append(payload)
+        self._consume([(1, 'a'), (2, 'poison'), (3, 'b'),
+                       (4, ValueError('bad payload')), (5, 'c')], callback)
+        self.assertEquals(['a', 'b', 'c'], self.processed)
+        self.assertEquals([(4, True)], self.channel.acked)
+
+    def test_acked_then_failed_finished_once(self):
+        def callback(payload, ack):
+            ack()
+            if payload == 'poison':
+                raise ValueError(payload)
+            self.processed.append(payload)
+        consumer = self._consume([(1, 'a'), (2, 'poison'), (3, 'b'),
+                                  (4, 'c')], callback, manual_ack=True)
+        self.assertEquals(['a', 'b', 'c'], self.processed)
+        self.assertEquals([(4, True)], self.channel.acked)
+        self.assertEquals(set(), consumer.ack_batcher._finished)
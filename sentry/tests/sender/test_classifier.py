@@ -0,0 +1,82 @@
+#
+# Created on 2013-4-19
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+from sentry.sender import classifier
+from sentry.tests import test
+
+
+FORMATTERS = ['InstanceOffLine', 'InstanceError', 'NosError', 'NbsError',
+              'UnknownError']
+
+fake_alarm_event_type = {
+    'InstanceError': ['compute.instance.update'],
+    'NosError': ['api_keypairs.nos_connection_failure',
+                 'compute.instance.update'],
+    'NbsError': ['api_nbs.nvs_connect_nbs_failure'],
+    'PlatformError': ['platform.error'],
+    'InstanceOffLine': ['monitor.vm.down'],
+    'InstanceSuspendError': {'event_types': ['compute.instance.update'],
+                             'formatter': 'InstanceError',
+                             'payload': {'state': 'suspended'}},
+}
+
+
+def _make_message(event_type, state=None):
+    return {'event_type': event_type, 'payload': {'state': state}}
+
+
+class TestAlarmClassifier(test.TestCase):
+
+    def setUp(self):
+        super(TestAlarmClassifier, self).setUp()
+        classifier.reset()
+        self.classifier = classifier.AlarmClassifier(fake_alarm_event_type,
+                                                     FORMATTERS)
+
+    def tearDown(self):
+        super(TestAlarmClassifier, self).tearDown()
+        classifier.reset()
+
+    def test_classify(self):
+        self.assertEquals(('InstanceOffLine', 'InstanceOffLine'),
+                self.classifier.classify(_make_message('monitor.vm.down')))
+        self.assertEquals(('NbsError', 'NbsError'),
+                self.classifier.classify(
+                        _make_message('api_nbs.nvs_connect_nbs_failure')))
+        self.assertIsNone(self.classifier.classify(
+                                        _make_message('unknown.event')))
+
+    def test_payload_predicate(self):
+        self.assertEquals(('InstanceError', 'InstanceError'),
+                self.classifier.classify(
+                        _make_message('compute.instance.update', 'error')))
+        # InstanceError does not match, falls through to NosError
+        self.assertEquals(('NosError', 'NosError'),
+                self.classifier.classify(
+                        _make_message('compute.instance.update', 'active')))
+
+    def test_alarm_type_from_config(self):
+        alarm_event_type = {'InstanceSuspendError':
+                                fake_alarm_event_type['InstanceSuspendError']}
+        alarm_classifier = classifier.AlarmClassifier(alarm_event_type,
+                                                      FORMATTERS)
+        self.assertEquals(('InstanceSuspendError', 'InstanceError'),
+                alarm_classifier.classify(
+                    _make_message('compute.instance.update', 'suspended')))
+        self.assertIsNone(alarm_classifier.classify(
+                    _make_message('compute.instance.update', 'error')))
+
+    def test_skip_alarm_type_without_formatter(self):
+        self.assertIsNone(self.classifier.classify(
+                                        _make_message('platform.error')))
+
+    def test_get_classifier(self):
+        content = {'alarm_event_type': fake_alarm_event_type}
+        alarm_classifier = classifier.get_classifier(content, FORMATTERS)
+        self.assertTrue(alarm_classifier is
+                        classifier.get_classifier(content, FORMATTERS))
+        self.assertFalse(alarm_classifier is
+                         classifier.get_classifier(dict(content), FORMATTERS))
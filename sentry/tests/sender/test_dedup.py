@@ -0,0 +1,91 @@
+#
+# Created on 2013-4-20
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import eventlet
+
+from sentry.sender import dedup
+from sentry.tests import test
+
+
+TIMERS = []
+
+
+def fake_spawn_after(seconds, func, *args, **kwargs):
+    TIMERS.append((func, args))
+
+
+def _make_format_data(identifier='instance-name:1.1.1.1'):
+    return {'projectId': '000000001',
+            'namespace': 'openstack',
+            'alarmType': 'InstanceOffLine',
+            'alarmContent': 'instance offline',
+            'identifier': identifier}
+
+
+class TestAlarmDeduplicator(test.TestCase):
+
+    def setUp(self):
+        super(TestAlarmDeduplicator, self).setUp()
+        del TIMERS[:]
+        self.stubs.Set(eventlet, 'spawn_after', fake_spawn_after)
+        self.sent = []
+        self.deduplicator = dedup.AlarmDeduplicator(window=60)
+
+    def tearDown(self):
+        super(TestAlarmDeduplicator, self).tearDown()
+        dedup.reset()
+        test.FLAGS.clear_override('alarm_dedup_window')
+
+    def _submit(self, format_data):
+        key = dedup.get_dedup_key(format_data, ['product_manager'])
+        return self.deduplicator.submit(key, format_data, self.sent.append)
+
+    def _close_windows(self):
+        timers = TIMERS[:]
+        del TIMERS[:]
+        for func, args in timers:
+            func(*args)
+
+    def test_suppress_and_aggregate(self):
+        self.assertTrue(self._submit(_make_format_data()))
+        for i in range(3):
+            self.assertFalse(self._submit(_make_format_data()))
+        self.assertEquals(1, len(self.sent))
+
+        self._close_windows()
+        self.assertEquals(2, len(self.sent))
+        self.assertEquals('instance offline (repeated 3 times in 60 '
+                          'seconds)', self.sent[1]['alarmContent'])
+        self.assertEquals({'sent': 1, 'suppressed': 3, 'aggregated': 1,
+                           'windows': 1}, self.deduplicator.get_stats())
+
+        # quiet window closes the key
+        self._close_windows()
+        self.assertEquals(0, self.deduplicator.get_stats()['windows'])
+        self.assertTrue(self._submit(_make_format_data()))
+
+    def test_different_keys(self):
+        self.assertTrue(self._submit(_make_format_data('a')))
+        self.assertTrue(self._submit(_make_format_data('b')))
+        self.assertEquals(2, len(self.sent))
+
+    def test_disabled(self):
+        deduplicator = dedup.AlarmDeduplicator(window=0)
+        for i in range(2):
+            self.assertTrue(deduplicator.submit('key', _make_format_data(),
+                                                self.sent.append))
+        self.assertEquals(2, len(self.sent))
+        self.assertEquals([], TIMERS)
+
+    def test_disabled_by_default(self):
+        self.assertEquals(0, dedup.AlarmDeduplicator().window)
+
+    def test_get_stats(self):
+        dedup.reset()
+        self.assertIsNone(dedup.get_stats())
+        dedup.reset()
+        self.flags(alarm_dedup_window=60)
+        self.assertEquals(0, dedup.get_stats()['sent'])
@@ -17,14 +17,6 @@ fake_message = {
     'payload': {'state': 'error'}
 }
 
-fake_alarm_content = {
-    'alarm_event_type': {'InstanceOffLine': 'compute.test',
-                         'InstanceError': 'compute.test',
-                         'NosError': 'compute.test',
-                         'NbsError': 'compute.test'
-                         }
-}
-
 
 def fake_get_instance_by_UUID(self, uuid):
     return fake_instance.FakeInstance(
@@ -39,45 +31,11 @@ class TestHandler(test.TestCase):
 
     def setUp(self):
         super(TestHandler, self).setUp()
+        handler.reset_instance_ip_cache()
 
     def tearDown(self):
         super(TestHandler, self).tearDown()
 
-    def test_is_instance_down(self):
-        result = handler.is_instance_down(fake_message, fake_alarm_content)
-        self.assertTrue(result)
-
-        # not instance down
-        result = handler.is_instance_down(fake_message, {})
-        self.assertFalse(result)
-
-    def test_is_instance_state_error(self):
-        result = handler.is_instance_state_error(fake_message,
-                                                 fake_alarm_content)
-        self.assertTrue(result)
-
-        # not instance state error
-        result = handler.is_instance_state_error(fake_message, {})
-        self.assertFalse(result)
-
-    def test_is_nos_connection_failure(self):
-        result = handler.is_nos_connection_failure(fake_message,
-                                                   fake_alarm_content)
-        self.assertTrue(result)
-
-        # not instance down
-        result = handler.is_nos_connection_failure(fake_message, {})
-        self.assertFalse(result)
-
-    def test_is_nbs_connection_failure(self):
-        result = handler.is_nbs_connection_failure(fake_message,
-                                                   fake_alarm_content)
-        self.assertTrue(result)
-
-        # not instance down
-        result = handler.is_nbs_connection_failure(fake_message, {})
-        self.assertFalse(result)
-
     def test_get_instance_ip(self):
         self.stubs.Set(novaclient_helper.CallNovaClient,
                        "get_instance_by_UUID", fake_get_instance_by_UUID)
@@ -85,12 +43,50 @@ class TestHandler(test.TestCase):
         self.assertEquals('1.1.1.1', result)
 
         # get instance ip with exception happens
+        handler.reset_instance_ip_cache()
         self.stubs.Set(novaclient_helper.CallNovaClient,
                        "get_instance_by_UUID",
                        fake_get_instance_by_UUID_not_found)
         result = handler.get_instance_ip('test_uuid')
         self.assertEquals('-', result)
 
+    def test_get_instance_ip_from_cache(self):
+        self.stubs.Set(novaclient_helper.CallNovaClient,
+                       "get_instance_by_UUID", fake_get_instance_by_UUID)
+        handler.get_instance_ip('test_uuid')
+        self.stubs.Set(novaclient_helper.CallNovaClient,
+                       "get_instance_by_UUID",
+                       fake_get_instance_by_UUID_not_found)
+        result = handler.get_instance_ip('test_uuid')
+        self.assertEquals('1.1.1.1', result)
+
+        stats = handler.get_instance_ip_cache_stats()
+        self.assertEquals(1, stats['hits'])
+        self.assertEquals(1, stats['misses'])
+
+    def test_refresh_instance_ip_cache(self):
+        self.stubs.Set(novaclient_helper.CallNovaClient,
+                       "get_instance_by_UUID",
+                       fake_get_instance_by_UUID_not_found)
+        message = {'event_type': 'compute.instance.create.end',
+                   'payload': {'instance_id': 'test_uuid',
+                               'fixed_ips': [{'address': '2.2.2.2'}]}}
+        handler.refresh_instance_ip_cache(message)
+        self.assertEquals('2.2.2.2', handler.get_instance_ip('test_uuid'))
+
+        # update notification without ip keeps the cached ip
+        message = {'event_type': 'compute.instance.update',
+                   'payload': {'instance_id': 'test_uuid',
+                               'state': 'active'}}
+        handler.refresh_instance_ip_cache(message)
+        self.assertEquals('2.2.2.2', handler.get_instance_ip('test_uuid'))
+
+        # delete notification evicts the instance
+        message = {'event_type': 'compute.instance.delete.end',
+                   'payload': {'instance_id': 'test_uuid'}}
+        handler.refresh_instance_ip_cache(message)
+        self.assertEquals('-', handler.get_instance_ip('test_uuid'))
+
     def test_set_alarm_timestamp(self):
         # timestamp is not in message
         result = handler.set_alarm_timestamp(fake_message)
@@ -0,0 +1,274 @@
+#
+# Created on 2013-4-21
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import socket
+import time
+
+import eventlet
+
+from sentry.common import circuit_breaker
+from sentry.common import http_pool
+from sentry.common import retry_scheduler
+from sentry.sender import http_sender
+from sentry.sender import outbox
+from sentry.tests import test
+
+
+class FakeResponse(object):
+
+    def __init__(self, status=200):
+        self.status = status
+
+
+fake_format_data = {
+    'projectId': '000000001',
+    'namespace': 'openstack',
+    'alarmType': 'InstanceOffLine',
+    'alarmTime': 'test_timestamp',
+    'alarmContent': 'test',
+    'alarmContentSummary': 'test',
+    'identifier': 'test'
+}
+
+
+class TestHttpSender(test.TestCase):
+
+    def setUp(self):
+        super(TestHttpSender, self).setUp()
+        self.sent = []
+        self.in_flight = [0, 0]
+        self.stubs.Set(http_sender, 'platform_send_alarm',
+                       self._fake_platform_send_alarm)
+
+    def tearDown(self):
+        super(TestHttpSender, self).tearDown()
+        test.FLAGS.clear_override('platform_send_concurrency')
+
+    def _fake_platform_send_alarm(self, data):
+        self.in_flight[0] += 1
+        self.in_flight[1] = max(self.in_flight)
+        eventlet.sleep(0)
+        self.in_flight[0] -= 1
+        self.sent.append(data)
+        if data['projectId'] == 'bad':
+            return FakeResponse(500)
+        if data['projectId'] == 'error':
+            raise Exception()
+        return FakeResponse()
+
+    def test_platform_send_alarm_batch(self):
+        format_data = fake_format_data.copy()
+        result = http_sender.platform_send_alarm_batch(format_data,
+                                                       ['p1', 'p2', 'p3'])
+        self.assertEquals({'succeeded': ['p1', 'p2', 'p3'], 'failed': []},
+                          result)
+        self.assertEquals(['p1', 'p2', 'p3'],
+                          sorted(data['projectId'] for data in self.sent))
+        self.assertEquals(fake_format_data, format_data)
+        self.assertEquals(3, self.in_flight[1])
+
+    def test_report_failed_projects(self):
+        result = http_sender.platform_send_alarm_batch(fake_format_data,
+                                                ['p1', 'bad', 'error'])
+        self.assertEquals(['p1'], result['succeeded'])
+        self.assertEquals(['bad', 'error'], result['failed'])
+
+    def test_bounded_concurrency(self):
+        self.flags(platform_send_concurrency=2)
+        http_sender.platform_send_alarm_batch(fake_format_data,
+                                              ['p%d' % i for i in range(5)])
+        self.assertEquals(5, len(self.sent))
+        self.assertEquals(2, self.in_flight[1])
+
+
+class TestSendRequest(test.TestCase):
+
+    def setUp(self):
+        super(TestSendRequest, self).setUp()
+        self.flags(url_port='1.1.1.1:80',
+                   product_request_uri='/product',
+                   platform_request_uri='/platform')
+        http_sender.reset()
+        circuit_breaker.reset()
+        self.sent = []
+
+        def fake_send(sender, params):
+            eventlet.sleep(0)
+            self.sent.append((sender.request_uri, params))
+            return FakeResponse()
+
+        self.stubs.Set(http_sender.SendRequest, '_send', fake_send)
+
+    def tearDown(self):
+        super(TestSendRequest, self).tearDown()
+        http_sender.reset()
+        circuit_breaker.reset()
+        test.FLAGS.clear_override('url_port')
+        test.FLAGS.clear_override('product_request_uri')
+        test.FLAGS.clear_override('platform_request_uri')
+        test.FLAGS.clear_override('http_retry_count')
+
+    def test_get_sender(self):
+        sender = http_sender.get_sender('/product')
+        self.assertEquals('/product', sender.request_uri)
+        self.assertEquals('1.1.1.1:80', sender.url)
+        self.assertTrue(sender is http_sender.get_sender('/product'))
+        self.assertFalse(sender is http_sender.get_sender('/platform'))
+
+    def test_concurrent_send(self):
+        pool = eventlet.GreenPool()
+        for i in range(5):
+            pool.spawn(http_sender.product_send_alarm,
+                       dict(fake_format_data, identifier='product'))
+            pool.spawn(http_sender.platform_send_alarm,
+                       dict(fake_format_data, identifier='platform'))
+        pool.waitall()
+        self.assertEquals(10, len(self.sent))
+        for request_uri, params in self.sent:
+            self.assertTrue('identifier=%s' % request_uri[1:] in params)
+
+    def test_spool_failed_alarm(self):
+        spooled = []
+
+        class FakeOutbox(object):
+            def append(self, record):
+                spooled.append(record)
+
+        self.flags(http_retry_count=1)
+        self.stubs.Set(outbox, 'get_outbox', lambda: FakeOutbox())
+        self.stubs.Set(http_sender.SendRequest, '_send',
+                       lambda sender, params: FakeResponse(500))
+        http_sender.product_send_alarm(fake_format_data)
+        self.assertEquals(1, len(spooled))
+        self.assertEquals('/product', spooled[0]['request_uri'])
+
+        self.stubs.Set(http_sender.SendRequest, '_send',
+                       lambda sender, params: FakeResponse())
+        self.assertTrue(http_sender.replay_alarm(spooled[0]))
+
+    def test_open_circuit_spools_alarm(self):
+        spooled = []
+
+        class FakeOutbox(object):
+            def append(self, record):
+                spooled.append(record)
+
+        self.stubs.Set(outbox, 'get_outbox', lambda: FakeOutbox())
+        breaker = http_sender.get_sender('/product').breaker
+        for i in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        self.assertIsNone(http_sender.product_send_alarm(fake_format_data))
+        self.assertEquals([], self.sent)
+        self.assertEquals(1, len(spooled))
+        self.assertFalse(http_sender.replay_alarm(spooled[0]))
+        self.assertEquals([], self.sent)
+
+    def test_open_circuit_retries_without_outbox(self):
+        scheduled = []
+        self.flags(http_retry_count=3)
+        self.stubs.Set(outbox, 'get_outbox', lambda: None)
+        self.stubs.Set(retry_scheduler.SCHEDULER, 'schedule',
+                       lambda endpoint, func, attempts, on_failure=None,
+                              breaker=None:
+                           scheduled.append((func, attempts, breaker)))
+        breaker = http_sender.get_sender('/product').breaker
+        for i in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        self.assertIsNone(http_sender.product_send_alarm(fake_format_data))
+        self.assertEquals([], self.sent)
+        self.assertEquals(1, len(scheduled))
+        func, attempts, retry_breaker = scheduled[0]
+        self.assertEquals(3, attempts)
+        self.assertTrue(retry_breaker is breaker)
+
+        # the retry goes through once the circuit is half open
+        breaker._opened_at -= breaker.reset_timeout
+        self.assertTrue(breaker.allow_request())
+        self.assertTrue(func())
+        self.assertEquals(1, len(self.sent))
+
+
+class FakeClock(object):
+    '''
+        Virtual time, timers of spawn_after run in due order.
+    '''
+    def __init__(self):
+        self.now = 1000.0
+        self.timers = []
+
+    def time(self):
+        return self.now
+
+    def spawn_after(self, seconds, func, *args, **kwargs):
+        self.timers.append((self.now + seconds, func, args, kwargs))
+        self.timers.sort(key=lambda timer: timer[0])
+
+    def run(self):
+        while self.timers:
+            self.now, func, args, kwargs = self.timers.pop(0)
+            func(*args, **kwargs)
+
+
+class FakePool(object):
+
+    def __init__(self, clock, down_until):
+        self.clock = clock
+        self.down_until = down_until
+        self.requests = []
+
+    def request(self, method, uri, body=None, headers={}):
+        self.requests.append(self.clock.now)
+        if self.clock.now < self.down_until:
+            raise socket.error('connection refused')
+        return FakeResponse(), 'ok'
+
+
+class TestSendRequestOutage(test.TestCase):
+
+    def setUp(self):
+        super(TestSendRequestOutage, self).setUp()
+        self.flags(url_port='1.1.1.1:80', product_request_uri='/product')
+        http_sender.reset()
+        circuit_breaker.reset()
+        self.clock = FakeClock()
+        self.stubs.Set(time, 'time', self.clock.time)
+        self.stubs.Set(eventlet, 'spawn_after', self.clock.spawn_after)
+        self.stubs.Set(outbox, 'get_outbox', lambda: None)
+        self.scheduler = retry_scheduler.RetryScheduler()
+        self.stubs.Set(retry_scheduler, 'SCHEDULER', self.scheduler)
+
+    def tearDown(self):
+        super(TestSendRequestOutage, self).tearDown()
+        http_sender.reset()
+        circuit_breaker.reset()
+        test.FLAGS.clear_override('url_port')
+        test.FLAGS.clear_override('product_request_uri')
+
+    def test_outage_longer_than_reset_timeout(self):
+        breaker = http_sender.get_sender('/product').breaker
+        pool = FakePool(self.clock, self.clock.now + breaker.reset_timeout * 4)
+        self.stubs.Set(http_pool, 'get_pool', lambda url: pool)
+        dropped = []
+        self.stubs.Set(http_sender.SendRequest, '_spool',
+                       lambda sender, params: dropped.append(params))
+
+        alarms = breaker.failure_threshold + 3
+        for index in range(alarms):
+            data = dict(fake_format_data, identifier='id%d' % index)
+            self.assertIsNone(http_sender.product_send_alarm(data))
+        self.assertEquals(circuit_breaker.OPEN, breaker.state)
+        self.clock.run()
+
+        self.assertEquals([], dropped)
+        self.assertEquals(circuit_breaker.CLOSED, breaker.state)
+        stats = self.scheduler.get_stats('1.1.1.1:80/product')
+        self.assertEquals(0, stats['in_flight'])
+        self.assertEquals(alarms, stats['succeeded'])
+        self.assertTrue(stats['deferred'] > 0)
+        self.assertEquals(alarms, len([at for at in pool.requests
+                                       if at >= pool.down_until]))
@@ -0,0 +1,119 @@
+#
+# Created on 2013-4-10
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+from sentry.common import novaclient_helper
+from sentry.sender import handler
+from sentry.sender import inventory
+from sentry.tests import fake_instance
+from sentry.tests import test
+
+
+CALLED_CHANGES_SINCE = []
+
+
+def _fake_instance(uuid, ip, status='ACTIVE'):
+    instance = fake_instance.FakeInstance(
+                    uuid=uuid, addresses={'private': [{'addr': ip}]})
+    instance.id = uuid
+    instance.status = status
+    return instance
+
+
+def fake_get_all_instances(self, changes_since=None, marker=None,
+                           limit=None):
+    if marker is not None:
+        return []
+    CALLED_CHANGES_SINCE.append(changes_since)
+    if changes_since is None:
+        return [_fake_instance('uuid1', '1.1.1.1'),
+                _fake_instance('uuid2', '1.1.1.2')]
+    return [_fake_instance('uuid1', '1.1.1.1', status='DELETED'),
+            _fake_instance('uuid3', '1.1.1.3')]
+
+
+def fake_get_all_instances_paged(self, changes_since=None, marker=None,
+                                 limit=None):
+    if marker is None:
+        return [_fake_instance('uuid1', '1.1.1.1'),
+                _fake_instance('uuid2', '1.1.1.2')]
+    if marker == 'uuid2':
+        return [_fake_instance('uuid3', '1.1.1.3')]
+    return []
+
+
+def fake_get_instance_by_UUID(self, uuid):
+    return fake_instance.FakeInstance(
+                    addresses={'private': [{'addr': '9.9.9.9'}]})
+
+
+class TestInventory(test.TestCase):
+
+    def setUp(self):
+        super(TestInventory, self).setUp()
+        inventory.reset()
+        handler.reset_instance_ip_cache()
+        del CALLED_CHANGES_SINCE[:]
+        self.stubs.Set(novaclient_helper.CallNovaClient,
+                       "get_all_instances", fake_get_all_instances)
+
+    def tearDown(self):
+        super(TestInventory, self).tearDown()
+        inventory.reset()
+        test.FLAGS.clear_override('enable_instance_inventory')
+        test.FLAGS.clear_override('instance_inventory_page_size')
+
+    def test_full_and_incremental_refresh(self):
+        instance_inventory = inventory.get_inventory()
+        self.assertFalse(instance_inventory.is_ready())
+
+        instance_inventory.refresh()
+        self.assertTrue(instance_inventory.is_ready())
+        self.assertEquals(('1.1.1.1', 'fake_instance_name',
+                           '0000000000000000000000000000001'),
+                          instance_inventory.lookup('uuid1'))
+        self.assertEquals(2, len(instance_inventory))
+
+        # second refresh only fetch changes
+        instance_inventory.refresh()
+        self.assertIsNone(CALLED_CHANGES_SINCE[0])
+        self.assertIsNotNone(CALLED_CHANGES_SINCE[1])
+        self.assertIsNone(instance_inventory.lookup('uuid1'))
+        self.assertEquals('1.1.1.3', instance_inventory.lookup('uuid3')[0])
+        self.assertEquals(2, len(instance_inventory))
+
+    def test_refresh_by_pages(self):
+        self.flags(instance_inventory_page_size=2)
+        self.stubs.Set(novaclient_helper.CallNovaClient,
+                       "get_all_instances", fake_get_all_instances_paged)
+        instance_inventory = inventory.get_inventory()
+        instance_inventory.refresh()
+        self.assertEquals(3, len(instance_inventory))
+
+    def test_refresh_by_pages_capped_by_nova(self):
+        # NOTE(hzyangtk): nova returns 2 instances per page at most.
+        self.flags(instance_inventory_page_size=5)
+        self.stubs.Set(novaclient_helper.CallNovaClient,
+                       "get_all_instances", fake_get_all_instances_paged)
+        instance_inventory = inventory.get_inventory()
+        instance_inventory.refresh()
+        self.assertEquals(3, len(instance_inventory))
+
+    def test_lookup(self):
+        inventory.get_inventory().refresh()
+        # inventory disabled
+        self.assertIsNone(inventory.lookup('uuid1'))
+
+        self.flags(enable_instance_inventory=True)
+        self.assertEquals('1.1.1.2', inventory.lookup('uuid2')[0])
+        self.assertIsNone(inventory.lookup('not_exist'))
+
+    def test_get_instance_ip_fall_back_to_nova(self):
+        self.flags(enable_instance_inventory=True)
+        self.stubs.Set(novaclient_helper.CallNovaClient,
+                       "get_instance_by_UUID", fake_get_instance_by_UUID)
+        inventory.get_inventory().refresh()
+        self.assertEquals('1.1.1.1', handler.get_instance_ip('uuid1'))
+        self.assertEquals('9.9.9.9', handler.get_instance_ip('not_exist'))
@@ -6,7 +6,10 @@
 
 import copy
 
+import eventlet
+
 from sentry.file_cache import alarm_content as alarm_content_list
+from sentry.sender import dedup
 from sentry.sender import handler
 from sentry.sender import http_sender
 from sentry.sender import manager
@@ -87,16 +90,15 @@ def fake_get_instance_ip(instance_uuid):
 
 
 def fake_set_alarm_timestamp(message):
-    return 'test_timestamp'
+    message['timestamp'] = 'test_timestamp'
+    return message
 
 
 def fake_get_alarm_content():
     return {'alarm_summary_content': 'test',
-            'alarm_content': 'test'}
-
-
-def fake_is_instance_down(message, content):
-    return True
+            'alarm_content': 'test',
+            'alarm_event_type': {
+                'InstanceOffLine': ['compute.instance.delete.end']}}
 
 
 def fake_format_instance_offline(message, summary, content):
@@ -108,11 +110,13 @@ class TestManager(test.TestCase):
     def setUp(self):
         super(TestManager, self).setUp()
         self.stubs.Set(handler, "get_instance_ip", fake_get_instance_ip)
+        dedup.reset()
 
     def tearDown(self):
         super(TestManager, self).setUp()
         global TEMP_RESULT
         TEMP_RESULT = None
+        test.FLAGS.clear_override('alarm_dedup_window')
 
     def test_send_alarm(self):
         self.flags(platform_project_id_list=['000000002'])
@@ -140,6 +144,22 @@ class TestManager(test.TestCase):
         result = manager.send_alarm(message)
         self.assertIsNone(result)
 
+    def test_send_alarm_dedup(self):
+        global TEMP_RESULT
+        self.flags(alarm_dedup_window=60)
+        self.stubs.Set(eventlet, "spawn_after", lambda *args: None)
+        self.stubs.Set(manager, "_data_formater", fake_data_formater)
+        self.stubs.Set(http_sender, "product_send_alarm",
+                       fake_product_send_alarm)
+        manager.send_alarm(fake_message)
+        self.assertEquals('product', TEMP_RESULT.get('owner'))
+
+        TEMP_RESULT = None
+        manager.send_alarm(fake_message)
+        self.assertIsNone(TEMP_RESULT)
+        self.assertEquals(1,
+                dedup.get_deduplicator().get_stats()['suppressed'])
+
     def test_format_instance_offline(self):
         expect_result = {
             'projectId': '0000000000000000000000000000001',
@@ -266,10 +286,17 @@ class TestManager(test.TestCase):
                        fake_set_alarm_timestamp)
         self.stubs.Set(alarm_content_list, "get_alarm_content",
                        fake_get_alarm_content)
-        self.stubs.Set(handler, "is_instance_down",
-                       fake_is_instance_down)
         self.stubs.Set(manager, "_format_instance_offline",
                        fake_format_instance_offline)
 
-        result = manager._data_formater(fake_message)
+        result = manager._data_formater(copy.deepcopy(fake_message))
         self.assertEquals({'test': 'test'}, result)
+
+    def test_data_formater_skip(self):
+        self.stubs.Set(handler, "set_alarm_timestamp",
+                       fake_set_alarm_timestamp)
+        self.stubs.Set(alarm_content_list, "get_alarm_content",
+                       fake_get_alarm_content)
+        message = copy.deepcopy(fake_message)
+        message['event_type'] = 'compute.instance.create.end'
+        self.assertIsNone(manager._data_formater(message))
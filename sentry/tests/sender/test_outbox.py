@@ -0,0 +1,192 @@
+#
+# Created on 2013-4-22
+#
+# @author: hzyangtk@corp.netease.com
+#
+
+import os
+import shutil
+import tempfile
+
+import eventlet
+
+from sentry.sender import outbox
+from sentry.tests import test
+
+
+def fake_spawn_after(seconds, func, *args, **kwargs):
+    pass
+
+
+def _make_record(index):
+    return {'request_uri': '/product', 'params': 'identifier=%d' % index}
+
+
+class TestOutbox(test.TestCase):
+
+    def setUp(self):
+        super(TestOutbox, self).setUp()
+        self.stubs.Set(eventlet, 'spawn_after', fake_spawn_after)
+        self.path = tempfile.mkdtemp()
+        self.delivered = []
+        self.fail_at = None
+
+    def tearDown(self):
+        super(TestOutbox, self).tearDown()
+        outbox.reset()
+        test.FLAGS.clear_override('alarm_outbox_dir')
+        shutil.rmtree(self.path)
+
+    def _deliver(self, record):
+        if record['params'] == self.fail_at:
+            return False
+        self.delivered.append(record['params'])
+        return True
+
+    def _open(self, **kwargs):
+        kwargs.setdefault('segment_size', 100)
+        kwargs.setdefault('max_size', 10000)
+        return outbox.Outbox(self.path, **kwargs)
+
+    def _segments(self):
+        return [name for name in os.listdir(self.path)
+                if name.endswith(outbox.SEGMENT_SUFFIX)]
+
+    def test_append_and_drain_in_order(self):
+        spool = self._open()
+        for index in range(10):
+            self.assertTrue(spool.append(_make_record(index)))
+        self.assertEquals(10, spool.get_depth())
+        self.assertTrue(len(self._segments()) > 1)
+
+        self.assertEquals(10, spool.drain(self._deliver))
+        self.assertEquals(['identifier=%d' % index for index in range(10)],
+                          self.delivered)
+        self.assertEquals(0, spool.get_depth())
+        self.assertEquals(1, len(self._segments()))
+
+    def test_drain_stops_at_failure(self):
+        spool = self._open()
+        for index in range(5):
+            spool.append(_make_record(index))
+
+        self.fail_at = 'identifier=2'
+        self.assertEquals(2, spool.drain(self._deliver))
+        self.assertEquals(3, spool.get_depth())
+
+        self.fail_at = None
+        self.assertEquals(3, spool.drain(self._deliver))
+        self.assertEquals(['identifier=%d' % index for index in range(5)],
+                          self.delivered)
+
+    def test_reopen_keeps_cursor(self):
+        spool = self._open()
+        for index in range(5):
+            spool.append(_make_record(index))
+        self.fail_at = 'identifier=3'
+        spool.drain(self._deliver)
+        spool.stop()
+
+        spool = self._open()
+        self.assertEquals(2, spool.get_depth())
+        spool.append(_make_record(5))
+        self.fail_at = None
+        del self.delivered[:]
+        self.assertEquals(3, spool.drain(self._deliver))
+        self.assertEquals(['identifier=3', 'identifier=4', 'identifier=5'],
+                          self.delivered)
+
+    def test_cursor_synced_before_rename(self):
+        synced = []
+        self.stubs.Set(os, 'fsync', lambda fd: synced.append(fd))
+        spool = self._open()
+        spool.append(_make_record(0))
+        spool.drain(self._deliver)
+        self.assertTrue(synced)
+        self.assertEquals(0, self._open().get_depth())
+
+    def test_skip_cut_record(self):
+        spool = self._open(segment_size=10000)
+        spool.append(_make_record(0))
+        spool.stop()
+        with open(os.path.join(self.path, self._segments()[0]), 'a') as seg:
+            seg.write('{"request_uri": "/prod')
+
+        spool = self._open()
+        self.assertEquals(1, spool.get_depth())
+        spool.append(_make_record(1))
+        self.assertEquals(2, spool.drain(self._deliver))
+        self.assertEquals(['identifier=0', 'identifier=1'], self.delivered)
+
+    def test_drop_oldest(self):
+        spool = self._open(max_size=300)
+        for index in range(20):
+            self.assertTrue(spool.append(_make_record(index)))
+        stats = spool.get_stats()
+        self.assertTrue(stats['size'] <= 300)
+        self.assertTrue(stats['dropped'] > 0)
+        self.assertEquals(20 - stats['dropped'], stats['depth'])
+
+        spool.drain(self._deliver)
+        self.assertEquals(stats['depth'], len(self.delivered))
+        self.assertEquals('identifier=19', self.delivered[-1])
+
+    def test_drop_newest(self):
+        spool = self._open(max_size=300, drop_policy='newest')
+        results = [spool.append(_make_record(index)) for index in range(20)]
+        self.assertTrue(results[0])
+        self.assertFalse(results[-1])
+        self.assertTrue(spool.get_stats()['size'] <= 300)
+
+        spool.drain(self._deliver)
+        self.assertEquals('identifier=0', self.delivered[0])
+
+    def test_init_outbox_disabled(self):
+        outbox.reset()
+        self.assertIsNone(outbox.init_outbox())
+        self.assertIsNone(outbox.get_outbox())
+        self.assertIsNone(outbox.get_stats())
+
+    def test_drop_while_draining(self):
+        spool = self._open(max_size=300)
+        for index in range(10):
+            spool.append(_make_record(index))
+        appended = [10]
+
+        def _deliver_and_append(record):
+            # NOTE(hzyangtk): new alarms spooled while replaying push
+            #                 the outbox over its max size.
+            if appended[0] < 30:
+                spool.append(_make_record(appended[0]))
+                appended[0] += 1
+            return self._deliver(record)
+
+        spool.drain(_deliver_and_append)
+        stats = spool.get_stats()
+        self.assertTrue(stats['dropped'] > 0)
+        self.assertEquals(appended[0], stats['appended'])
+        self.assertEquals(stats['appended'],
+                          stats['replayed'] + stats['dropped'] +
+                          stats['depth'])
+        self.assertEquals(len(self.delivered), stats['replayed'])
+        self.assertEquals(len(set(self.delivered)), len(self.delivered))
+
+    def test_first_worker_adopts_removed_workers(self):
+        self.flags(alarm_outbox_dir=self.path)
+        for index in (1, 3):
+            orphan = outbox.Outbox(os.path.join(self.path, str(index)))
+            orphan.append(_make_record(index))
+            orphan.stop()
+        outbox.reset()
+        spool = outbox.init_outbox(1, 2)
+        self.assertEquals(1, spool.get_depth())
+        self.assertTrue(os.path.isdir(os.path.join(self.path, '3')))
+
+        outbox.reset()
+        spool = outbox.init_outbox(0, 2)
+        self.assertEquals(1, spool.get_depth())
+        self.assertEquals(1, outbox.get_stats()['depth'])
+        spool.drain(self._deliver)
+        self.assertFalse(os.path.exists(os.path.join(self.path, '3')))
+        self.assertEquals(['identifier=3'], self.delivered)
+        self.assertEquals(['0', '1'], sorted(os.listdir(self.path)))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmark of notification timestamp conversion in
+sentry.sender.handler.set_alarm_timestamp, old path against
+utils.utc_strtime_to_timestamp. Results of both are compared in a few
+timezones with DST first.
+
+Usage: python tools/bench_timestamp.py [loops]
+"""
+
+import os
+import sys
+import time
+import timeit
+
+from dateutil import tz
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'sentry', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from sentry.common import utils
+
+
+TIMESTAMPS = ['2012-03-27 15:51:11.123456',
+              '2013-03-10 06:59:59.000001',
+              '2013-03-10 07:00:00.5',
+              '2013-11-03 05:30:00.123',
+              '2013-11-03 06:30:00.123',
+              '2016-02-29 23:59:59.999999']
+TIMEZONES = ['UTC', 'Asia/Shanghai', 'America/New_York', 'Europe/London']
+
+
+def old_path(timestr):
+    utc = utils.parse_strtime(timestr, utils.NOTIFICATION_TIME_FORMAT)
+    local = utc.replace(tzinfo=tz.tzutc()).astimezone(tz.tzlocal())
+    return utils.datetime_to_timestamp(local)
+
+
+def check():
+    for zone in TIMEZONES:
+        os.environ['TZ'] = zone
+        time.tzset()
+        for timestr in TIMESTAMPS:
+            old = old_path(timestr)
+            new = utils.utc_strtime_to_timestamp(timestr)
+            if old != new:
+                print 'MISMATCH %s %s: %s != %s' % (zone, timestr, old, new)
+                return False
+    return True
+
+
+def main():
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    if not check():
+        sys.exit(1)
+    print 'results match in %s' % ', '.join(TIMEZONES)
+
+    timestr = TIMESTAMPS[0]
+    for name, func in [('old path', old_path),
+                       ('fast parser', utils.utc_strtime_to_timestamp)]:
+        seconds = min(timeit.repeat(lambda: func(timestr), number=loops,
+                                    repeat=3))
+        print '%-12s %8.2f us/call' % (name, seconds / loops * 1000000)
+
+
+if __name__ == '__main__':
+    main()